@@ -1,27 +1,60 @@
+import os
+import threading
 from flask import Flask
-from urllib.parse import quote
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
-import cloudinary
 from unidecode import unidecode
+from app.routing import RoutingSession
+from app.config import PROFILES
 
 
 app = Flask(__name__)
-app.secret_key = "KJGHJG^&*%&*^T&*(IGFG%ERFTGHCFHGFasdasIU"
-app.config["SQLALCHEMY_DATABASE_URI"] = "mysql+pymysql://root:%s@localhost/flightdb?charset=utf8mb4" % quote('admin123')
-app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = True
-app.config["PAGE_SIZE"] = 3
+# Các extension được tạo không gắn app; create_app() nạp cấu hình rồi mới khởi tạo (import package không mở gì cả)
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+login = LoginManager()
+_configured = None
+_lock = threading.Lock()
 
-db = SQLAlchemy(app)
-login = LoginManager(app)
 
+def configure(profile=None):
+    # Cấu hình + database + đăng nhập, chưa đăng ký route: đủ cho script chỉ cần model (models.py, script seed).
+    # `app` là singleton của package: chỉ lần gọi đầu tiên nạp cấu hình, các lần sau trả về cùng app đó.
+    # Gọi lại không kèm profile (hoặc cùng profile) là hợp lệ; xin một profile khác thì báo lỗi thay vì lặng lẽ bỏ qua
+    global _configured
+    with _lock:
+        if _configured is not None:
+            if profile is not None and profile != _configured:
+                raise RuntimeError(f"App is already configured with the {_configured!r} profile; "
+                                   f"cannot switch to {profile!r} in the same process")
+            return app
+        profile = profile or os.environ.get('APP_ENV', 'development')
+        if profile not in PROFILES:
+            raise RuntimeError(f"Unknown APP_ENV profile {profile!r}; expected one of {', '.join(PROFILES)}")
+        app.config.from_object(PROFILES[profile])
+        app.config.from_prefixed_env()
+        if not app.config['SECRET_KEY']:
+            raise RuntimeError(f"SECRET_KEY must be set for the {profile} profile")
+        app.config['APP_ENV'] = profile
+        db.init_app(app)
+        login.init_app(app)
+        _configured = profile
+    return app
+
+
+def create_app(profile=None):
+    # Gọi nhiều lần vẫn trả về cùng một app (xem configure: profile khác lần đầu thì báo lỗi)
+    configure(profile)
+    from app import index  # đăng ký route, CLI command, hook của request
+    init_admin()
+    return app
+
+
+def init_admin():
+    # Blueprint phải được đăng ký trước request đầu tiên nên admin gắn vào app ngay khi tạo app (nếu bật)
+    if app.config['ADMIN_ENABLED'] and 'admin' not in app.blueprints:
+        from app import admin
+        admin.admin.init_app(app)
 
-cloudinary.config(
-    cloud_name="dd1frsvzk",
-    api_key="172266497937733",
-    api_secret="W_FvA2NSah3Jlv8cxhubvnw2mVM",  # Click 'View API Keys' above to copy your API secret
-    secure=True
-)
 
 @app.template_filter('intcomma')
 def intcomma_filter(value):
@@ -1,33 +1,155 @@
-from app import db, app, dao
+import threading
+from app import db, app, dao, itinerary, refdata, identity, seatmap, sqlstats, avatars, exports, timetable, analytics
 from flask_admin import Admin
 from flask_admin.contrib.sqla import ModelView
-from app.models import User, UserRole, Company, Flight, FlightRoute, Airport, Plane, Ticket, Luggage, Cancellation, Payment, Seat, FlightSchedule, IntermediateAirport
+from app.models import User, UserRole, Company, Flight, FlightRoute, Airport, Plane, Ticket, Luggage, Cancellation, Payment, Seat, FlightSchedule, IntermediateAirport, \
+    TimetableImport
 from flask_login import current_user, logout_user
 from flask_admin import BaseView, expose, AdminIndexView
-from flask import redirect, render_template, url_for
+from flask import redirect, render_template, url_for, flash, request, Response, stream_with_context, jsonify
+from werkzeug.utils import secure_filename
+from flask_admin.actions import action
+from wtforms import PasswordField, ValidationError
+
+_scaffold_lock = threading.Lock()
 
 
 class AdminView(ModelView):
+    export_types = exports.export_types()
+
+    # Form, cột, bộ lọc của ModelView (_refresh_cache) tốn phần lớn thời gian import admin: dựng ở lần đầu trang được
+    # mở thay vì lúc khởi động, để worker / lệnh CLI không trả chi phí cho những trang không ai dùng
+    def _refresh_cache(self):
+        self._scaffolded = False
+
+    def scaffold_auto_joins(self):
+        # Cần danh sách cột (_list_columns) nên cũng dời tới scaffold()
+        return ModelView.scaffold_auto_joins(self) if self._scaffolded else []
+
+    def scaffold(self):
+        if not self._scaffolded:
+            with _scaffold_lock:
+                if not self._scaffolded:
+                    ModelView._refresh_cache(self)
+                    if not self.column_select_related_list:
+                        self._auto_joins = ModelView.scaffold_auto_joins(self)
+                    self._scaffolded = True
+
+    def _handle_view(self, name, **kwargs):
+        self.scaffold()
+        return super()._handle_view(name, **kwargs)
+
     def is_accessible(self):
-        return current_user.is_authenticated and current_user.user_role.__eq__(UserRole.ADMIN)
+        return current_user.is_authenticated and current_user.user_role == UserRole.ADMIN
+
+    # Xuất file dạng stream: đọc theo lô bằng yield_per thay vì nạp toàn bộ kết quả như ModelView._export_data
+    def _export_query(self):
+        view_args = self._get_list_extra_args()
+        sort_column = self._get_column_by_idx(view_args.sort)
+        _, query = self.get_list(0, sort_column[0] if sort_column else None, view_args.sort_desc,
+                                 view_args.search, view_args.filters, execute=False,
+                                 page_size=self.export_max_rows)
+        return query
+
+    def _export_stream(self, export_type):
+        disposition = 'attachment;filename=%s' % secure_filename(self.get_export_name(export_type))
+        return Response(stream_with_context(exports.generate(self, self._export_query(), export_type)),
+                        headers={'Content-Disposition': disposition}, mimetype=exports.MIMETYPES[export_type])
+
+    def _export_csv(self, return_url):
+        return self._export_stream('csv')
+
+    def _export_tablib(self, export_type, return_url):
+        return self._export_stream(export_type)
+
+# Airport, Company, Plane, FlightRoute: mọi thay đổi làm mới snapshot dữ liệu gốc của tất cả worker
+class RefDataAdminView(AdminView):
+    def after_model_change(self, form, model, is_created):
+        refdata.invalidate()
+
+    def after_model_delete(self, model):
+        refdata.invalidate()
 
 class AuthenticatedView(BaseView):
     def is_accessible(self):
         return current_user.is_authenticated
                 # and current_user.user_role == UserRole.ADMIN)
 
+# Trang vận hành và thống kê (câu SQL, pool kết nối, hàng đợi, nhập lịch bay, doanh thu): chỉ tài khoản ADMIN
+class AdminOnlyView(BaseView):
+    def is_accessible(self):
+        return current_user.is_authenticated and current_user.user_role == UserRole.ADMIN
+
 class MyAdminIndexView(AdminIndexView):
     @expose('/')
     def index(self):
-        print(dao.ticket_stats())
         return self.render('admin/index.html', stats=dao.ticket_stats())
 
-class StatsView(AuthenticatedView):
+class StatsView(AdminOnlyView):
     @expose('/')
     def index(self):
         return self.render('admin/stats.html', stats=dao.get_flight_statistics(), stats2=dao.get_tiket_statistics())
 
-admin = Admin(app=app, name='eCommerce Admin', template_mode='bootstrap4', index_view=MyAdminIndexView())
+    # Dữ liệu cho biểu đồ phân tích: ?group_by=route,month&seat_class=BUSINESS&airline=1,2&sort=revenue&limit=20
+    @expose('/api/cube')
+    def cube(self):
+        group_by = [d for d in request.args.get('group_by', '').split(',') if d]
+        unknown = [d for d in group_by if d not in analytics.DIMENSIONS]
+        sort = request.args.get('sort', 'revenue')
+        if unknown or len(set(group_by)) != len(group_by) or sort not in ('revenue', 'tickets', 'key'):
+            return jsonify({'error': 'group_by must use distinct dimensions of: ' + ', '.join(analytics.DIMENSIONS)
+                                     + '; sort must be revenue, tickets or key'}), 400
+        try:
+            filters = {}
+            for name in analytics.DIMENSIONS:
+                values = [v for v in request.args.get(name, '').split(',') if v]
+                if values:
+                    filters[name] = {int(v) for v in values} if name in ('route', 'airline') else set(values)
+            limit = min(int(request.args.get('limit', 100)), 1000)
+        except ValueError as ex:
+            return jsonify({'error': str(ex)}), 400
+
+        cube = analytics.get_cube()
+        return jsonify({'rows': cube.query(group_by, filters, sort, limit), 'facts': cube.size(),
+                        'loaded_at': cube.loaded_at})
+
+class SqlStatsView(AdminOnlyView):
+    @expose('/')
+    def index(self):
+        return self.render('admin/sqlstats.html', endpoints=sqlstats.endpoint_stats(),
+                           slowest=sqlstats.slowest_requests(), pools=sqlstats.pool_metrics())
+
+class AvatarQueueView(AdminOnlyView):
+    @expose('/')
+    def index(self):
+        return self.render('admin/avatars.html', metrics=avatars.metrics())
+
+class TimetableImportView(AdminOnlyView):
+    @expose('/', methods=['GET', 'POST'])
+    def index(self):
+        if request.method == 'POST':
+            file = request.files.get('timetable')
+            if not file or not file.filename:
+                flash('Chọn file lịch bay (CSV)', 'error')
+            else:
+                try:
+                    if timetable.start(file.read().decode('utf-8-sig'), filename=file.filename).status == 'done':
+                        flash(f"{file.filename} đã được nhập trước đó", 'success')
+                    else:
+                        flash(f"Đang nhập {file.filename} ở nền, tải lại trang để xem tiến độ", 'success')
+                except timetable.TimetableBusyError:
+                    flash(f"{file.filename} đang được nhập", 'error')
+                except timetable.TimetableError as ex:
+                    for error in ex.errors:
+                        flash(error, 'error')
+                except UnicodeDecodeError:
+                    flash('File phải được mã hoá UTF-8', 'error')
+            return redirect(url_for('.index'))
+        imports = TimetableImport.query.order_by(TimetableImport.import_id.desc()).limit(20).all()
+        return self.render('admin/timetable.html', imports=imports)
+
+# Gắn vào app trong create_app() (khi ADMIN_ENABLED)
+admin = Admin(name='eCommerce Admin', template_mode='bootstrap4', index_view=MyAdminIndexView())
 
 
 
@@ -36,11 +158,22 @@ class FlightAdminView(AdminView):
     can_view_details = True
     column_searchable_list = ['flight_id', 'flight_price']
     column_filters = ['flight_id', 'flight_price', 'flight_route_id']
-    column_list = ['flight_id', 'flight_route_id', 'f_dept_time', 'flight_arr_time', 'flight_duration', 'flight_price']
-    form_columns = ['f_dept_time', 'flight_arr_time', 'flight_duration', 'flight_price', 'flight_route_id']
+    column_list = ['flight_id', 'flight_route_id', 'f_dept_time', 'flight_arr_time', 'flight_duration', 'base_price',
+                   'flight_price']
+    form_columns = ['f_dept_time', 'flight_arr_time', 'flight_duration', 'base_price', 'flight_price', 'flight_route_id']
+    column_descriptions = {'base_price': 'Giá gốc dùng để tính giá động', 'flight_price': 'Giá hiện tại (giá động)'}
+
+    def after_model_change(self, form, model, is_created):
+        itinerary.flight_changed(model)
+        if is_created:
+            dao.invalidate_flight_count()
 
+    def after_model_delete(self, model):
+        itinerary.flight_deleted(model.flight_id)
+        dao.invalidate_flight_count()
 
-class FlightRouteAdminView(AdminView):
+
+class FlightRouteAdminView(RefDataAdminView):
     can_export = True
     column_searchable_list = ['fr_id']
     column_filters = ['fr_id']
@@ -52,12 +185,33 @@ class FlightRouteAdminView(AdminView):
 class TicketAdminView(AdminView):
     can_export = True
     column_searchable_list = ['ticket_id']
-    column_filters = ['ticket_id']
+    column_filters = ['ticket_id', 'issue_date', 'ticket_status', 'flight_id']
     can_view_details = True
 
     column_list = ['ticket_id', 'issue_date', 'ticket_price', 'ticket_status', 'ticket_gate', 'user_id', 'flight_id' ]
     form_columns = ['issue_date', 'ticket_price', 'ticket_status', 'ticket_gate', 'user_id', 'flight_id' ]
 
+class UserAdminView(AdminView):
+    column_searchable_list = ['username', 'name', 'email']
+    column_filters = ['user_role']
+    column_list = ['id', 'name', 'username', 'email', 'user_role']
+    form_columns = ['name', 'username', 'new_password', 'email', 'dob', 'gender', 'avatar', 'user_role']
+    # Mật khẩu nhập dạng rõ rồi băm như dao.add_user; bắt buộc khi tạo, để trống khi sửa thì giữ mật khẩu cũ
+    form_extra_fields = {'new_password': PasswordField('Password')}
+
+    def on_model_change(self, form, model, is_created):
+        if form.new_password.data:
+            model.password = dao.hash_password(form.new_password.data)
+        elif is_created:
+            raise ValidationError('Password is required')
+
+    def after_model_change(self, form, model, is_created):
+        if not is_created:
+            identity.invalidate(model.id)
+
+    def after_model_delete(self, model):
+        identity.invalidate(model.id)
+
 class LuggageAdminView(AdminView):
     column_list = ['luggage_id',  'luggage_name', 'weight', 'user_id', 'flight_id']
     form_columns = ['luggage_name', 'weight', 'user_id', 'flight_id']
@@ -67,8 +221,22 @@ class FlightScheduleAdminView(AdminView):
     form_columns = ['flight_id', 'user_id']
 
 
-class PlaneAdminView(AdminView):
-    column_list = ['plane_id', 'plane_name']
+class PlaneAdminView(RefDataAdminView):
+    column_list = ['plane_id', 'plane_name', 'total_seat', 'seat_layout']
+    form_choices = {'seat_layout': [(layout, layout) for layout in sorted(seatmap.SEAT_LAYOUTS)]}
+
+    def after_model_change(self, form, model, is_created):
+        # Máy bay mới có sơ đồ ghế thì tạo luôn toàn bộ ghế
+        if is_created and model.seat_layout:
+            seatmap.generate_seats(plane_ids=[model.plane_id])
+        super().after_model_change(form, model, is_created)
+
+    @action('generate_seats', 'Tạo sơ đồ ghế', 'Tạo / cập nhật ghế của các máy bay đã chọn theo sơ đồ ghế?')
+    def action_generate_seats(self, ids):
+        stats = seatmap.generate_seats(plane_ids=[int(i) for i in ids])
+        flash(f"{stats.get('planes', 0)} máy bay: thêm {stats.get('inserted', 0)} ghế, "
+              f"cập nhật {stats.get('updated', 0)}, xoá {stats.get('deleted', 0)}, "
+              f"{stats.get('skipped', 0)} máy bay chưa có sơ đồ ghế.")
 
 class IntermediateAirportAdminView(AdminView):
     column_list = ['intermediate_id', 'flight_id', 'airport_id', 'stopover_duration', 'stop_order']
@@ -100,15 +268,25 @@ admin.add_view(HomeRedirectView(name = 'Home page buy tickets'))
 admin.add_view(FlightAdminView(Flight, db.session))
 admin.add_view(FlightRouteAdminView(FlightRoute, db.session))
 admin.add_view(PlaneAdminView(Plane, db.session))
-admin.add_view(AdminView(Airport, db.session))
+admin.add_view(RefDataAdminView(Airport, db.session))
+admin.add_view(UserAdminView(User, db.session))
 admin.add_view(TicketAdminView(Ticket, db.session))
 admin.add_view(LuggageAdminView(Luggage, db.session))
 admin.add_view(AdminView(Cancellation, db.session))
 admin.add_view(AdminView(Payment, db.session))
 admin.add_view(AdminView(Seat, db.session))
 admin.add_view(FlightScheduleAdminView(FlightSchedule, db.session))
-admin.add_view(AdminView(Company, db.session))
+admin.add_view(RefDataAdminView(Company, db.session))
 admin.add_view(IntermediateAirportAdminView(IntermediateAirport, db.session))
 admin.add_view(StatsView(name = 'Stats'))
+admin.add_view(SqlStatsView(name = 'SQL'))
+admin.add_view(AvatarQueueView(name = 'Avatar queue'))
+admin.add_view(TimetableImportView(name = 'Timetable import'))
 admin.add_view(LogoutView(name = 'Logout'))
 
+
+def scaffold_all():
+    # Dựng trước mọi trang quản trị, dùng ở tiến trình cha trước khi fork (các worker dùng chung bộ nhớ đã dựng)
+    for view in admin._views:
+        if isinstance(view, AdminView):
+            view.scaffold()
@@ -0,0 +1,325 @@
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+from sqlalchemy import select, insert, delete, extract, event, inspect, type_coerce, literal, func, String, DateTime
+from app import db, refdata, routing
+from app.models import Ticket, Flight, Seat, SeatClass, TicketChange
+
+# Khối phân tích vé trong bộ nhớ: mỗi vé đã bán (ticket_status = True) là một dòng, lưu theo cột NumPy.
+# Các chiều được mã hoá từ điển (mã int nhỏ liền nhau) nên group by chỉ là bincount trên khoá ghép của các mã:
+#   route       tuyến bay (fr_id)
+#   month       tháng xuất vé 'YYYY-MM'
+#   seat_class  ECONOMY / BUSINESS
+#   airline     hãng bay (com_id), suy ra từ máy bay của chuyến bay theo snapshot refdata lúc truy vấn
+#   channel     'counter' (bán tại quầy, có CustomerInfo) / 'online'
+DIMENSIONS = ('route', 'month', 'seat_class', 'airline', 'channel')
+CHANNELS = ('online', 'counter')
+SEAT_CLASSES = list(SeatClass)
+SEAT_CLASS_CODES = {c.name: i for i, c in enumerate(SEAT_CLASSES)}
+
+CACHE_NAME = 'ticket_facts'
+# Cứ REFRESH_SECONDS giây đọc thêm các vé mới (ticket_id lớn hơn vé cuối đã nạp) và nạp lại các vé có trong nhật ký
+# TicketChange (vé / chuyến bay / ghế bị sửa hoặc xoá); chỉ khi ghi hàng loạt (invalidate) mọi worker mới nạp lại từ đầu
+REFRESH_SECONDS = 30
+LOAD_BATCH = 50000
+# Id tự tăng có thể được commit không theo thứ tự: mỗi lần làm mới đọc lại REFETCH_IDS id cuối và bỏ vé đã có
+REFETCH_IDS = 1000
+# Số ticket_id trong một câu IN khi nạp lại các vé bị thay đổi
+CHANGE_BATCH = 1000
+# Nhật ký thay đổi được giữ chừng này; worker không làm mới lâu hơn thì nạp lại từ đầu (purge-ticket-changes xoá dòng cũ)
+CHANGE_RETENTION = timedelta(days=1)
+# Số ô tối đa của khoá ghép để đếm thẳng bằng bincount; lớn hơn thì gom bằng np.unique
+BINCOUNT_LIMIT = 4000000
+
+# NumPy chỉ được nạp khi dựng khối lần đầu (mọi phép tính đều đi qua Cube), không phải lúc khởi động app
+np = None
+
+
+def _load_numpy():
+    global np
+    if np is None:
+        import numpy
+        np = numpy
+
+
+Facts = namedtuple('Facts', ['ticket_id', 'route', 'month', 'seat_class', 'plane', 'channel', 'revenue'])
+
+
+class _Dictionary:
+    # Giá trị -> mã liền nhau theo thứ tự xuất hiện; chỉ thêm, không đổi mã đã cấp
+    def __init__(self):
+        self.values = []
+        self.codes = {}
+
+    def encode(self, raw):
+        unique, inverse = np.unique(raw, return_inverse=True)
+        for value in unique.tolist():
+            if value not in self.codes:
+                self.codes[value] = len(self.values)
+                self.values.append(value)
+        return np.array([self.codes[v] for v in unique.tolist()], dtype=np.int32)[inverse]
+
+
+def _month_label(index):
+    return f"{index // 12}-{index % 12 + 1:02d}"
+
+
+def _empty_facts():
+    return Facts(np.empty(0, np.int64), np.empty(0, np.int32), np.empty(0, np.int32), np.empty(0, np.int8),
+                 np.empty(0, np.int32), np.empty(0, np.int8), np.empty(0))
+
+
+class Cube:
+    def __init__(self, version):
+        _load_numpy()
+        self.version = version
+        self.facts = _empty_facts()
+        self.last_ticket_id = 0
+        self.last_change_id = 0
+        self.applied_changes = np.empty(0, np.int64)
+        self.loaded_at = None
+        self.dictionaries = {'route': _Dictionary(), 'month': _Dictionary(), 'plane': _Dictionary()}
+
+    def _connect(self, statement):
+        # Connection riêng trên bind do RoutingSession chọn (replica nếu có)
+        with routing.use_replica():
+            engine = db.session.get_bind(clause=statement)
+        return engine.connect()
+
+    def _fetch(self, *conditions):
+        # Đọc bằng Core: không dựng Row của ORM và đọc hạng ghế dạng chuỗi thô, nhanh hơn vài lần khi nạp hàng triệu vé
+        statement = select(
+            Ticket.ticket_id, Flight.flight_route_id,
+            extract('year', Ticket.issue_date) * 12 + extract('month', Ticket.issue_date) - 1,
+            type_coerce(Seat.seat_class, String), Flight.plane_id, Ticket.customer_id.isnot(None),
+            Ticket.ticket_price
+        ).join(
+            Flight, Flight.flight_id == Ticket.flight_id
+        ).join(
+            Seat, Seat.seat_id == Ticket.seat_id
+        ).where(
+            Ticket.ticket_status == True, *conditions
+        ).order_by(Ticket.ticket_id)
+        with self._connect(statement) as conn:
+            result = conn.execution_options(yield_per=LOAD_BATCH).execute(statement)
+            for batch in result.partitions():
+                yield batch
+
+    def _facts(self, batch, loaded):
+        # Mã hoá một lô dòng đọc từ DB thành cột NumPy, bỏ các vé đã có trong `loaded`
+        ids, routes, months, classes, planes, channels, prices = zip(*batch)
+        ids = np.array(ids, dtype=np.int64)
+        new = ~np.isin(ids, loaded)
+        if not new.any():
+            return None
+        classes = np.array([SEAT_CLASS_CODES[c] for c in classes], dtype=np.int8)
+        return Facts(
+            ids[new],
+            self.dictionaries['route'].encode(np.array(routes)[new]),
+            self.dictionaries['month'].encode(np.array(months, dtype=np.int64)[new]),
+            classes[new],
+            self.dictionaries['plane'].encode(np.array(planes)[new]),
+            np.array(channels, dtype=np.int8)[new],
+            np.array(prices, dtype=float)[new])
+
+    def _changed_ticket_ids(self):
+        # Các vé trong nhật ký thay đổi chưa áp dụng; cũng đọc lại REFETCH_IDS id cuối và bỏ dòng đã áp dụng
+        if self.loaded_at is None:
+            # Khối mới nạp từ đầu đã thấy mọi thay đổi trước đó
+            statement = select(func.max(TicketChange.change_id))
+            with self._connect(statement) as conn:
+                self.last_change_id = conn.execute(statement).scalar() or 0
+        after_id = max(0, self.last_change_id - REFETCH_IDS)
+        statement = select(TicketChange.change_id, TicketChange.ticket_id).where(TicketChange.change_id > after_id)
+        with self._connect(statement) as conn:
+            rows = conn.execute(statement).all()
+        change_ids = np.array([row[0] for row in rows], dtype=np.int64)
+        ticket_ids = np.array([row[1] for row in rows], dtype=np.int64)
+        new = ~np.isin(change_ids, self.applied_changes)
+        self.applied_changes = change_ids
+        if len(change_ids):
+            self.last_change_id = max(self.last_change_id, int(change_ids.max()))
+        return np.unique(ticket_ids[new]) if self.loaded_at is not None else ticket_ids[:0]
+
+    def refresh(self):
+        # Bỏ các vé bị thay đổi rồi đọc lại chúng cùng các vé mới; các cột mới được gán một lần (Facts)
+        # nên luồng đang truy vấn không thấy dữ liệu dở dang
+        facts = self.facts
+        changed = self._changed_ticket_ids()
+        if len(changed):
+            facts = Facts(*[column[~np.isin(facts.ticket_id, changed)] for column in facts])
+        after_id = max(0, self.last_ticket_id - REFETCH_IDS) if len(facts.ticket_id) else 0
+        loaded = facts.ticket_id[facts.ticket_id > after_id]
+        batches = list(self._fetch(Ticket.ticket_id > after_id))
+        # Vé bị thay đổi có id lớn hơn after_id đã được đọc lại ở trên
+        old = changed[changed <= after_id].tolist()
+        for start in range(0, len(old), CHANGE_BATCH):
+            batches.extend(self._fetch(Ticket.ticket_id.in_(old[start:start + CHANGE_BATCH])))
+        chunks = [chunk for chunk in (self._facts(batch, loaded) for batch in batches) if chunk is not None]
+
+        if chunks or len(changed):
+            self.facts = Facts(*[np.concatenate([getattr(facts, f)] + [getattr(c, f) for c in chunks])
+                                 for f in Facts._fields])
+            if len(self.facts.ticket_id):
+                self.last_ticket_id = max(self.last_ticket_id, int(self.facts.ticket_id.max()))
+        self.loaded_at = time.time()
+        return sum(len(c.ticket_id) for c in chunks)
+
+    def _dimension(self, facts, name, ref):
+        # (mã của từng dòng, giá trị của từng mã, nhãn hiển thị của từng mã)
+        if name == 'route':
+            values = list(self.dictionaries['route'].values)
+            return facts.route, values, [_route_label(ref, fr_id) for fr_id in values]
+        if name == 'month':
+            values = [_month_label(m) for m in self.dictionaries['month'].values]
+            return facts.month, values, values
+        if name == 'seat_class':
+            values = [c.name for c in SEAT_CLASSES]
+            return facts.seat_class, values, values
+        if name == 'channel':
+            return facts.channel, list(CHANNELS), list(CHANNELS)
+        # Hãng bay: ánh xạ mã máy bay -> mã hãng rồi gom theo mảng (đổi hãng của máy bay không cần nạp lại)
+        airlines = _Dictionary()
+        planes = [ref.planes.get(plane_id) for plane_id in self.dictionaries['plane'].values]
+        plane_to_airline = airlines.encode(np.array(
+            [p.company.com_id if p and p.company else 0 for p in planes] or [0], dtype=np.int64))
+        companies = {c.com_id: c.com_name for c in ref.companies.values()}
+        return plane_to_airline[facts.plane], airlines.values, [companies.get(c, 'Unknown') for c in airlines.values]
+
+    def query(self, group_by=(), filters=None, sort='revenue', limit=None):
+        facts = self.facts
+        ref = refdata.get_snapshot()
+        dimensions = {name: self._dimension(facts, name, ref) for name in set(group_by) | set(filters or {})}
+
+        mask = np.ones(len(facts.ticket_id), dtype=bool)
+        for name, wanted in (filters or {}).items():
+            codes, values, _ = dimensions[name]
+            mask &= np.isin(codes, [i for i, v in enumerate(values) if v in wanted])
+
+        # Khoá ghép kiểu hệ cơ số hỗn hợp: key = ((c1 * n2) + c2) * n3 + c3 ...
+        sizes = [max(1, len(dimensions[name][1])) for name in group_by]
+        key = np.zeros(int(mask.sum()), dtype=np.int64)
+        for name, size in zip(group_by, sizes):
+            key = key * size + dimensions[name][0][mask]
+        revenue = facts.revenue[mask]
+
+        cells = int(np.prod(sizes, dtype=np.int64))
+        if cells <= BINCOUNT_LIMIT:
+            tickets = np.bincount(key, minlength=cells)
+            totals = np.bincount(key, weights=revenue, minlength=cells)
+            keys = np.flatnonzero(tickets)
+            tickets, totals = tickets[keys], totals[keys]
+        else:
+            keys, inverse = np.unique(key, return_inverse=True)
+            tickets = np.bincount(inverse, minlength=len(keys))
+            totals = np.bincount(inverse, weights=revenue, minlength=len(keys))
+
+        codes = np.unravel_index(keys, sizes) if group_by else []
+        rows = []
+        for i in range(len(keys)):
+            row = {'tickets': int(tickets[i]), 'revenue': round(float(totals[i]), 2)}
+            labels = []
+            for name, dim_codes in zip(group_by, codes):
+                _, values, names = dimensions[name]
+                row[name] = values[dim_codes[i]]
+                labels.append(str(names[dim_codes[i]]))
+            row['label'] = ' / '.join(labels) or 'Total'
+            rows.append(row)
+
+        if sort in ('revenue', 'tickets'):
+            rows.sort(key=lambda r: r[sort], reverse=True)
+        else:
+            rows.sort(key=lambda r: [r[name] for name in group_by])
+        return rows[:limit] if limit else rows
+
+    def size(self):
+        return len(self.facts.ticket_id)
+
+    def nbytes(self):
+        return sum(column.nbytes for column in self.facts)
+
+
+def _route_label(ref, fr_id):
+    route = ref.routes.get(fr_id)
+    if not route:
+        return f"Route {fr_id}"
+    return f"{route.departure_airport.airport_name} - {route.arrival_airport.airport_name}"
+
+
+_cube = None
+_checked_at = 0
+_lock = threading.Lock()
+
+
+def get_cube():
+    global _cube, _checked_at
+    if _cube is not None and time.time() - _checked_at < REFRESH_SECONDS:
+        return _cube
+
+    with _lock:
+        if _cube is None or time.time() - _checked_at >= REFRESH_SECONDS:
+            version = refdata.read_version(CACHE_NAME)
+            if _cube is None or _cube.version != version or \
+                    time.time() - _cube.loaded_at > CHANGE_RETENTION.total_seconds():
+                # Dựng khối mới rồi mới thay: các request khác vẫn đọc khối cũ trong lúc nạp
+                cube = Cube(version)
+                cube.refresh()
+                _cube = cube
+            else:
+                _cube.refresh()
+            _checked_at = time.time()
+    return _cube
+
+
+def query(group_by=(), filters=None, sort='revenue', limit=None):
+    return get_cube().query(group_by, filters, sort, limit)
+
+
+def invalidate():
+    # Gọi sau khi ghi vé hàng loạt bỏ qua mapper event (datagen, dựng lại thống kê)
+    global _cube
+    refdata.bump_version(CACHE_NAME)
+    _cube = None
+
+
+def purge_changes():
+    # Xoá các dòng nhật ký thay đổi mà mọi worker đang chạy đều đã áp dụng
+    result = db.session.execute(delete(TicketChange).where(TicketChange.changed_at < datetime.now() - CHANGE_RETENTION))
+    db.session.commit()
+    return result.rowcount
+
+
+def _log_changes(connection, *conditions):
+    # Ghi thêm vào nhật ký (chỉ INSERT, không khoá dòng chung nào) trong transaction của mapper event
+    global _checked_at
+    connection.execute(insert(TicketChange.__table__).from_select(
+        ['ticket_id', 'changed_at'],
+        select(Ticket.ticket_id, literal(datetime.now(), DateTime)).where(*conditions)))
+    _checked_at = 0
+
+
+@event.listens_for(Ticket, 'after_update')
+def ticket_updated(mapper, connection, target):
+    state = inspect(target)
+    if any(state.attrs[attr].history.has_changes() for attr in (
+            'ticket_status', 'flight_id', 'seat_id', 'issue_date', 'ticket_price', 'customer_id')):
+        _log_changes(connection, Ticket.ticket_id == target.ticket_id)
+
+
+@event.listens_for(Ticket, 'before_delete')
+def ticket_deleted(mapper, connection, target):
+    _log_changes(connection, Ticket.ticket_id == target.ticket_id)
+
+
+@event.listens_for(Flight, 'after_update')
+def flight_updated(mapper, connection, target):
+    state = inspect(target)
+    if state.attrs.flight_route_id.history.has_changes() or state.attrs.plane_id.history.has_changes():
+        _log_changes(connection, Ticket.flight_id == target.flight_id)
+
+
+@event.listens_for(Seat, 'after_update')
+def seat_updated(mapper, connection, target):
+    if inspect(target).attrs.seat_class.history.has_changes():
+        _log_changes(connection, Ticket.seat_id == target.seat_id)
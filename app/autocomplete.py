@@ -0,0 +1,119 @@
+import re
+import threading
+from collections import defaultdict
+from unidecode import unidecode
+from app import refdata
+
+# Tên gọi khác của các thành phố (đã bỏ dấu, chữ thường); nhóm được gắn vào sân bay
+# khi tên hoặc địa chỉ sân bay chứa một trong các tên trong nhóm
+CITY_ALIASES = [
+    ['ha noi', 'hanoi', 'hn', 'thu do'],
+    ['ho chi minh', 'hcm', 'tp hcm', 'sai gon', 'saigon', 'sgn'],
+    ['da nang', 'danang', 'dad'],
+    ['hai phong', 'haiphong'],
+    ['nha trang', 'cam ranh'],
+    ['phu quoc'],
+    ['seoul', 'incheon', 'han quoc', 'korea'],
+    ['singapore', 'changi', 'sin'],
+    ['bangkok', 'thai lan', 'thailand', 'bkk'],
+    ['taipei', 'dai bac', 'taiwan'],
+    ['tokyo', 'narita', 'haneda', 'nhat ban', 'japan'],
+]
+MAX_PREFIX = 12
+
+
+def fold(s):
+    # "Hà Nội, Việt Nam" -> "ha noi viet nam"
+    return ' '.join(re.sub(r'[^a-z0-9]+', ' ', unidecode(s or '').lower()).split())
+
+
+def prefixes(word):
+    return [word[:i] for i in range(1, min(len(word), MAX_PREFIX) + 1)]
+
+
+class AutocompleteIndex:
+    def __init__(self, airports, version=0):
+        self.airports = {}  # airport_id -> (tên, địa chỉ, tên đã bỏ dấu, các cụm từ thành phố)
+        self.tokens = defaultdict(set)  # tiền tố của từng từ -> airport ids
+        self.compact = defaultdict(set)  # tiền tố của cụm từ viết liền ("hanoi", "hochiminh") -> airport ids
+        self.version = version
+
+        for airport_id, name, address in airports:
+            folded_name = fold(name)
+            cities = [fold(address.split(',')[0])]
+            text = ' %s %s ' % (folded_name, fold(address))
+            words = set(text.split())
+            for group in CITY_ALIASES:
+                if any(' %s ' % alias in text or alias.replace(' ', '') in words for alias in group):
+                    cities.extend(group)
+
+            self.airports[airport_id] = (name, address, folded_name, cities)
+            for phrase in [folded_name, fold(address)] + cities:
+                for word in phrase.split():
+                    for p in prefixes(word):
+                        self.tokens[p].add(airport_id)
+                for p in prefixes(phrase.replace(' ', '')):
+                    self.compact[p].add(airport_id)
+
+    def candidates(self, q):
+        words = q.split()
+        found = None
+        for word in words:
+            ids = self.tokens.get(word[:MAX_PREFIX], set())
+            found = ids if found is None else found & ids
+            if not found:
+                break
+        return (found or set()) | self.compact.get(q.replace(' ', '')[:MAX_PREFIX], set())
+
+    def score(self, airport_id, q):
+        name, address, folded_name, cities = self.airports[airport_id]
+        compact_q = q.replace(' ', '')
+        if folded_name.startswith(q):
+            score = 100
+        elif any(city.startswith(q) or city.replace(' ', '').startswith(compact_q) for city in cities):
+            score = 80
+        elif all(any(w.startswith(word) for w in folded_name.split()) for word in q.split()):
+            score = 60
+        else:
+            score = 40
+        # Tên ngắn hơn (khớp sát hơn) được xếp trước
+        return score - len(folded_name) / 1000
+
+    def search(self, query, limit=8):
+        q = fold(query)
+        if not q:
+            return []
+        ranked = sorted(((self.score(airport_id, q), airport_id) for airport_id in self.candidates(q)),
+                        reverse=True)
+        if limit:
+            ranked = ranked[:limit]
+        return [{
+            'id': airport_id,
+            'name': self.airports[airport_id][0],
+            'address': self.airports[airport_id][1],
+            'score': round(score, 3)
+        } for score, airport_id in ranked]
+
+
+_index = None
+_build_lock = threading.Lock()
+
+
+def get_index():
+    # Dựng lại chỉ mục khi snapshot dữ liệu gốc đổi phiên bản (admin sửa Airport)
+    global _index
+    snapshot = refdata.get_snapshot()
+    if _index is None or _index.version != snapshot.version:
+        with _build_lock:
+            if _index is None or _index.version != snapshot.version:
+                _index = AutocompleteIndex([(a.airport_id, a.airport_name, a.airport_address)
+                                            for a in snapshot.airports.values()], snapshot.version)
+    return _index
+
+
+def search(query, limit=8):
+    return get_index().search(query, limit)
+
+
+def match_airport_ids(query):
+    return [a['id'] for a in get_index().search(query, limit=None)]
@@ -0,0 +1,145 @@
+import io
+import os
+import queue
+import threading
+import time
+import uuid
+from app import app, db
+from app.models import User
+
+AVATAR_SIZE = 256
+JPEG_QUALITY = 85
+MAX_BYTES = 5 * 1024 * 1024
+QUEUE_SIZE = 1000
+MAX_RETRIES = 3
+RETRY_DELAY = 1  # giây, nhân đôi sau mỗi lần thử lại
+
+
+class CloudinaryStorage:
+    # Thư viện cloudinary chỉ được import và cấu hình khi worker tải ảnh đầu tiên, không phải lúc khởi động app
+    def __init__(self):
+        import cloudinary
+        import cloudinary.uploader
+        cloudinary.config(**app.config['CLOUDINARY'])
+        self.uploader = cloudinary.uploader
+
+    def save(self, data, name):
+        return self.uploader.upload(data, public_id=name).get('secure_url')
+
+
+class LocalStorage:
+    # Thay cho Cloudinary khi dev / chạy thử: ghi vào static/uploads/avatars
+    def __init__(self, folder='uploads/avatars'):
+        self.folder = folder
+
+    def save(self, data, name):
+        path = os.path.join(app.static_folder, self.folder)
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, f"{name}.jpg"), 'wb') as f:
+            f.write(data)
+        return f"{app.static_url_path}/{self.folder}/{name}.jpg"
+
+
+STORAGES = {'cloudinary': CloudinaryStorage, 'local': LocalStorage}
+
+_queue = queue.Queue(maxsize=QUEUE_SIZE)
+_workers = []
+_lock = threading.Lock()
+_metrics = {'queued': 0, 'uploaded': 0, 'failed': 0, 'retries': 0, 'dropped': 0, 'in_flight': 0,
+            'total_seconds': 0.0, 'last_error': None}
+
+
+def _count(key, value=1):
+    with _lock:
+        _metrics[key] += value
+
+
+def metrics():
+    with _lock:
+        result = dict(_metrics)
+    result['queue_depth'] = _queue.qsize()
+    result['workers'] = len(_workers)
+    result['avg_seconds'] = round(result['total_seconds'] / result['uploaded'], 3) if result['uploaded'] else None
+    return result
+
+
+def process(data):
+    # Thu nhỏ về tối đa AVATAR_SIZE px và nén JPEG; Pillow chỉ được nạp khi có ảnh cần xử lý, không phải lúc khởi động
+    from PIL import Image
+    image = Image.open(io.BytesIO(data))
+    image.thumbnail((AVATAR_SIZE, AVATAR_SIZE))
+    out = io.BytesIO()
+    image.convert('RGB').save(out, 'JPEG', quality=JPEG_QUALITY, optimize=True)
+    return out.getvalue()
+
+
+def _upload(user_id, data):
+    from app import identity
+
+    url = STORAGES[app.config['AVATAR_STORAGE']]().save(process(data), f"avatar_{user_id}_{uuid.uuid4().hex[:8]}")
+    User.query.filter(User.id == user_id).update({User.avatar: url})
+    db.session.commit()
+    identity.invalidate(user_id)
+
+
+def _work():
+    while True:
+        user_id, data = _queue.get()
+        _count('in_flight')
+        started = time.perf_counter()
+        try:
+            with app.app_context():
+                for attempt in range(MAX_RETRIES + 1):
+                    try:
+                        _upload(user_id, data)
+                        _count('uploaded')
+                        _count('total_seconds', time.perf_counter() - started)
+                        break
+                    except Exception as ex:
+                        db.session.rollback()
+                        with _lock:
+                            _metrics['last_error'] = f"user {user_id}: {ex}"
+                        if attempt == MAX_RETRIES:
+                            _count('failed')
+                            app.logger.exception("Avatar upload for user %s failed", user_id)
+                        else:
+                            _count('retries')
+                            time.sleep(RETRY_DELAY * 2 ** attempt)
+        finally:
+            _count('in_flight', -1)
+            _queue.task_done()
+
+
+def _start_workers():
+    with _lock:
+        while len(_workers) < app.config['AVATAR_WORKERS']:
+            worker = threading.Thread(target=_work, daemon=True, name=f"avatar-worker-{len(_workers) + 1}")
+            worker.start()
+            _workers.append(worker)
+
+
+def _is_image(data):
+    # Chỉ đọc header (verify không giải mã ảnh): file không phải ảnh bị bỏ ngay thay vì thử lại ở luồng nền
+    from PIL import Image
+    try:
+        Image.open(io.BytesIO(data)).verify()
+    except Exception:
+        return False
+    return True
+
+
+def enqueue(user_id, file):
+    # Đọc file ngay trong request rồi xử lý ở luồng nền; người dùng giữ ảnh mặc định tới khi tải xong
+    data = file.read(MAX_BYTES + 1)
+    if not data or len(data) > MAX_BYTES or not _is_image(data):
+        _count('dropped')
+        return False
+
+    _start_workers()
+    try:
+        _queue.put_nowait((user_id, data))
+    except queue.Full:
+        _count('dropped')
+        return False
+    _count('queued')
+    return True
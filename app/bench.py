@@ -0,0 +1,176 @@
+import json
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+from app import app, db, dao, utils, farecalendar
+from app.models import Flight, FlightRoute, Airport, User, UserRole
+
+# Một ca đo: tên, hàm chạy (nhận ngữ cảnh dữ liệu), số câu SQL tối đa cho một lần gọi
+Case = namedtuple('Case', ['name', 'run', 'budget'])
+Result = namedtuple('Result', ['name', 'p50', 'p95', 'statements', 'rows', 'budget'])
+
+ITERATIONS = 20
+# Độ chậm đi (so với baseline) được coi là hồi quy khi so sánh độ trễ p95
+LATENCY_TOLERANCE = 0.5
+
+
+def _get(client, url, status=200):
+    # Mỗi request một app context mới như khi chạy thật (không dùng chung g / session với lệnh CLI)
+    with app.app_context():
+        response = client.get(url)
+    if response.status_code != status:
+        raise RuntimeError(f"GET {url} -> {response.status_code}")
+    return response
+
+
+def _cold_count_flights(ctx):
+    dao.invalidate_flight_count()
+    return dao.count_flights()
+
+
+def _cold_fare_calendar(ctx):
+    farecalendar.invalidate()
+    return farecalendar.get_calendar(ctx['departure'], ctx['arrival'], days=farecalendar.MAX_DAYS)
+
+
+CASES = [
+    Case('dao.search_flights', lambda ctx: dao.search_flights(
+        ctx['departure'], ctx['arrival'], ctx['date'], 1), dao.SEARCH_FLIGHTS_QUERY_BUDGET),
+    Case('dao.get_popular_routes', lambda ctx: dao.get_popular_routes(ctx['departure']), 1),
+    Case('dao.get_flights', lambda ctx: dao.get_flights(), 2),
+    Case('dao.get_flights(cursor)', lambda ctx: dao.get_flights(after=ctx['cursor']), 2),
+    Case('dao.count_flights', lambda ctx: dao.count_flights(), 1),
+    Case('dao.count_flights(cold)', _cold_count_flights, 1),
+    Case('farecalendar(cold)', _cold_fare_calendar, 1),
+    Case('dao.get_tiket_statistics', lambda ctx: dao.get_tiket_statistics(), 1),
+    Case('dao.get_flight_statistics', lambda ctx: dao.get_flight_statistics(), 2),
+    Case('dao.ticket_stats', lambda ctx: dao.ticket_stats(), 2),
+    Case('GET /', lambda ctx: _get(ctx['client'], '/'), 4),
+    Case('GET /search', lambda ctx: _get(ctx['client'], '/search?departure=%s&arrival=%s&departure_date=%s' % (
+        ctx['departure'], ctx['arrival'], ctx['date'])), 4),
+    Case('GET /payment_info', lambda ctx: _get(ctx['client'], '/payment_info/%s/1/economy' % ctx['flight_id']), 2),
+    Case('GET /api/fare-calendar', lambda ctx: _get(ctx['client'], '/api/fare-calendar?departure=%s&arrival=%s' % (
+        ctx['departure'], ctx['arrival'])), 1),
+    Case('GET /api/flights', lambda ctx: _get(ctx['client'], '/api/flights?order=departure'), 3),
+    Case('GET /api/search', lambda ctx: _get(ctx['client'], '/api/search?departure=%s&arrival=%s&departure_date=%s'
+                                                       '&sort=price' % (ctx['departure'], ctx['arrival'], ctx['date'])), 2),
+    Case('GET /admin/', lambda ctx: _get(ctx['admin_client'], '/admin/'), 3),
+    Case('GET /admin/statsview/', lambda ctx: _get(ctx['admin_client'], '/admin/statsview/'), 4),
+    Case('GET /admin/statsview/api/cube', lambda ctx: _get(
+        ctx['admin_client'], '/admin/statsview/api/cube?group_by=route,month,seat_class'), 4),
+]
+
+
+@contextmanager
+def measure():
+    # Đếm câu SQL (utils.count_queries) và số dòng kết quả đọc về qua Session trong khối with
+    rows = [0]
+
+    def do_orm_execute(state):
+        if state.is_select:
+            frozen = state.invoke_statement().freeze()
+            rows[0] += len(frozen.data)
+            return frozen()
+
+    event.listen(Session, 'do_orm_execute', do_orm_execute)
+    try:
+        with utils.count_queries() as statements:
+            yield statements, rows
+    finally:
+        event.remove(Session, 'do_orm_execute', do_orm_execute)
+
+
+def _percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def _context():
+    # Tham số cho các ca đo lấy từ dữ liệu hiện có: chuyến bay sắp bay trên tuyến có nhiều chuyến nhất
+    fr_id = db.session.query(Flight.flight_route_id).group_by(
+        Flight.flight_route_id).order_by(func.count(Flight.flight_id).desc()).limit(1).scalar()
+    if fr_id is None:
+        raise RuntimeError("Database has no flights; run 'flask generate-data' first")
+    route = db.session.get(FlightRoute, fr_id)
+    flight = Flight.query.filter(Flight.flight_route_id == fr_id).order_by(Flight.f_dept_time.desc()).first()
+    # Trang thống kê chỉ dành cho admin: không có tài khoản admin thì bỏ qua các ca GET /admin
+    admin = User.query.filter(User.user_role == UserRole.ADMIN).order_by(User.id).first()
+
+    client = app.test_client()
+    admin_client = app.test_client()
+    if admin:
+        with admin_client.session_transaction() as session:
+            session['_user_id'] = str(admin.id)
+            session['_fresh'] = True
+
+    return {
+        'departure': db.session.get(Airport, route.departure_airport_id).airport_name,
+        'arrival': db.session.get(Airport, route.arrival_airport_id).airport_name,
+        'date': flight.f_dept_time.strftime('%Y-%m-%d'),
+        'flight_id': flight.flight_id,
+        'cursor': dao.encode_flight_cursor(dao.get_flights().flights[-1], 'id'),
+        'client': client,
+        'admin_client': admin_client if admin and 'admin' in app.blueprints else None,
+    }
+
+
+def run(iterations=ITERATIONS, cases=None):
+    from app import index  # đăng ký các route cần đo (trang admin đã gắn trong create_app nếu bật)
+    ctx = _context()
+    results = []
+    for case in cases or CASES:
+        if case.name.startswith('GET /admin') and ctx['admin_client'] is None:
+            continue
+        case.run(ctx)  # làm nóng cache / snapshot
+        timings, statements, rows = [], 0, 0
+        for _ in range(iterations):
+            with measure() as (executed, fetched):
+                started = time.perf_counter()
+                case.run(ctx)
+                timings.append((time.perf_counter() - started) * 1000)
+            statements = max(statements, len(executed))
+            rows = max(rows, fetched[0])
+            db.session.remove()
+        results.append(Result(case.name, round(_percentile(timings, 50), 3), round(_percentile(timings, 95), 3),
+                              statements, rows, case.budget))
+    return results
+
+
+def data_size():
+    return {'flights': Flight.query.count(), 'routes': FlightRoute.query.count()}
+
+
+def save_baseline(path, runs):
+    with open(path, 'w') as f:
+        json.dump({label: [r._asdict() for r in results] for label, results in runs.items()}, f, indent=2)
+
+
+def load_baseline(path):
+    with open(path) as f:
+        return {label: {r['name']: Result(**r) for r in results} for label, results in json.load(f).items()}
+
+
+def check(results, baseline=None, tolerance=LATENCY_TOLERANCE):
+    # Trả về danh sách vi phạm: vượt ngân sách câu SQL, nhiều câu SQL hơn baseline, hoặc p95 chậm hơn quá tolerance
+    problems = []
+    for r in results:
+        if r.statements > r.budget:
+            problems.append(f"{r.name}: {r.statements} statements > budget {r.budget}")
+        base = (baseline or {}).get(r.name)
+        if base:
+            if r.statements > base.statements:
+                problems.append(f"{r.name}: {r.statements} statements > baseline {base.statements}")
+            if tolerance is not None and r.p95 > base.p95 * (1 + tolerance):
+                problems.append(f"{r.name}: p95 {r.p95}ms > baseline {base.p95}ms (+{tolerance:.0%})")
+    return problems
+
+
+def format_results(results, baseline=None):
+    lines = [f"{'case':<28}{'p50 ms':>10}{'p95 ms':>10}{'stmts':>7}{'budget':>8}{'rows':>8}{'p95 vs base':>13}"]
+    for r in results:
+        base = (baseline or {}).get(r.name)
+        delta = f"{(r.p95 / base.p95 - 1) * 100:+.0f}%" if base and base.p95 else ''
+        lines.append(f"{r.name:<28}{r.p50:>10.2f}{r.p95:>10.2f}{r.statements:>7}{r.budget:>8}{r.rows:>8}{delta:>13}")
+    return '\n'.join(lines)
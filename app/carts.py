@@ -0,0 +1,195 @@
+import secrets
+import threading
+from datetime import datetime, timedelta
+from flask import session
+from sqlalchemy import delete
+from app import db, app
+from app.models import Cart, CartLine
+
+# Các trường của một dòng giỏ hàng (giống dict cũ trong session['cart'])
+LINE_FIELDS = ['flight_id', 'plane_name', 'departure', 'arrival', 'day', 'type_ticket', 'price', 'quantity',
+               'hold_id', 'hold_expires_at']
+EMPTY_STATS = {'total_quantity': 0, 'total_price': 0}
+
+
+def line_key(flight_id, type_ticket):
+    return f"{flight_id}_{type_ticket}"
+
+
+class MemoryCartStore:
+    # Lưu trong bộ nhớ của tiến trình (một worker / môi trường dev)
+    def __init__(self):
+        self.carts = {}  # token -> {'lines': {key: line}, 'total_quantity', 'total_price', 'updated_at'}
+        self.lock = threading.Lock()
+
+    def create(self, token):
+        with self.lock:
+            self._cart(token)
+
+    def _cart(self, token):
+        return self.carts.setdefault(token, {'lines': {}, 'total_quantity': 0, 'total_price': 0,
+                                             'updated_at': datetime.now()})
+
+    def lines(self, token):
+        cart = self.carts.get(token)
+        return {key: dict(line) for key, line in cart['lines'].items()} if cart else {}
+
+    def get_line(self, token, key):
+        cart = self.carts.get(token)
+        line = cart['lines'].get(key) if cart else None
+        return dict(line) if line else None
+
+    def stats(self, token):
+        cart = self.carts.get(token)
+        if not cart:
+            return dict(EMPTY_STATS)
+        return {'total_quantity': cart['total_quantity'], 'total_price': cart['total_price']}
+
+    def put_line(self, token, key, line):
+        with self.lock:
+            cart = self._cart(token)
+            _apply(cart, cart['lines'].get(key), line)
+            cart['lines'][key] = dict(line)
+            cart['updated_at'] = datetime.now()
+            return {'total_quantity': cart['total_quantity'], 'total_price': cart['total_price']}
+
+    def remove_line(self, token, key):
+        with self.lock:
+            cart = self.carts.get(token)
+            old = cart['lines'].pop(key, None) if cart else None
+            if old:
+                _apply(cart, old, None)
+                cart['updated_at'] = datetime.now()
+            return old
+
+    def purge(self, before):
+        with self.lock:
+            stale = [token for token, cart in self.carts.items() if cart['updated_at'] < before]
+            for token in stale:
+                del self.carts[token]
+        return len(stale)
+
+
+class SqlCartStore:
+    # Lưu trong bảng Cart / CartLine; mỗi thay đổi khoá dòng Cart (FOR UPDATE) rồi sửa đúng một dòng CartLine
+    # và cộng dồn tổng của giỏ trong cùng transaction
+    def create(self, token):
+        db.session.add(Cart(token=token))
+        db.session.commit()
+
+    def lines(self, token):
+        return {line.line_key: _line_dict(line) for line in CartLine.query.filter(CartLine.cart_token == token)}
+
+    def get_line(self, token, key):
+        line = db.session.get(CartLine, (token, key))
+        return _line_dict(line) if line else None
+
+    def stats(self, token):
+        row = db.session.query(Cart.total_quantity, Cart.total_price).filter(Cart.token == token).first()
+        if not row:
+            return dict(EMPTY_STATS)
+        return {'total_quantity': row[0], 'total_price': row[1]}
+
+    def put_line(self, token, key, line):
+        cart = self._locked(token)
+        current = db.session.get(CartLine, (token, key))
+        totals = {'total_quantity': cart.total_quantity, 'total_price': cart.total_price}
+        _apply(totals, _line_dict(current) if current else None, line)
+        if current is None:
+            current = CartLine(cart_token=token, line_key=key)
+            db.session.add(current)
+        for field in LINE_FIELDS:
+            setattr(current, field, line.get(field))
+        cart.total_quantity, cart.total_price = totals['total_quantity'], totals['total_price']
+        cart.updated_at = datetime.now()
+        db.session.commit()
+        return totals
+
+    def remove_line(self, token, key):
+        cart = self._locked(token)
+        current = db.session.get(CartLine, (token, key))
+        old = _line_dict(current) if current else None
+        if current:
+            totals = {'total_quantity': cart.total_quantity, 'total_price': cart.total_price}
+            _apply(totals, old, None)
+            cart.total_quantity, cart.total_price = totals['total_quantity'], totals['total_price']
+            cart.updated_at = datetime.now()
+            db.session.delete(current)
+        db.session.commit()
+        return old
+
+    def purge(self, before):
+        stale = db.session.query(Cart.token).filter(Cart.updated_at < before).scalar_subquery()
+        db.session.execute(delete(CartLine).where(CartLine.cart_token.in_(stale)))
+        result = db.session.execute(delete(Cart).where(Cart.updated_at < before))
+        db.session.commit()
+        return result.rowcount
+
+    def _locked(self, token):
+        cart = db.session.query(Cart).filter(Cart.token == token).with_for_update().first()
+        if cart is None:
+            # Token cũ của giỏ đã bị dọn: tạo lại giỏ rỗng
+            cart = Cart(token=token, total_quantity=0, total_price=0)
+            db.session.add(cart)
+        return cart
+
+
+def _line_dict(line):
+    return {field: getattr(line, field) for field in LINE_FIELDS}
+
+
+def _apply(totals, old, new):
+    # Cập nhật tổng theo chênh lệch giữa dòng cũ và dòng mới, không cộng lại cả giỏ
+    for line, sign in ((old, -1), (new, 1)):
+        if line:
+            totals['total_quantity'] += sign * line['quantity']
+            totals['total_price'] += sign * line['quantity'] * line['price']
+
+
+STORES = {'memory': MemoryCartStore, 'sql': SqlCartStore}
+_store = None
+
+
+def get_store():
+    global _store
+    if _store is None:
+        _store = STORES[app.config['CART_STORE']]()
+    return _store
+
+
+def _token(create=False):
+    token = session.get('cart_token')
+    if token is None and create:
+        token = secrets.token_urlsafe(16)
+        get_store().create(token)
+        session['cart_token'] = token
+    return token
+
+
+# Các hàm dưới đây làm việc với giỏ hàng của người dùng hiện tại (token trong cookie session)
+def lines():
+    token = _token()
+    return get_store().lines(token) if token else {}
+
+
+def get_line(key):
+    token = _token()
+    return get_store().get_line(token, key) if token else None
+
+
+def stats():
+    token = _token()
+    return get_store().stats(token) if token else dict(EMPTY_STATS)
+
+
+def put_line(key, line):
+    return get_store().put_line(_token(create=True), key, line)
+
+
+def remove_line(key):
+    token = _token()
+    return get_store().remove_line(token, key) if token else None
+
+
+def purge(days):
+    return get_store().purge(datetime.now() - timedelta(days=days))
@@ -0,0 +1,220 @@
+import time
+import click
+from app import app, db, dao, seatmap, datagen, bench, holds, carts, pricing, timetable, schema, explain, analytics, \
+    importtime
+
+
+@app.cli.command('rebuild-seat-inventory')
+def rebuild_seat_inventory_command():
+    """Tính lại tồn kho ghế (SeatInventory) của mọi chuyến bay từ Seat và Ticket."""
+    total = dao.rebuild_seat_inventory()
+    click.echo(f"Rebuilt {total} seat inventory rows.")
+
+
+@app.cli.command('rebuild-revenue-stats')
+def rebuild_revenue_stats_command():
+    """Dựng lại các bảng tổng hợp doanh thu theo ngày, tháng, tuyến bay và khối phân tích vé từ bảng Ticket."""
+    days, months, routes = dao.rebuild_revenue_rollups()
+    analytics.invalidate()
+    click.echo(f"Rebuilt revenue rollups: {days} days, {months} months, {routes} routes.")
+
+
+@app.cli.command('generate-seats')
+@click.option('--plane-id', 'plane_ids', type=int, multiple=True, help='Máy bay cần tạo ghế (có thể lặp lại).')
+@click.option('--company-id', type=int, help='Tạo ghế cho cả đội bay của một hãng.')
+@click.option('--layout', type=click.Choice(sorted(seatmap.SEAT_LAYOUTS)),
+              help='Sơ đồ ghế; mặc định dùng Plane.seat_layout hoặc đoán theo tên máy bay.')
+@click.option('--all', 'all_planes', is_flag=True, help='Tạo ghế cho mọi máy bay.')
+def generate_seats_command(plane_ids, company_id, layout, all_planes):
+    """Tạo / cập nhật ghế của máy bay theo sơ đồ ghế mẫu bằng bulk insert."""
+    if not (plane_ids or company_id or all_planes):
+        raise click.UsageError('Cần chọn --plane-id, --company-id hoặc --all.')
+
+    started = time.perf_counter()
+    stats = seatmap.generate_seats(plane_ids=list(plane_ids), company_id=company_id, layout=layout)
+    click.echo(f"{stats.get('planes', 0)} planes: {stats.get('inserted', 0)} seats inserted, "
+               f"{stats.get('updated', 0)} updated, {stats.get('deleted', 0)} deleted, "
+               f"{stats.get('skipped', 0)} planes without layout ({time.perf_counter() - started:.1f}s).")
+
+
+@app.cli.command('generate-data')
+@click.option('--scale', type=click.IntRange(1), default=1, show_default=True,
+              help='Hệ số quy mô; số máy bay, tuyến bay, chuyến bay và vé tăng tuyến tính theo hệ số này.')
+@click.option('--seed', type=int, default=42, show_default=True, help='Cùng seed (và --start) cho cùng dữ liệu.')
+@click.option('--start', type=click.DateTime(formats=['%Y-%m-%d']), help='Ngày gốc; mặc định là hôm nay.')
+@click.option('--days', type=click.IntRange(1), default=90, show_default=True, help='Số ngày bay sau ngày gốc.')
+@click.option('--history', type=click.IntRange(0), default=30, show_default=True, help='Số ngày bay trước ngày gốc.')
+@click.option('--reset', is_flag=True, help='Xoá và tạo lại toàn bộ bảng trước khi sinh dữ liệu.')
+def generate_data_command(scale, seed, start, days, history, reset):
+    """Sinh dữ liệu giả lập (sân bay, máy bay, chuyến bay, vé, thanh toán...) bằng bulk insert."""
+    if reset:
+        click.confirm('Xoá toàn bộ dữ liệu hiện có?', abort=True)
+        db.drop_all()
+    db.create_all()
+
+    started = time.perf_counter()
+    counts = datagen.generate(scale=scale, seed=seed, start=start.date() if start else None, days=days,
+                              history=history, progress=lambda day, counts: click.echo(
+                                  f"\r{day}: {counts.get('ticket', 0)} tickets", nl=False))
+    click.echo()
+    for table, total in counts.items():
+        click.echo(f"{table}: {total}")
+    click.echo(f"Generated {sum(counts.values())} rows in {time.perf_counter() - started:.1f}s.")
+
+
+@app.cli.command('bench')
+@click.option('--scale', 'scales', type=click.IntRange(1), multiple=True,
+              help='Sinh lại dữ liệu với hệ số này trước khi đo (xoá dữ liệu hiện có; có thể lặp lại).')
+@click.option('--seed', type=int, default=42, show_default=True)
+@click.option('--iterations', type=click.IntRange(1), default=bench.ITERATIONS, show_default=True)
+@click.option('--baseline', type=click.Path(exists=True, dir_okay=False), help='File JSON kết quả cũ để so sánh.')
+@click.option('--save-baseline', type=click.Path(dir_okay=False), help='Ghi kết quả lần đo này ra file JSON.')
+@click.option('--tolerance', type=float, default=bench.LATENCY_TOLERANCE, show_default=True,
+              help='Mức chậm đi p95 cho phép so với baseline (0.5 = 50%).')
+@click.option('--yes', is_flag=True, help='Không hỏi lại trước khi xoá dữ liệu.')
+def bench_command(scales, seed, iterations, baseline, save_baseline, tolerance, yes):
+    """Đo độ trễ p50/p95, số câu SQL và số dòng đọc về của dao và các trang chính; lỗi khi vượt ngân sách."""
+    if scales and not yes:
+        click.confirm('Xoá toàn bộ dữ liệu hiện có để sinh dữ liệu đo?', abort=True)
+
+    baseline = bench.load_baseline(baseline) if baseline else {}
+    runs, problems = {}, []
+    for scale in scales or [None]:
+        if scale:
+            db.drop_all()
+            db.create_all()
+            datagen.generate(scale=scale, seed=seed)
+        label = f"scale={scale}" if scale else 'current'
+
+        results = bench.run(iterations=iterations)
+        runs[label] = results
+        click.echo(f"\n[{label}] {bench.data_size()}")
+        click.echo(bench.format_results(results, baseline.get(label)))
+        problems += [f"[{label}] {p}" for p in bench.check(results, baseline.get(label), tolerance)]
+
+    if save_baseline:
+        bench.save_baseline(save_baseline, runs)
+    if problems:
+        click.echo('\n' + '\n'.join(problems), err=True)
+        raise SystemExit(1)
+
+
+@app.cli.command('release-expired-holds')
+def release_expired_holds_command():
+    """Trả lại các ghế đang bị giữ chỗ đã hết hạn."""
+    click.echo(f"Released {holds.release_expired()} expired seat holds.")
+
+
+@app.cli.command('purge-carts')
+@click.option('--days', type=click.IntRange(1), default=7, show_default=True,
+              help='Xoá giỏ hàng không thay đổi trong số ngày này.')
+def purge_carts_command(days):
+    """Xoá các giỏ hàng phía server đã bỏ dở."""
+    click.echo(f"Purged {carts.purge(days)} carts.")
+
+
+@app.cli.command('purge-ticket-changes')
+def purge_ticket_changes_command():
+    """Xoá nhật ký vé bị thay đổi cũ hơn thời gian giữ của khối phân tích vé."""
+    click.echo(f"Purged {analytics.purge_changes()} ticket changes.")
+
+
+@app.cli.command('reprice')
+def reprice_command():
+    """Tính lại giá của các chuyến bay chưa khởi hành theo tỉ lệ lấp đầy, thời gian và nhu cầu tuyến."""
+    stats = pricing.reprice()
+    click.echo(f"Repriced {stats['flights']} flights ({stats['changed']} changed) in {stats['seconds']}s.")
+
+
+@app.cli.command('import-timetable')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--batch-rows', type=click.IntRange(1), default=timetable.BATCH_ROWS, show_default=True,
+              help='Số dòng lịch được ghi trong một transaction.')
+@click.option('--force', is_flag=True,
+              help="Tiếp tục cả lần nhập đang ở trạng thái 'running' (tiến trình trước đã chết giữa chừng).")
+def import_timetable_command(path, batch_rows, force):
+    """Nhập lịch bay (CSV) và mở rộng lịch lặp hằng tuần thành các chuyến bay; chạy lại để tiếp tục lần nhập dở."""
+    with open(path, encoding='utf-8-sig') as f:
+        text = f.read()
+
+    def progress(job):
+        click.echo(f"  {job.next_row}/{job.total_rows} rows, {job.flights_created} flights, "
+                   f"{job.rows_per_second()} rows/s")
+
+    try:
+        job = timetable.run(text, filename=path, batch_rows=batch_rows, progress=progress, force=force)
+    except timetable.TimetableError as ex:
+        for error in ex.errors:
+            click.echo(error, err=True)
+        raise SystemExit(1)
+    except timetable.TimetableBusyError as ex:
+        click.echo(f"{ex}; use --force if the previous import process died.", err=True)
+        raise SystemExit(1)
+    click.echo(f"Imported {job.total_rows} timetable rows as {job.flights_created} flights "
+               f"in {job.seconds:.1f}s ({job.rows_per_second()} rows/s).")
+
+
+def _rebuild_revenue_stats():
+    dao.rebuild_revenue_rollups()
+    analytics.invalidate()
+
+
+# Bảng dẫn xuất được tạo rỗng: tìm chuyến bay (join seat_inventory) và thống kê sẽ thiếu dữ liệu cho tới khi
+# dựng lại từ dữ liệu gốc, nên upgrade-schema dựng luôn sau khi tạo bảng
+BACKFILLS = [
+    (('seat_inventory',), 'rebuild-seat-inventory', dao.rebuild_seat_inventory),
+    (('daily_revenue', 'monthly_revenue', 'route_revenue'), 'rebuild-revenue-stats', _rebuild_revenue_stats),
+]
+
+
+@app.cli.command('upgrade-schema')
+@click.option('--dry-run', is_flag=True, help='Chỉ liệt kê thay đổi, không sửa database.')
+def upgrade_schema_command(dry_run):
+    """Thêm các bảng, cột và index còn thiếu so với models vào database hiện có, rồi dựng các bảng dẫn xuất mới."""
+    if dry_run:
+        changes = schema.pending_changes()
+        for change in changes:
+            click.echo(schema.describe(change))
+    else:
+        changes = schema.upgrade(progress=click.echo)
+    created = {table.name for kind, table, _ in changes if kind == 'table'}
+    for tables, command, backfill in BACKFILLS:
+        if created & set(tables):
+            click.echo(f"{'would run' if dry_run else 'running'} flask {command}")
+            if not dry_run:
+                backfill()
+    if 'route_demand' in created:
+        click.echo("route_demand is empty until the next `flask reprice`.")
+    click.echo(f"{len(changes)} schema changes {'pending' if dry_run else 'applied'}.")
+
+
+@app.cli.command('explain')
+@click.option('--verbose', is_flag=True, help='In kế hoạch thực thi của mọi câu SQL, kể cả câu không có vấn đề.')
+def explain_command(verbose):
+    """EXPLAIN các câu SQL đọc của dao trên database hiện tại; lỗi khi có full scan hoặc sort không dùng index."""
+    reports = explain.run()
+    click.echo(explain.format_reports(reports, verbose))
+    if any(r.problems for r in reports):
+        raise SystemExit(1)
+
+
+@app.cli.command('import-report')
+@click.option('--runs', type=click.IntRange(1), default=importtime.RUNS, show_default=True)
+@click.option('--top', type=click.IntRange(1), default=20, show_default=True, help='Số package chậm nhất được in ra.')
+@click.option('--budget', type=float, default=importtime.BUDGET_MS, show_default=True,
+              help='Tổng thời gian import tối đa (ms).')
+@click.option('--baseline', type=click.Path(exists=True, dir_okay=False), help='File JSON kết quả cũ để so sánh.')
+@click.option('--save-baseline', type=click.Path(dir_okay=False), help='Ghi kết quả lần đo này ra file JSON.')
+@click.option('--tolerance', type=float, default=importtime.TOLERANCE, show_default=True,
+              help='Mức chậm đi cho phép so với baseline (0.3 = 30%).')
+def import_report_command(runs, top, budget, baseline, save_baseline, tolerance):
+    """Đo thời gian import lạnh của create_app() theo từng package; lỗi khi vượt ngân sách hoặc chậm hơn baseline."""
+    baseline = importtime.load_baseline(baseline) if baseline else None
+    result = importtime.measure(runs=runs)
+    click.echo(importtime.format_result(result, baseline, top))
+    if save_baseline:
+        importtime.save_baseline(save_baseline, result)
+    problems = importtime.check(result, baseline, budget, tolerance)
+    if problems:
+        click.echo('\n' + '\n'.join(problems), err=True)
+        raise SystemExit(1)
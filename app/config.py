@@ -0,0 +1,87 @@
+import os
+from urllib.parse import quote
+
+# Cấu hình theo môi trường: create_app() chọn profile theo biến APP_ENV (development / production / testing),
+# sau đó mọi khoá đều ghi đè được bằng biến môi trường FLASK_<KHOÁ> (ví dụ FLASK_PAGE_SIZE=10, FLASK_ADMIN_ENABLED=false)
+
+
+def _engine_options():
+    # Pool kết nối dùng chung cho primary và các replica; pre_ping + recycle tránh kết nối MySQL đã bị server đóng
+    return {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 20)),
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 30)),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': os.environ.get('DB_POOL_PRE_PING', '1') == '1',
+    }
+
+
+def _replica_binds(engine_options, variable='DATABASE_REPLICA_URLS'):
+    # Replica chỉ đọc, cách nhau bởi dấu phẩy; các hàm dao đánh dấu @routing.replica đọc từ đây
+    urls = [url.strip() for url in os.environ.get(variable, '').split(',') if url.strip()]
+    return {f"replica_{i}": dict(engine_options, url=url) for i, url in enumerate(urls)}
+
+
+class Config:
+    SECRET_KEY = os.environ.get('SECRET_KEY', "KJGHJG^&*%&*^T&*(IGFG%ERFTGHCFHGFasdasIU")
+    SQLALCHEMY_DATABASE_URI = os.environ.get(
+        'DATABASE_URL', "mysql+pymysql://root:%s@localhost/flightdb?charset=utf8mb4" % quote('admin123'))
+    SQLALCHEMY_ENGINE_OPTIONS = _engine_options()
+    SQLALCHEMY_BINDS = _replica_binds(SQLALCHEMY_ENGINE_OPTIONS)
+    REPLICA_BINDS = list(SQLALCHEMY_BINDS)
+    # Sau khi ghi, người dùng đọc từ primary trong khoảng thời gian này (độ trễ đồng bộ của replica)
+    READ_YOUR_WRITES_SECONDS = 5
+    SQLALCHEMY_TRACK_MODIFICATIONS = True
+    PAGE_SIZE = 3
+    # Đo số câu SQL / thời gian DB của từng request (header Server-Timing, trang admin "SQL")
+    SQL_STATS = True
+    # Khi cùng một quan hệ bị lazy load quá NPLUSONE_THRESHOLD lần trong một request: 'log', 'raise' hoặc None (tắt)
+    NPLUSONE_MODE = 'log'
+    NPLUSONE_THRESHOLD = 10
+    # Giữ chỗ trong giỏ hàng hết hạn sau SEAT_HOLD_SECONDS; mỗi worker dọn giữ chỗ hết hạn sau mỗi SEAT_HOLD_REAPER_SECONDS
+    SEAT_HOLD_SECONDS = 600
+    SEAT_HOLD_REAPER_SECONDS = 30
+    # Nơi lưu giỏ hàng (cookie chỉ giữ token): 'sql' (bảng Cart / CartLine) hoặc 'memory' (bộ nhớ tiến trình, 1 worker)
+    CART_STORE = 'sql'
+    # Ảnh đại diện được thu nhỏ và tải lên ở luồng nền: 'cloudinary' hoặc 'local' (static/uploads/avatars)
+    AVATAR_STORAGE = 'cloudinary'
+    AVATAR_WORKERS = 2
+    # Thư viện cloudinary chỉ được nạp và cấu hình khi tải ảnh lên lần đầu
+    CLOUDINARY = {
+        'cloud_name': os.environ.get('CLOUDINARY_CLOUD_NAME', "dd1frsvzk"),
+        'api_key': os.environ.get('CLOUDINARY_API_KEY', "172266497937733"),
+        'api_secret': os.environ.get('CLOUDINARY_API_SECRET', "W_FvA2NSah3Jlv8cxhubvnw2mVM"),
+        'secure': True,
+    }
+    # Trang quản trị (Flask-Admin); form / cột / bộ lọc của mỗi ModelView chỉ được dựng khi trang đó được mở lần đầu
+    ADMIN_ENABLED = True
+
+
+class DevelopmentConfig(Config):
+    DEBUG = True
+
+
+class ProductionConfig(Config):
+    # Không dùng khoá mặc định trong mã nguồn: create_app() báo lỗi nếu thiếu biến SECRET_KEY
+    SECRET_KEY = os.environ.get('SECRET_KEY')
+    NPLUSONE_MODE = None
+
+
+class TestingConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL', 'sqlite://')
+    SQLALCHEMY_ENGINE_OPTIONS = {}
+    SQLALCHEMY_BINDS = _replica_binds({}, 'TEST_DATABASE_REPLICA_URLS')
+    REPLICA_BINDS = list(SQLALCHEMY_BINDS)
+    NPLUSONE_MODE = 'raise'
+    # Không chạy luồng nền dọn giữ chỗ và không tải ảnh lên Cloudinary khi chạy thử
+    SEAT_HOLD_REAPER_SECONDS = None
+    AVATAR_STORAGE = 'local'
+    ADMIN_ENABLED = False
+
+
+PROFILES = {
+    'development': DevelopmentConfig,
+    'production': ProductionConfig,
+    'testing': TestingConfig,
+}
@@ -1,17 +1,23 @@
-from sqlalchemy import func
-from sqlalchemy.orm import aliased
-from app.models import User, Airport, FlightRoute, Flight, Company, Ticket
-from app import db,app
+from sqlalchemy import func, insert, and_, or_
+from sqlalchemy.orm import contains_eager, selectinload, aliased
+from app.models import User, Airport, FlightRoute, Flight, Company, Ticket, Seat, SeatClass, SeatInventory, Plane, \
+    SeatHold, DailyRevenue, MonthlyRevenue, RouteRevenue
+from app import db, app, autocomplete, refdata, avatars, routing, farecalendar, holds
 import hashlib
-import cloudinary.uploader
-from datetime import datetime
+import time
+from datetime import datetime, timedelta
+from collections import namedtuple
 
 def get_user_by_id(id):
     return User.query.get(id)
 
 
+def hash_password(password):
+    return str(hashlib.md5(password.strip().encode('utf-8')).hexdigest())
+
+
 def auth_user(username, password, role = None):
-    password = str(hashlib.md5(password.strip().encode('utf-8')).hexdigest())
+    password = hash_password(password)
     u = User.query.filter(User.username.__eq__(username.strip()),
                              User.password.__eq__(password))
     if role:
@@ -22,7 +28,7 @@ def auth_user(username, password, role = None):
 
 def add_user(name, username, password, email, dob, gender, avatar):
 
-    password = str(hashlib.md5(password.strip().encode('utf-8')).hexdigest())
+    password = hash_password(password)
     gender_bool = True
 
     if isinstance(dob, str):
@@ -33,27 +39,31 @@ def add_user(name, username, password, email, dob, gender, avatar):
             raise ValueError("Ngày sinh không hợp lệ. Định dạng phải là YYYY-MM-DD.")
     u = User(name=name.strip(), username=username.strip(), password=password, email=email.strip(),dob=dob,gender=gender_bool)
 
-    if avatar:
-        res = cloudinary.uploader.upload(avatar)
-        u.avatar = res.get('secure_url')
-
     db.session.add(u)
     db.session.commit()
 
+    # Lưu người dùng với ảnh mặc định ngay, ảnh đại diện được xử lý và tải lên ở luồng nền
+    if avatar:
+        avatars.enqueue(u.id, avatar)
+
+    return u
+
 
 def load_airports():
-    return Airport.query.all()
+    return list(refdata.get_snapshot().airports.values())
 
 def load_flight_routes():
-    return FlightRoute.query.all()
+    return list(refdata.get_snapshot().routes.values())
 
 def get_airport_by_id(id):
-    return Airport.query.get(id)
+    return refdata.get_snapshot().airports.get(id)
 
+@routing.replica
 def load_flights():
     return Flight.query.all()
 
 
+@routing.replica
 def show_flights():
     # Truy vấn danh sách chuyến bay và thông tin liên quan
     flights = db.session.query(
@@ -73,173 +83,385 @@ def show_flights():
     return flights
 
 
-def get_popular_routes(departure_name=None):
-
-    arrival_airport = db.aliased(Airport)
+PopularRoute = namedtuple('PopularRoute', ['fr_id', 'departure', 'arrival', 'image', 'description'])
 
 
-    query = db.session.query(
-        FlightRoute.fr_id,
-        Airport.airport_name.label('departure'),
-        arrival_airport.airport_name.label('arrival'),
-        arrival_airport.airport_image.label('image'),
-        FlightRoute.description
-    ).join(
-        Airport, FlightRoute.departure_airport_id == Airport.airport_id
-    ).join(
-        arrival_airport, FlightRoute.arrival_airport_id == arrival_airport.airport_id
-    )
+def get_popular_routes(departure_name=None):
+    # Tính hoàn toàn từ snapshot dữ liệu gốc, không phát ra câu SQL nào
+    routes = refdata.get_snapshot().routes.values()
 
     if departure_name:
-        query = query.filter(Airport.airport_address.ilike(f"%{departure_name}%"))
-
-    return query.all()
+        # Tra chỉ mục autocomplete trong bộ nhớ thay cho ilike('%...%') (không dùng được index)
+        airport_ids = set(autocomplete.match_airport_ids(departure_name))
+        routes = [r for r in routes if r.departure_airport.airport_id in airport_ids]
 
+    return [PopularRoute(r.fr_id, r.departure_airport.airport_name, r.arrival_airport.airport_name,
+                         r.arrival_airport.airport_image, r.description) for r in routes]
 
 
+# Số câu SQL tối đa mà search_flights được phép phát ra (kể cả khi template hiển thị kết quả):
+# 1 truy vấn chuyến bay + tối đa 1 lần kiểm tra phiên bản của snapshot refdata
+SEARCH_FLIGHTS_QUERY_BUDGET = 2
 
 
+@routing.replica
 def search_flights(departure, arrival, departure_date,total_needed_seats):
-    # Tìm kiếm sân bay đi và đến
-    departure_airport = Airport.query.filter_by(airport_name=departure).first()
-    arrival_airport = Airport.query.filter_by(airport_name=arrival).first()
+    # Sân bay và tuyến bay được tra trong snapshot dữ liệu gốc (không cần truy vấn)
+    ref = refdata.get_snapshot()
+    departure_airport = ref.airport_by_name.get(departure)
+    arrival_airport = ref.airport_by_name.get(arrival)
 
     if not departure_airport or not arrival_airport:
         return None, "Airport not found"
 
-    # Lọc các tuyến bay từ sân bay đi đến sân bay đến
-    flight_routes = FlightRoute.query.filter(
-        FlightRoute.departure_airport_id == departure_airport.airport_id,
-        FlightRoute.arrival_airport_id == arrival_airport.airport_id
-    ).all()
+    route_ids = ref.routes_between.get((departure_airport.airport_id, arrival_airport.airport_id))
+    if not route_ids:
+        return [], None
 
-    if not flight_routes:
+    if not departure_date:
         return [], None
+    # So sánh theo khoảng [0h ngày đi, 0h ngày hôm sau) thay vì func.date(...) == ngày để dùng được index
+    # ix_flight_route_dept_time
+    day_start = datetime.strptime(departure_date, '%Y-%m-%d')
+
+    # Chuyến bay và tồn kho ghế trong cùng một câu SQL, điều kiện còn đủ ghế kiểm tra bằng EXISTS;
+    # template đọc máy bay, hãng, sân bay từ snapshot
+    flights = Flight.query.join(
+        Flight.seat_inventories
+    ).filter(
+        Flight.flight_route_id.in_(route_ids),
+        Flight.f_dept_time >= day_start,
+        Flight.f_dept_time < day_start + timedelta(days=1),
+        Flight.seat_inventories.any(
+            SeatInventory.capacity - SeatInventory.booked - SeatInventory.held >= total_needed_seats)
+    ).options(
+        contains_eager(Flight.seat_inventories)
+    ).order_by(
+        Flight.f_dept_time
+    ).all()
 
-    # Chuyển ngày đi thành định dạng đối tượng date
-    departure_date_obj = datetime.strptime(departure_date, '%Y-%m-%d').date() if departure_date else None
+    return flights, None
 
-    # Lọc chuyến bay theo tuyến bay và ngày đi
-    flights = Flight.query.filter(
-        Flight.flight_route_id.in_([route.fr_id for route in flight_routes]),
-        func.date(Flight.f_dept_time) == departure_date_obj
-    ).all()
 
-    available_flights = []
+# API tìm kiếm: lọc, sắp xếp và phân trang keyset trong SQL trên khoảng (tuyến, giờ đi) của index
+# ix_flight_route_dept_time; đọc về các dòng gọn thay vì đối tượng Flight
+SEARCH_SORTS = {
+    'departure': Flight.f_dept_time,
+    'price': func.coalesce(Flight.flight_price, 0),
+    'duration': func.coalesce(Flight.flight_duration, 0),
+}
+
+SearchPage = namedtuple('SearchPage', ['rows', 'next_cursor'])
+
+
+def encode_search_cursor(row, sort):
+    value = row.sort_key.isoformat() if sort == 'departure' else repr(float(row.sort_key))
+    return f"{value}~{row.flight_id}"
+
+
+def decode_search_cursor(cursor, sort):
+    try:
+        value, flight_id = cursor.split('~')
+        return [datetime.fromisoformat(value) if sort == 'departure' else float(value), int(flight_id)]
+    except ValueError:
+        raise ValueError("Cursor không hợp lệ")
+
+
+def _available(inventory):
+    return func.coalesce(inventory.capacity - inventory.booked - inventory.held, 0)
+
+
+def _sold(inventory):
+    return func.coalesce(inventory.booked + inventory.held, 0)
+
+
+@routing.replica
+def search_flight_page(departure, arrival, departure_date, total_needed_seats, sort='departure', seat_class=None,
+                       min_price=None, max_price=None, depart_from=None, depart_to=None, flight_types=None,
+                       airline_ids=None, after=None, page_size=None):
+    # Giá lọc theo hạng ghế đã chọn (business = PRICE_FACTOR lần giá chuyến bay);
+    # depart_from / depart_to là giờ (time) trong ngày đi
+    ref = refdata.get_snapshot()
+    departure_airport = ref.airport_by_name.get(departure)
+    arrival_airport = ref.airport_by_name.get(arrival)
+    if not departure_airport or not arrival_airport:
+        return None, "Airport not found"
+
+    route_ids = ref.routes_between.get((departure_airport.airport_id, arrival_airport.airport_id))
+    if not route_ids or not departure_date:
+        return SearchPage([], None), None
+
+    day = datetime.strptime(departure_date, '%Y-%m-%d').date()
+    conditions = [
+        Flight.flight_route_id.in_(route_ids),
+        Flight.f_dept_time >= datetime.combine(day, depart_from or datetime.min.time()),
+        Flight.f_dept_time <= datetime.combine(day, depart_to) if depart_to
+        else Flight.f_dept_time < datetime.combine(day + timedelta(days=1), datetime.min.time()),
+    ]
+
+    # Hãng bay -> các máy bay của hãng (tra trong snapshot), lọc trên cột plane_id
+    if airline_ids:
+        plane_ids = [p.plane_id for p in ref.planes.values() if p.company and p.company.com_id in airline_ids]
+        if not plane_ids:
+            return SearchPage([], None), None
+        conditions.append(Flight.plane_id.in_(plane_ids))
+    if flight_types:
+        conditions.append(Flight.flight_type.in_(flight_types))
+
+    factor = holds.PRICE_FACTOR[seat_class or SeatClass.ECONOMY]
+    if min_price is not None:
+        conditions.append(Flight.flight_price >= min_price / factor)
+    if max_price is not None:
+        conditions.append(Flight.flight_price <= max_price / factor)
+
+    # Tồn kho ghế economy / business nối theo khoá duy nhất (flight_id, seat_class): mỗi chuyến vẫn một dòng
+    economy, business = aliased(SeatInventory), aliased(SeatInventory)
+    if seat_class:
+        conditions.append(_available(business if seat_class == SeatClass.BUSINESS else economy) >= total_needed_seats)
+    else:
+        conditions.append(or_(_available(economy) >= total_needed_seats, _available(business) >= total_needed_seats))
+
+    key = SEARCH_SORTS[sort]
+    if after:
+        conditions.append(_after_keyset([key, Flight.flight_id], decode_search_cursor(after, sort), False))
+
+    page_size = page_size or app.config['PAGE_SIZE']
+    # Giá gốc và số ghế đã bán / tổng số ghế để tính giá hiện tại như trang tìm kiếm (pricing.quote_values)
+    rows = db.session.query(
+        Flight.flight_id, Flight.plane_id, Flight.flight_route_id, Flight.f_dept_time, Flight.flight_arr_time,
+        Flight.flight_duration, Flight.flight_type, Flight.flight_price, Flight.base_price,
+        _available(economy).label('economy_seats'), _available(business).label('business_seats'),
+        (_sold(economy) + _sold(business)).label('sold'),
+        (func.coalesce(economy.capacity, 0) + func.coalesce(business.capacity, 0)).label('capacity'),
+        key.label('sort_key')
+    ).outerjoin(
+        economy, and_(economy.flight_id == Flight.flight_id, economy.seat_class == SeatClass.ECONOMY)
+    ).outerjoin(
+        business, and_(business.flight_id == Flight.flight_id, business.seat_class == SeatClass.BUSINESS)
+    ).filter(
+        *conditions
+    ).order_by(
+        key, Flight.flight_id
+    ).limit(page_size + 1).all()
+
+    next_cursor = encode_search_cursor(rows[page_size - 1], sort) if len(rows) > page_size else None
+    return SearchPage(rows[:page_size], next_cursor), None
+
+
+# Các cách sắp xếp danh sách chuyến bay cho phân trang keyset: (cột khoá, giảm dần?)
+FLIGHT_ORDERS = {
+    'id': ([Flight.flight_id], True),
+    'departure': ([Flight.f_dept_time, Flight.flight_id], False),
+}
+
+FlightPage = namedtuple('FlightPage', ['flights', 'next_cursor', 'prev_cursor'])
+
+
+def encode_flight_cursor(flight, order):
+    if order == 'departure':
+        return f"{flight.f_dept_time.isoformat()}~{flight.flight_id}"
+    return str(flight.flight_id)
+
+
+def decode_flight_cursor(cursor, order):
+    try:
+        if order == 'departure':
+            dept_time, flight_id = cursor.split('~')
+            return [datetime.fromisoformat(dept_time), int(flight_id)]
+        return [int(cursor)]
+    except ValueError:
+        raise ValueError("Cursor không hợp lệ")
+
 
-    for flight in flights:
-        available_economy_seats = flight.available_economy_seats()  # Số ghế ECONOMY còn lại
-        available_business_seats = flight.available_business_seats()  # Số ghế BUSINESS còn lại
+def _after_keyset(columns, values, descending):
+    # (c1, c2) > (v1, v2) viết dưới dạng OR / AND để CSDL dùng được index trên các cột khoá
+    clauses = []
+    for i, (column, value) in enumerate(zip(columns, values)):
+        compare = column < value if descending else column > value
+        clauses.append(and_(*[c == v for c, v in zip(columns[:i], values[:i])], compare))
+    return or_(*clauses)
 
-        # Kiểm tra nếu có đủ ghế cho hành khách
-        if available_economy_seats >= total_needed_seats or available_business_seats >= total_needed_seats:
-            available_flights.append(flight)
 
-    return available_flights,None
+@routing.replica
+def get_flights(after=None, before=None, order='id', page_size=None):
+    # Phân trang keyset: chỉ đọc page_size + 1 dòng bắt đầu từ cursor thay vì OFFSET (page-1)*PAGE_SIZE
+    page_size = page_size or app.config['PAGE_SIZE']
+    columns, descending = FLIGHT_ORDERS[order]
+    backward = bool(before)  # ?before= rỗng thì đi tới như trang đầu
+    cursor = before if backward else after
+    direction = descending != backward
 
+    query = Flight.query.options(selectinload(Flight.seat_inventories))
+    if cursor:
+        query = query.filter(_after_keyset(columns, decode_flight_cursor(cursor, order), direction))
+    rows = query.order_by(
+        *[column.desc() if direction else column.asc() for column in columns]
+    ).limit(page_size + 1).all()
 
-def get_flights(page):
-    page_size = app.config['PAGE_SIZE']
-    if page < 1:
-        page = 1
-    start = (page - 1) * page_size
-    return (
-        Flight.query
-        .order_by(Flight.flight_id.desc())  # Use `.desc()` for descending order
-        .offset(start)
-        .limit(page_size)
-        .all()
-    )
+    has_more = len(rows) > page_size
+    flights = rows[:page_size]
+    if backward:
+        flights.reverse()
 
+    if not flights:
+        return FlightPage(flights, None, None)
+
+    # Đi lùi thì luôn còn trang sau (trang vừa rời khỏi); đi tới thì còn trang trước nếu có cursor
+    has_next = True if backward else has_more
+    has_prev = has_more if backward else bool(after)
+    return FlightPage(flights,
+                      encode_flight_cursor(flights[-1], order) if has_next else None,
+                      encode_flight_cursor(flights[0], order) if has_prev else None)
+
+
+# Số chuyến bay được lưu tạm trong tiến trình, FlightAdminView xoá cache khi thêm / xoá chuyến bay
+FLIGHT_COUNT_CACHE_SECONDS = 60
+_flight_count = None
+
+
+@routing.replica
 def count_flights():
-    return Flight.query.count()
+    global _flight_count
+    now = time.time()
+    if _flight_count is None or now - _flight_count[1] > FLIGHT_COUNT_CACHE_SECONDS:
+        _flight_count = (Flight.query.count(), now)
+    return _flight_count[0]
+
+
+def invalidate_flight_count():
+    global _flight_count
+    _flight_count = None
+
+
+def rebuild_seat_inventory(batch_size=1000, plane_ids=None):
+    # Dựng lại bảng SeatInventory cho tất cả chuyến bay (hoặc các chuyến của plane_ids) bằng 3 truy vấn gom nhóm
+    flights = [Flight.plane_id.in_(plane_ids)] if plane_ids is not None else []
+    capacity = {}
+    for flight_id, seat_class, total in db.session.query(
+            Flight.flight_id, Seat.seat_class, func.count(Seat.seat_id)
+    ).join(Seat, Seat.plane_id == Flight.plane_id).filter(*flights).group_by(Flight.flight_id, Seat.seat_class):
+        capacity[(flight_id, seat_class)] = total
+
+    booked = {}
+    for flight_id, seat_class, total in db.session.query(
+            Ticket.flight_id, Seat.seat_class, func.count(Ticket.ticket_id)
+    ).join(Seat, Seat.seat_id == Ticket.seat_id).join(Flight, Flight.flight_id == Ticket.flight_id).filter(
+        Ticket.ticket_status == True, *flights
+    ).group_by(Ticket.flight_id, Seat.seat_class):
+        booked[(flight_id, seat_class)] = total
+
+    # Giữ chỗ chưa bị dọn (kể cả đã hết hạn) vẫn được tính cho tới khi holds.release_expired trả lại
+    held = {}
+    for flight_id, seat_class, total in db.session.query(
+            SeatHold.flight_id, SeatHold.seat_class, func.sum(SeatHold.quantity)
+    ).join(Flight, Flight.flight_id == SeatHold.flight_id).filter(*flights).group_by(
+        SeatHold.flight_id, SeatHold.seat_class):
+        held[(flight_id, seat_class)] = total
+
+    flight_ids = [flight_id for (flight_id,) in db.session.query(Flight.flight_id).filter(*flights)]
+    rows = [
+        {'flight_id': flight_id, 'seat_class': seat_class,
+         'capacity': capacity.get((flight_id, seat_class), 0),
+         'booked': booked.get((flight_id, seat_class), 0),
+         'held': held.get((flight_id, seat_class), 0)}
+        for flight_id in flight_ids
+        for seat_class in SeatClass
+    ]
+
+    if plane_ids is None:
+        SeatInventory.query.delete()
+    else:
+        for i in range(0, len(flight_ids), batch_size):
+            SeatInventory.query.filter(SeatInventory.flight_id.in_(flight_ids[i:i + batch_size])).delete(
+                synchronize_session=False)
+    for i in range(0, len(rows), batch_size):
+        db.session.execute(insert(SeatInventory), rows[i:i + batch_size])
+    db.session.commit()
+    farecalendar.invalidate()
 
+    return len(rows)
+
+@routing.replica
 def get_tiket_statistics():
-    # Thống kê doanh thu theo tháng
+    # Thống kê doanh thu theo tháng, đọc từ bảng tổng hợp MonthlyRevenue
     stats2 = db.session.query(
-        func.date_format(Ticket.issue_date, "%Y-%m").label("month"),
-        func.sum(Ticket.ticket_price).label("monthly_revenue")
+        MonthlyRevenue.month,
+        MonthlyRevenue.revenue.label("monthly_revenue")
     ).filter(
-        Ticket.ticket_status == True
-    ).group_by(
-        func.date_format(Ticket.issue_date, "%Y-%m")
+        MonthlyRevenue.ticket_count > 0
     ).order_by(
-        func.date_format(Ticket.issue_date, "%Y-%m")
+        MonthlyRevenue.month
     ).all()
 
     return  stats2
 
-def get_flight_statistics():
-    # Aliases cho các bảng sân bay
-    departure_airport = db.aliased(Airport)
-    arrival_airport = db.aliased(Airport)
-
-    # Thống kê doanh thu theo tuyến bay
-    stats = db.session.query(
-        FlightRoute.fr_id.label("id"),
-        func.concat(
-            departure_airport.airport_name,
-            " - ",
-            arrival_airport.airport_name
-        ).label("route_name"),
-        func.sum(Ticket.ticket_price).label("revenue")
-    ).select_from(
-        FlightRoute
-    ).join(
-        departure_airport, FlightRoute.departure_airport_id == departure_airport.airport_id
-    ).join(
-        arrival_airport, FlightRoute.arrival_airport_id == arrival_airport.airport_id
-    ).join(
-        Flight, Flight.flight_route_id == FlightRoute.fr_id
-    ).join(
-        Ticket, Ticket.flight_id == Flight.flight_id
+@routing.replica
+def get_daily_statistics(start_date, end_date):
+    # Doanh thu và số vé theo ngày trong khoảng [start_date, end_date]
+    return db.session.query(
+        DailyRevenue.day,
+        DailyRevenue.ticket_count,
+        DailyRevenue.revenue
     ).filter(
-        Ticket.ticket_status == True
-    ).group_by(
-        FlightRoute.fr_id,
-        departure_airport.airport_name,
-        arrival_airport.airport_name
+        DailyRevenue.day >= start_date,
+        DailyRevenue.day <= end_date,
+        DailyRevenue.ticket_count > 0
     ).order_by(
-        func.sum(Ticket.ticket_price).desc()
+        DailyRevenue.day
     ).all()
 
-    return stats
+RouteStat = namedtuple('RouteStat', ['id', 'route_name', 'value'])
 
-def ticket_stats():
-    # Aliases cho các bảng sân bay
-    departure_airport = db.aliased(Airport)
-    arrival_airport = db.aliased(Airport)
 
-    # Thống kê doanh thu theo tuyến bay
-    stats = db.session.query(
-        FlightRoute.fr_id.label("id"),
-        func.concat(
-            departure_airport.airport_name,
-            " - ",
-            arrival_airport.airport_name
-        ).label("route_name"),
-        func.count(Ticket.ticket_id).label("ticket_count")  # Đếm số lượng vé
-    ).select_from(
-        FlightRoute
-    ).join(
-        departure_airport, FlightRoute.departure_airport_id == departure_airport.airport_id
-    ).join(
-        arrival_airport, FlightRoute.arrival_airport_id == arrival_airport.airport_id
-    ).join(
-        Flight, Flight.flight_route_id == FlightRoute.fr_id
-    ).join(
-        Ticket, Ticket.flight_id == Flight.flight_id
+def _route_name(ref, fr_id):
+    route = ref.routes.get(fr_id)
+    if not route:
+        return f"Route {fr_id}"
+    return f"{route.departure_airport.airport_name} - {route.arrival_airport.airport_name}"
+
+
+@routing.replica
+def _route_statistics(column):
+    # Đọc bảng tổng hợp RouteRevenue (một dòng / tuyến), tên tuyến lấy từ snapshot dữ liệu gốc
+    ref = refdata.get_snapshot()
+    rows = db.session.query(
+        RouteRevenue.fr_id, column
     ).filter(
-        Ticket.ticket_status == True
-    ).group_by(
-        FlightRoute.fr_id,
-        departure_airport.airport_name,
-        arrival_airport.airport_name
+        RouteRevenue.ticket_count > 0
     ).order_by(
-        func.sum(Ticket.ticket_price).desc()
+        RouteRevenue.revenue.desc()
     ).all()
 
-    return stats
+    return [RouteStat(fr_id, _route_name(ref, fr_id), value) for fr_id, value in rows]
+
+def get_flight_statistics():
+    # Thống kê doanh thu theo tuyến bay
+    return _route_statistics(RouteRevenue.revenue)
+
+def ticket_stats():
+    # Thống kê số lượng vé theo tuyến bay
+    return _route_statistics(RouteRevenue.ticket_count)
 
 
+def rebuild_revenue_rollups(batch_size=1000):
+    # Dựng lại DailyRevenue, MonthlyRevenue, RouteRevenue từ bảng Ticket (một truy vấn gom nhóm)
+    daily, monthly, by_route = {}, {}, {}
+    for issue_date, fr_id, ticket_count, revenue in db.session.query(
+            Ticket.issue_date, Flight.flight_route_id, func.count(Ticket.ticket_id), func.sum(Ticket.ticket_price)
+    ).join(Flight, Flight.flight_id == Ticket.flight_id).filter(
+        Ticket.ticket_status == True
+    ).group_by(Ticket.issue_date, Flight.flight_route_id):
+        for totals, key in ((daily, issue_date), (monthly, issue_date.strftime('%Y-%m')), (by_route, fr_id)):
+            count, total = totals.get(key, (0, 0))
+            totals[key] = (count + ticket_count, total + (revenue or 0))
+
+    for model, totals, key_name in ((DailyRevenue, daily, 'day'), (MonthlyRevenue, monthly, 'month'),
+                                    (RouteRevenue, by_route, 'fr_id')):
+        model.query.delete()
+        rows = [{key_name: key, 'ticket_count': count, 'revenue': revenue}
+                for key, (count, revenue) in totals.items()]
+        for i in range(0, len(rows), batch_size):
+            db.session.execute(insert(model), rows[i:i + batch_size])
+    db.session.commit()
 
+    return len(daily), len(monthly), len(by_route)
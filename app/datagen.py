@@ -0,0 +1,257 @@
+import hashlib
+import math
+import random
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from sqlalchemy import insert, func
+from app import db, dao, refdata, seatmap, analytics, holds
+from app.models import (User, UserRole, Airport, Company, Plane, Seat, SeatClass, FlightRoute, Flight, FlightType,
+                        Booking, Ticket, Payment, Cancellation, CustomerInfo)
+
+# (tên sân bay, địa chỉ, vĩ độ, kinh độ); các sân bay đầu danh sách là sân bay trung chuyển lớn
+AIRPORTS = [
+    ('Noi Bai International Airport', 'Hanoi, Vietnam', 21.22, 105.81),
+    ('Tan Son Nhat International Airport', 'Ho Chi Minh, Vietnam', 10.82, 106.66),
+    ('Da Nang International Airport', 'Da Nang, Vietnam', 16.05, 108.20),
+    ('Changi Airport', 'Singapore', 1.36, 103.99),
+    ('Suvarnabhumi Airport', 'Bangkok, Thailand', 13.69, 100.75),
+    ('Incheon International Airport', 'Seoul, South Korea', 37.46, 126.44),
+    ('Narita International Airport', 'Tokyo, Japan', 35.77, 140.39),
+    ('Taoyuan International Airport', 'Taipei, Taiwan', 25.08, 121.23),
+    ('Cam Ranh International Airport', 'Nha Trang, Vietnam', 11.99, 109.22),
+    ('Phu Quoc International Airport', 'Phu Quoc, Vietnam', 10.17, 103.99),
+    ('Cat Bi International Airport', 'Hai Phong, Vietnam', 20.82, 106.72),
+    ('Kuala Lumpur International Airport', 'Kuala Lumpur, Malaysia', 2.75, 101.71),
+    ('Soekarno-Hatta International Airport', 'Jakarta, Indonesia', -6.13, 106.66),
+    ('Ninoy Aquino International Airport', 'Manila, Philippines', 14.51, 121.02),
+    ('Hong Kong International Airport', 'Hong Kong', 22.31, 113.91),
+    ('Phu Bai International Airport', 'Hue, Vietnam', 16.40, 107.70),
+    ('Vinh International Airport', 'Vinh, Vietnam', 18.74, 105.67),
+    ('Lien Khuong Airport', 'Da Lat, Vietnam', 11.75, 108.37),
+    ('Can Tho International Airport', 'Can Tho, Vietnam', 10.09, 105.71),
+    ('Buon Ma Thuot Airport', 'Buon Ma Thuot, Vietnam', 12.67, 108.12),
+    ('Phnom Penh International Airport', 'Phnom Penh, Cambodia', 11.55, 104.84),
+    ('Wattay International Airport', 'Vientiane, Laos', 17.99, 102.56),
+    ('Kansai International Airport', 'Osaka, Japan', 34.43, 135.24),
+    ('Gimhae International Airport', 'Busan, South Korea', 35.18, 128.94),
+    ('Baiyun International Airport', 'Guangzhou, China', 23.39, 113.30),
+]
+COMPANIES = [
+    ('Vietnam Airlines', 'Vietnam'), ('VietJet Air', 'Vietnam'), ('Bamboo Airways', 'Vietnam'),
+    ('Korean Air', 'South Korea'), ('Singapore Airlines', 'Singapore'), ('Thai Airways', 'Thailand'),
+    ('Japan Airlines', 'Japan'), ('EVA Air', 'Taiwan'), ('Malaysia Airlines', 'Malaysia'),
+    ('Cathay Pacific', 'Hong Kong'),
+]
+PLANE_MODELS = [('Airbus A321', 'A321'), ('Airbus A350', 'A350'), ('Boeing 737', 'B737'),
+                ('Boeing 787', 'B787'), ('Embraer 190', 'E190')]
+LAST_NAMES = ['Nguyen', 'Tran', 'Le', 'Pham', 'Hoang', 'Huynh', 'Phan', 'Vu', 'Vo', 'Dang', 'Bui', 'Do', 'Ho', 'Ngo']
+FIRST_NAMES = ['An', 'Binh', 'Chi', 'Dung', 'Giang', 'Ha', 'Hai', 'Hoa', 'Hung', 'Khanh', 'Lan', 'Linh', 'Long',
+               'Mai', 'Minh', 'Nam', 'Ngoc', 'Phuong', 'Quang', 'Son', 'Thao', 'Trang', 'Trung', 'Tuan', 'Yen']
+
+# Quy mô cho scale = 1; số chuyến bay / vé tăng tuyến tính theo scale
+USERS_PER_SCALE = 500
+PLANES_PER_SCALE = 20
+ROUTES_PER_SCALE = 30
+BATCH_SIZE = 5000
+CANCEL_RATE = 0.03
+UNPAID_BOOKING_RATE = 0.05
+# Tỉ lệ đơn bán tại quầy (vé có CustomerInfo), còn lại là mua online
+COUNTER_SALE_RATE = 0.15
+
+
+def _distance(a, b):
+    # Khoảng cách đường tròn lớn (km) giữa hai sân bay
+    lat1, lon1, lat2, lon2 = map(math.radians, (a[2], a[3], b[2], b[3]))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return round(2 * 6371 * math.asin(math.sqrt(h)), 0)
+
+
+def _next_id(column):
+    # Sinh id tường minh nối tiếp dữ liệu đang có để bulk insert không cần đọc lại khoá chính
+    return (db.session.query(func.max(column)).scalar() or 0) + 1
+
+
+class _BulkWriter:
+    # Gom các dòng theo bảng và ghi bằng executemany; luôn ghi theo thứ tự khoá ngoại
+    ORDER = [User, Airport, Company, Plane, Seat, FlightRoute, Flight, Payment, Cancellation, Booking, CustomerInfo,
+             Ticket]
+
+    def __init__(self):
+        self.rows = defaultdict(list)
+        self.counts = defaultdict(int)
+
+    def add(self, model, row):
+        self.rows[model].append(row)
+        if len(self.rows[model]) >= BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        for model in self.ORDER:
+            rows = self.rows.pop(model, None)
+            if rows:
+                db.session.execute(insert(model), rows)
+                self.counts[model.__tablename__] += len(rows)
+        db.session.commit()
+
+
+def generate(scale=1, seed=42, start=None, days=90, history=30, progress=None):
+    rng = random.Random(seed)
+    # Kênh bán dùng bộ sinh số riêng để các bảng khác vẫn giống hệt dữ liệu sinh ra trước đây với cùng seed
+    channel_rng = random.Random(seed + 1)
+    start = start or date.today()
+    writer = _BulkWriter()
+
+    # Người dùng (khách hàng); mật khẩu giống dữ liệu mẫu trong models.py
+    password = hashlib.md5('customer123'.encode('utf-8')).hexdigest()
+    first_user = _next_id(User.id)
+    user_ids = range(first_user, first_user + USERS_PER_SCALE * scale)
+    for user_id in user_ids:
+        writer.add(User, {
+            'id': user_id, 'name': f"{rng.choice(LAST_NAMES)} {rng.choice(FIRST_NAMES)}",
+            'username': f"customer{user_id}", 'password': password, 'email': f"customer{user_id}@example.com",
+            'dob': date(1960, 1, 1) + timedelta(days=rng.randrange(365 * 45)), 'gender': rng.random() < 0.5,
+            'user_role': UserRole.CUSTOMER
+        })
+
+    # Sân bay: danh sách thật, thêm sân bay giả lập quanh khu vực khi scale lớn
+    airports = list(AIRPORTS)
+    while len(airports) < 10 + 5 * scale:
+        n = len(airports) + 1
+        airports.append((f"Regional Airport {n}", f"Regional City {n}, Vietnam",
+                         rng.uniform(8.5, 23.0), rng.uniform(102.5, 109.5)))
+    airports = airports[:10 + 5 * scale]
+    first_airport = _next_id(Airport.airport_id)
+    for i, (name, address, _, _) in enumerate(airports):
+        writer.add(Airport, {'airport_id': first_airport + i, 'airport_name': name, 'airport_address': address,
+                             'airport_image': f"https://example.com/airport_{first_airport + i}.jpg"})
+
+    first_company = _next_id(Company.com_id)
+    companies = COMPANIES[:min(len(COMPANIES), 4 + scale)]
+    for i, (name, country) in enumerate(companies):
+        writer.add(Company, {'com_id': first_company + i, 'com_name': name, 'com_country': country})
+
+    # Máy bay kèm đầy đủ sơ đồ ghế theo seatmap.SEAT_LAYOUTS
+    plane_seats = {}
+    plane_id = _next_id(Plane.plane_id)
+    seat_id = _next_id(Seat.seat_id)
+    for _ in range(PLANES_PER_SCALE * scale):
+        plane_name, layout = rng.choice(PLANE_MODELS)
+        seats = seatmap.layout_seats(layout)
+        writer.add(Plane, {'plane_id': plane_id, 'plane_name': plane_name, 'total_seat': len(seats),
+                           'company_id': first_company + rng.randrange(len(companies)), 'seat_layout': layout})
+        plane_seats[plane_id] = []
+        for seat_number, seat_code, seat_class in seats:
+            writer.add(Seat, {'seat_id': seat_id, 'seat_number': seat_number, 'seat_code': seat_code,
+                              'seat_class': seat_class, 'seat_status': False, 'plane_id': plane_id})
+            plane_seats[plane_id].append((seat_id, seat_class))
+            seat_id += 1
+        plane_id += 1
+
+    # Tuyến bay hai chiều, ưu tiên các cặp sân bay trung chuyển (đầu danh sách)
+    pairs = sorted(((rng.random() * (i + 1) * (j + 1), i, j)
+                    for i in range(len(airports)) for j in range(i + 1, len(airports))))
+    routes = []
+    fr_id = _next_id(FlightRoute.fr_id)
+    for _, i, j in pairs[:ROUTES_PER_SCALE * scale // 2]:
+        distance = _distance(airports[i], airports[j])
+        for dep, arr in ((i, j), (j, i)):
+            writer.add(FlightRoute, {'fr_id': fr_id, 'departure_airport_id': first_airport + dep,
+                                     'arrival_airport_id': first_airport + arr, 'distance': distance,
+                                     'description': f"{airports[dep][1].split(',')[0]} to "
+                                                    f"{airports[arr][1].split(',')[0]}"})
+            # Tuyến giữa hai sân bay lớn có nhiều chuyến mỗi ngày hơn
+            routes.append((fr_id, distance, max(1, 4 - (i + j) // 6)))
+            fr_id += 1
+
+    flight_id = _next_id(Flight.flight_id)
+    ticket_id = _next_id(Ticket.ticket_id)
+    payment_id = _next_id(Payment.payment_id)
+    cancellation_id = _next_id(Cancellation.id)
+    booking_id = _next_id(Booking.booking_id)
+    customer_id = _next_id(CustomerInfo.customer_id)
+    plane_ids = list(plane_seats)
+
+    for offset in range(-history, days):
+        day = start + timedelta(days=offset)
+        for fr_id, distance, per_day in routes:
+            for _ in range(per_day):
+                dept_time = datetime.combine(day, datetime.min.time()) + timedelta(
+                    hours=rng.randint(5, 22), minutes=5 * rng.randrange(12))
+                duration = round(distance / 800 + 0.5, 2)
+                price = round((30 + distance * 0.12) * rng.uniform(0.8, 1.3), 0)
+                plane_id = rng.choice(plane_ids)
+                writer.add(Flight, {'flight_id': flight_id, 'f_dept_time': dept_time,
+                                    'flight_arr_time': dept_time + timedelta(hours=duration),
+                                    'flight_duration': duration, 'flight_price': price,
+                                    'flight_type': FlightType.DIRECT, 'flight_route_id': fr_id, 'plane_id': plane_id})
+
+                # Tỉ lệ lấp đầy giảm dần với các chuyến còn xa ngày bay
+                seats = plane_seats[plane_id]
+                load = rng.uniform(0.55, 0.95) * (1 if offset <= 0 else max(0.1, 1 - offset / days))
+                taken = rng.sample(seats, int(len(seats) * load))
+                i = 0
+                while i < len(taken):
+                    # Mỗi đơn hàng 1-4 ghế của cùng một người dùng, thanh toán một lần
+                    size = rng.randint(1, 4)
+                    order = taken[i:i + size]
+                    i += size
+                    user_id = rng.choice(user_ids)
+                    issue_date = min(start, day - timedelta(days=rng.randint(1, 60)))
+                    # Giá vé theo hạng ghế như khi đặt vé trong app
+                    prices = [price * holds.PRICE_FACTOR[seat_class] for _, seat_class in order]
+                    cancelled = rng.random() < CANCEL_RATE
+                    counter_customer = None
+                    if channel_rng.random() < COUNTER_SALE_RATE:
+                        counter_customer = customer_id
+                        writer.add(CustomerInfo, {'customer_id': customer_id,
+                                                  'first_name': channel_rng.choice(FIRST_NAMES),
+                                                  'last_name': channel_rng.choice(LAST_NAMES),
+                                                  'phone_number': f"09{channel_rng.randrange(10 ** 8):08d}",
+                                                  'email': f"guest{customer_id}@example.com"})
+                        customer_id += 1
+                    writer.add(Payment, {'payment_id': payment_id, 'payment_card_no': f"{rng.randrange(10 ** 16):016d}",
+                                         'payment_type': rng.random() < 0.7, 'payment_date': issue_date,
+                                         'payment_cost': sum(prices), 'user_id': user_id})
+                    if cancelled:
+                        writer.add(Cancellation, {'id': cancellation_id, 'refund': round(sum(prices) * 0.7, 2),
+                                                  'date': min(day, issue_date + timedelta(days=rng.randint(0, 7))),
+                                                  'payment_id': payment_id, 'user_id': user_id})
+                        cancellation_id += 1
+                    for (seat, _), ticket_price in zip(order, prices):
+                        writer.add(Booking, {'booking_id': booking_id, 'book_date': datetime.combine(
+                            issue_date, datetime.min.time()), 'booking_status': True, 'group_size': len(order),
+                                             'user_id': user_id, 'flight_id': flight_id, 'seat_id': seat})
+                        writer.add(Ticket, {'ticket_id': ticket_id, 'issue_date': issue_date,
+                                            'ticket_price': ticket_price, 'ticket_status': not cancelled,
+                                            'ticket_gate': rng.randint(1, 20), 'user_id': user_id,
+                                            'flight_id': flight_id, 'seat_id': seat,
+                                            'customer_id': counter_customer})
+                        booking_id += 1
+                        ticket_id += 1
+                    payment_id += 1
+
+                # Một ít chỗ đã đặt nhưng chưa thanh toán trên các chuyến sắp bay
+                if offset > 0 and rng.random() < UNPAID_BOOKING_RATE:
+                    taken_ids = {seat for seat, _ in taken}
+                    free = [seat for seat, _ in seats if seat not in taken_ids]
+                    if free:
+                        writer.add(Booking, {'booking_id': booking_id, 'book_date': datetime.combine(
+                            start, datetime.min.time()), 'booking_status': False, 'group_size': 1,
+                                             'user_id': rng.choice(user_ids), 'flight_id': flight_id,
+                                             'seat_id': rng.choice(free)})
+                        booking_id += 1
+                flight_id += 1
+
+        if progress:
+            progress(day, dict(writer.counts))
+
+    writer.flush()
+
+    # Bulk insert không kích hoạt các mapper event nên dựng lại dữ liệu dẫn xuất một lần
+    dao.rebuild_seat_inventory()
+    dao.rebuild_revenue_rollups()
+    dao.invalidate_flight_count()
+    refdata.invalidate()
+    analytics.invalidate()
+
+    return dict(writer.counts)
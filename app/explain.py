@@ -0,0 +1,107 @@
+import re
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app import db, dao, bench, sqlstats, itinerary, pricing
+
+# Chạy các câu SQL đọc của dao (qua các ca đo của bench) rồi EXPLAIN từng câu để tìm full scan và sort ngoài index
+Report = namedtuple('Report', ['case', 'statement', 'plan', 'problems'])
+
+# Bảng danh mục được đọc toàn bộ một lần vào snapshot trong bộ nhớ (refdata) và các bảng tổng hợp nhỏ
+# (một dòng / tháng hoặc / tuyến): full scan hay sort trên các bảng này là chấp nhận được
+FULL_SCAN_OK = {'airport', 'company', 'plane', 'flight_route', 'monthly_revenue', 'route_revenue',
+                'route_demand'}
+
+EXTRA_CASES = [
+    bench.Case('dao.get_flights(departure)', lambda ctx: dao.get_flights(order='departure'), 2),
+    bench.Case('dao.get_daily_statistics', lambda ctx: dao.get_daily_statistics(
+        date.today() - timedelta(days=30), date.today()), 1),
+    bench.Case('itinerary.search_itineraries', lambda ctx: itinerary.search_itineraries(
+        ctx['departure'], ctx['arrival'], ctx['date'], 1), 4),
+    bench.Case('pricing._future_flights', lambda ctx: pricing._future_flights(datetime.now()), 1),
+]
+
+
+def capture(cases=None):
+    # Các câu SELECT khác nhau (theo fingerprint) kèm tham số thật của lần chạy đầu tiên
+    from app import index  # đăng ký các route (trang admin đã gắn trong create_app nếu bật)
+    ctx = bench._context()
+    statements, current = {}, [None]
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith('SELECT'):
+            statements.setdefault(sqlstats.fingerprint(statement), (current[0], statement, parameters))
+
+    event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        for case in cases or bench.CASES + EXTRA_CASES:
+            if case.name.startswith('GET /admin') and ctx['admin_client'] is None:
+                continue
+            current[0] = case.name
+            case.run(ctx)
+            db.session.remove()
+    finally:
+        event.remove(Engine, 'before_cursor_execute', before_cursor_execute)
+    return list(statements.values())
+
+
+def _explain_mysql(conn, statement, parameters):
+    rows = conn.exec_driver_sql('EXPLAIN ' + statement, parameters).mappings().all()
+    plan, problems = [], []
+    for row in rows:
+        table, extra = row['table'], row.get('Extra') or ''
+        plan.append(f"{table}: type={row['type']} key={row['key']} rows={row['rows']} {extra}".rstrip())
+        if row['type'] == 'ALL' and table not in FULL_SCAN_OK:
+            problems.append(f"full scan on {table} (~{row['rows']} rows)")
+        # Sort trên vài dòng của một khoảng index (type=range/ref) là rẻ; chỉ báo khi phải sort cả bảng / cả index
+        if 'Using filesort' in extra and row['type'] in ('ALL', 'index') and table not in FULL_SCAN_OK:
+            problems.append(f"filesort on {table}")
+    return plan, problems
+
+
+def _explain_sqlite(conn, statement, parameters):
+    rows = conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).all()
+    plan = [row[-1] for row in rows]
+    # Sort trên vài dòng của một khoảng index (SEARCH) là rẻ; chỉ báo khi phải sort kết quả quét cả bảng / cả index
+    scanned = {m.group(1) for m in (re.match(r'SCAN (\w+)', detail) for detail in plan) if m}
+    sorted_in_memory = any('USE TEMP B-TREE FOR ORDER BY' in detail for detail in plan)
+    # Trang keyset (ORDER BY theo index + LIMIT) cũng hiện là 'SCAN' nhưng dừng sau LIMIT dòng
+    bounded = not sorted_in_memory and re.search(r'\bLIMIT\b', statement, re.I)
+    problems = []
+    for detail in plan:
+        # 'SCAN flight' là quét cả bảng; 'SCAN flight USING INDEX ...' là duyệt theo index
+        scan = re.match(r'SCAN (\w+)(?: AS \w+)?$', detail)
+        if scan and scan.group(1) not in FULL_SCAN_OK and not bounded:
+            problems.append(f"full scan on {scan.group(1)}")
+    if sorted_in_memory and not scanned <= FULL_SCAN_OK:
+        problems.append("sort without index (ORDER BY)")
+    return plan, problems
+
+
+EXPLAINERS = {'mysql': _explain_mysql, 'sqlite': _explain_sqlite}
+
+
+def run(cases=None):
+    explainer = EXPLAINERS.get(db.engine.dialect.name)
+    if explainer is None:
+        raise RuntimeError(f"EXPLAIN is not supported for {db.engine.dialect.name}")
+    reports = []
+    with db.engine.connect() as conn:
+        for case, statement, parameters in capture(cases):
+            plan, problems = explainer(conn, statement, parameters)
+            reports.append(Report(case, statement, plan, problems))
+    return reports
+
+
+def format_reports(reports, verbose=False):
+    lines = []
+    for r in reports:
+        if not r.problems and not verbose:
+            continue
+        lines.append(f"[{r.case}] {' '.join(r.statement.split())[:160]}")
+        lines += [f"    {step}" for step in r.plan]
+        lines += [f"  ! {problem}" for problem in r.problems]
+    flagged = sum(1 for r in reports if r.problems)
+    lines.append(f"{len(reports)} statements explained, {flagged} flagged.")
+    return '\n'.join(lines)
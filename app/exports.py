@@ -0,0 +1,128 @@
+import csv
+from datetime import datetime, date
+from enum import Enum
+from itertools import islice
+from flask_admin._compat import csv_encode
+from app import routing
+
+# pyarrow import khá nặng: chỉ nạp khi xuất arrow / parquet lần đầu, không phải lúc khởi động app
+pa = pq = None
+
+# Số đối tượng ORM được đọc (và giữ trong bộ nhớ) mỗi lần, cũng là số dòng của mỗi record batch / row group
+BATCH_SIZE = 5000
+MIMETYPES = {
+    'csv': 'text/csv',
+    'arrow': 'application/vnd.apache.arrow.stream',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+def export_types():
+    return list(MIMETYPES)
+
+
+def _load_pyarrow():
+    global pa, pq
+    if pq is None:
+        import pyarrow
+        import pyarrow.parquet
+        pa, pq = pyarrow, pyarrow.parquet
+
+
+class _Echo:
+    # csv.writer ghi vào đây và nhận lại đúng dòng vừa ghi
+    def write(self, value):
+        return value
+
+
+class _Sink:
+    # File-like nhận bytes từ writer của pyarrow; generator lấy phần đã ghi ra sau mỗi lô
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def _batches(query, batch_size):
+    # yield_per: server-side cursor, mỗi lần chỉ nạp batch_size dòng. Câu SELECT chạy trên replica (nếu có) và
+    # từng lô được đọc trong use_replica(), nhưng không giữ ngữ cảnh đó qua yield: nó sẽ lọt sang code đang
+    # tiêu thụ generator (các câu SQL khác của request cũng bị gửi tới replica)
+    with routing.use_replica():
+        rows = iter(query.yield_per(batch_size))
+    while True:
+        with routing.use_replica():
+            batch = list(islice(rows, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def _csv_chunks(view, query, batch_size):
+    writer = csv.writer(_Echo())
+    yield writer.writerow([csv_encode(label) for _, label in view._export_columns])
+    for batch in _batches(query, batch_size):
+        yield ''.join(writer.writerow([csv_encode(view.get_export_value(row, name))
+                                       for name, _ in view._export_columns]) for row in batch)
+
+
+ARROW_TYPES = {int: 'int64', float: 'float64', bool: 'bool_', datetime: 'timestamp', date: 'date32'}
+
+
+def _arrow_column(view, name):
+    # Cột của bảng giữ nguyên kiểu dữ liệu; các cột khác (quan hệ, thuộc tính tính toán) xuất dạng chuỗi như CSV
+    column = view.model.__table__.c.get(name)
+    try:
+        python_type = column.type.python_type if column is not None else None
+    except NotImplementedError:
+        python_type = None
+
+    if python_type in ARROW_TYPES:
+        arrow_type = pa.timestamp('us') if python_type is datetime else getattr(pa, ARROW_TYPES[python_type])()
+        return arrow_type, lambda row: getattr(row, name)
+
+    def value(row):
+        if column is not None:
+            raw = getattr(row, name)
+            return raw.name if isinstance(raw, Enum) else (None if raw is None else str(raw))
+        return csv_encode(view.get_export_value(row, name))
+    return pa.string(), value
+
+
+def _columnar_chunks(view, query, export_type, batch_size):
+    _load_pyarrow()
+    columns = [(label, *_arrow_column(view, name)) for name, label in view._export_columns]
+    schema = pa.schema([pa.field(label, arrow_type) for label, arrow_type, _ in columns])
+    sink = _Sink()
+    writer = pa.ipc.new_stream(sink, schema) if export_type == 'arrow' else pq.ParquetWriter(sink, schema)
+    for batch in _batches(query, batch_size):
+        writer.write_table(pa.Table.from_pydict(
+            {label: [value(row) for row in batch] for label, _, value in columns}, schema=schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def generate(view, query, export_type, batch_size=BATCH_SIZE):
+    # Các khối dữ liệu của file xuất, sinh dần theo từng lô để bộ nhớ không tăng theo kích thước bảng
+    if export_type == 'csv':
+        return _csv_chunks(view, query, batch_size)
+    return _columnar_chunks(view, query, export_type, batch_size)
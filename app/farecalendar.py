@@ -0,0 +1,129 @@
+import threading
+import time
+from datetime import datetime, date, timedelta
+from sqlalchemy import event, func, select, inspect
+from app import db, refdata, routing
+from app.models import Flight, SeatInventory, SeatClass, Ticket
+
+DEFAULT_DAYS = 30
+MAX_DAYS = 60
+# Kết quả được giữ theo cặp sân bay; worker có thay đổi tự xoá ngay, các worker khác thấy giá mới sau tối đa
+# khoảng thời gian này
+CACHE_SECONDS = 300
+CACHE_SIZE = 500
+
+_cache = {}  # (sân bay đi, sân bay đến, ngày bắt đầu, số ngày, số khách) -> (thời điểm tính, route_ids, kết quả)
+_lock = threading.Lock()
+
+
+@routing.replica
+def _lowest_fares(route_ids, start, days, passengers):
+    # Một câu SQL gom nhóm trên khoảng giờ khởi hành [start, start + days): giá thấp nhất theo ngày và hạng ghế,
+    # chỉ tính chuyến còn đủ ghế trống
+    day = func.date(Flight.f_dept_time)
+    rows = db.session.query(
+        day, SeatInventory.seat_class, func.min(Flight.flight_price)
+    ).join(
+        SeatInventory, SeatInventory.flight_id == Flight.flight_id
+    ).filter(
+        Flight.flight_route_id.in_(route_ids),
+        Flight.f_dept_time >= datetime.combine(start, datetime.min.time()),
+        Flight.f_dept_time < datetime.combine(start + timedelta(days=days), datetime.min.time()),
+        SeatInventory.capacity - SeatInventory.booked - SeatInventory.held >= passengers
+    ).group_by(day, SeatInventory.seat_class).all()
+
+    fares = {}
+    for d, seat_class, price in rows:
+        # MySQL trả về date, SQLite trả về chuỗi 'YYYY-MM-DD'
+        d = d if isinstance(d, date) else date.fromisoformat(d)
+        fares.setdefault(d, {})[seat_class] = price
+    return fares
+
+
+def get_calendar(departure, arrival, start=None, days=DEFAULT_DAYS, passengers=1):
+    from app.holds import PRICE_FACTOR  # holds báo thay đổi giữ chỗ cho module này
+
+    ref = refdata.get_snapshot()
+    departure_airport = ref.airport_by_name.get(departure)
+    arrival_airport = ref.airport_by_name.get(arrival)
+    if not departure_airport or not arrival_airport:
+        return None
+
+    start = start or date.today()
+    days = max(1, min(days, MAX_DAYS))
+    key = (departure_airport.airport_id, arrival_airport.airport_id, start, days, passengers)
+    cached = _cache.get(key)
+    if cached and time.time() - cached[0] < CACHE_SECONDS:
+        return cached[2]
+
+    route_ids = ref.routes_between.get(key[:2], ())
+    fares = _lowest_fares(route_ids, start, days, passengers) if route_ids else {}
+
+    calendar = []
+    for i in range(days):
+        d = start + timedelta(days=i)
+        prices = fares.get(d, {})
+        economy = prices.get(SeatClass.ECONOMY)
+        business = prices.get(SeatClass.BUSINESS)
+        calendar.append({
+            'date': d.isoformat(),
+            'economy': economy * PRICE_FACTOR[SeatClass.ECONOMY] if economy is not None else None,
+            'business': business * PRICE_FACTOR[SeatClass.BUSINESS] if business is not None else None,
+        })
+    economy_days = [c for c in calendar if c['economy'] is not None]
+    result = {
+        'departure': departure_airport.airport_name,
+        'arrival': arrival_airport.airport_name,
+        'start': start.isoformat(),
+        'days': days,
+        'calendar': calendar,
+        'cheapest': min(economy_days, key=lambda c: c['economy'])['date'] if economy_days else None,
+    }
+
+    with _lock:
+        if len(_cache) >= CACHE_SIZE:
+            _cache.pop(next(iter(_cache)))
+        _cache[key] = (time.time(), set(route_ids), result)
+    return result
+
+
+def invalidate_routes(route_ids):
+    route_ids = set(route_ids)
+    with _lock:
+        for key in [key for key, (_, cached_routes, _) in _cache.items() if cached_routes & route_ids]:
+            del _cache[key]
+
+
+def invalidate():
+    with _lock:
+        _cache.clear()
+
+
+def flights_changed(flight_ids, connection=None):
+    # Tồn kho ghế của các chuyến bay này vừa đổi (vé, giữ chỗ): xoá lịch giá của các tuyến tương ứng
+    flight_ids = set(flight_ids)
+    if not flight_ids or not _cache:
+        return
+    statement = select(Flight.flight_route_id).where(Flight.flight_id.in_(flight_ids)).distinct()
+    rows = (connection or db.session).execute(statement)
+    invalidate_routes(fr_id for (fr_id,) in rows)
+
+
+@event.listens_for(Flight, 'after_insert')
+@event.listens_for(Flight, 'after_delete')
+def flight_inserted_or_deleted(mapper, connection, target):
+    invalidate_routes([target.flight_route_id])
+
+
+@event.listens_for(Flight, 'after_update')
+def flight_updated(mapper, connection, target):
+    history = inspect(target).attrs.flight_route_id.history
+    invalidate_routes([target.flight_route_id] + list(history.deleted or []))
+
+
+@event.listens_for(Ticket, 'after_insert')
+@event.listens_for(Ticket, 'after_update')
+@event.listens_for(Ticket, 'after_delete')
+def ticket_changed(mapper, connection, target):
+    flight_ids = [target.flight_id] + list(inspect(target).attrs.flight_id.history.deleted or [])
+    flights_changed(flight_ids, connection)
@@ -0,0 +1,179 @@
+import threading
+import time
+from collections import Counter
+from datetime import datetime, date, timedelta
+from sqlalchemy import update, delete, exists, bindparam
+from app import db, app, farecalendar, pricing
+from app.models import SeatHold, SeatInventory, SeatClass, Seat, Ticket, Flight, Payment
+
+# Giá vé hạng thương gia gấp đôi giá chuyến bay (giống giỏ hàng và trang thanh toán)
+PRICE_FACTOR = {SeatClass.BUSINESS: 2, SeatClass.ECONOMY: 1}
+REAPER_BATCH_SIZE = 500
+
+
+class SeatHoldError(Exception):
+    pass
+
+
+def _reserve(flight_id, seat_class, quantity):
+    # Compare-and-set trên đúng một dòng SeatInventory: chỉ khoá dòng đó trong thời gian chạy câu UPDATE,
+    # không cần SELECT ... FOR UPDATE hay khoá cả bảng Seat
+    inventory = SeatInventory.__table__
+    result = db.session.execute(update(inventory).where(
+        inventory.c.flight_id == flight_id,
+        inventory.c.seat_class == seat_class,
+        inventory.c.capacity - inventory.c.booked - inventory.c.held >= quantity
+    ).values(held=inventory.c.held + quantity))
+    if result.rowcount == 1:
+        farecalendar.flights_changed([flight_id])
+        return True
+    return False
+
+
+def _unreserve(flight_id, seat_class, quantity):
+    inventory = SeatInventory.__table__
+    db.session.execute(update(inventory).where(
+        inventory.c.flight_id == flight_id,
+        inventory.c.seat_class == seat_class
+    ).values(held=inventory.c.held - quantity))
+    farecalendar.flights_changed([flight_id])
+
+
+def _locked_hold(hold_id):
+    # Khoá dòng SeatHold trước khi đụng tới SeatInventory (cùng thứ tự khoá với release_expired)
+    if not hold_id:
+        return None
+    return db.session.query(SeatHold).filter(SeatHold.hold_id == hold_id).with_for_update().first()
+
+
+def hold_seats(flight_id, seat_class, quantity, hold_id=None, user_id=None):
+    # Giữ `quantity` ghế trong SEAT_HOLD_SECONDS; có hold_id thì đổi số lượng và gia hạn giữ chỗ cũ
+    expires_at = datetime.now() + timedelta(seconds=app.config['SEAT_HOLD_SECONDS'])
+    hold = _locked_hold(hold_id)
+    if hold and (hold.flight_id != int(flight_id) or hold.seat_class != seat_class):
+        hold = None
+
+    delta = quantity - (hold.quantity if hold else 0)
+    if delta > 0 and not _reserve(flight_id, seat_class, delta):
+        db.session.rollback()
+        raise SeatHoldError("Không đủ ghế trống cho hạng ghế này")
+    if delta < 0:
+        _unreserve(flight_id, seat_class, -delta)
+
+    if hold:
+        hold.quantity = quantity
+        hold.expires_at = expires_at
+    else:
+        hold = SeatHold(flight_id=flight_id, seat_class=seat_class, quantity=quantity, user_id=user_id,
+                        expires_at=expires_at)
+        db.session.add(hold)
+    db.session.commit()
+    return hold
+
+
+def release(hold_id):
+    hold = _locked_hold(hold_id)
+    if hold:
+        _unreserve(hold.flight_id, hold.seat_class, hold.quantity)
+        db.session.delete(hold)
+    db.session.commit()
+
+
+def unit_price(flight, seat_class):
+    # Giá một vé của hạng ghế theo giá hiện tại của chuyến bay (pricing.quote); giỏ hàng và thanh toán cùng dùng
+    return (pricing.quote(flight) or 0) * PRICE_FACTOR[seat_class]
+
+
+def convert(hold_id, user_id, card_no, payment_type=True):
+    # Thanh toán: chuyển giữ chỗ thành vé trên các ghế cụ thể trong cùng một transaction
+    hold = _locked_hold(hold_id)
+    if hold is None or hold.expires_at < datetime.now():
+        db.session.rollback()
+        raise SeatHoldError("Giữ chỗ đã hết hạn, vui lòng thêm lại chuyến bay vào giỏ hàng")
+
+    flight = db.session.get(Flight, hold.flight_id)
+    # SKIP LOCKED: người mua khác đang thanh toán cùng chuyến sẽ lấy các ghế khác thay vì phải chờ
+    seat_ids = [seat_id for (seat_id,) in db.session.query(Seat.seat_id).filter(
+        Seat.plane_id == flight.plane_id,
+        Seat.seat_class == hold.seat_class,
+        ~exists().where(Ticket.flight_id == flight.flight_id, Ticket.seat_id == Seat.seat_id,
+                        Ticket.ticket_status == True)
+    ).order_by(Seat.seat_number).limit(hold.quantity).with_for_update(skip_locked=True)]
+    if len(seat_ids) < hold.quantity:
+        db.session.rollback()
+        raise SeatHoldError("Không còn đủ ghế trống, vui lòng thử lại")
+
+    # Giá tính theo tồn kho ghế lúc thanh toán, giống giá hiển thị trên trang tìm kiếm và trong giỏ hàng
+    price = unit_price(flight, hold.seat_class)
+    db.session.add(Payment(payment_card_no=card_no, payment_type=payment_type, payment_date=date.today(),
+                           payment_cost=price * len(seat_ids), user_id=user_id))
+    tickets = [Ticket(issue_date=date.today(), ticket_price=price, ticket_status=True, ticket_gate=1,
+                      user_id=user_id, flight_id=flight.flight_id, seat_id=seat_id) for seat_id in seat_ids]
+    db.session.add_all(tickets)
+
+    # booked được cộng bởi event của Ticket, held trả lại tương ứng
+    _unreserve(hold.flight_id, hold.seat_class, hold.quantity)
+    db.session.delete(hold)
+    db.session.commit()
+    return tickets
+
+
+def release_expired(batch_size=REAPER_BATCH_SIZE):
+    # Dọn giữ chỗ hết hạn theo lô: mỗi lô 1 SELECT (bỏ qua dòng đang bị khoá), 1 UPDATE executemany, 1 DELETE
+    inventory = SeatInventory.__table__
+    released = 0
+    while True:
+        holds = db.session.query(
+            SeatHold.hold_id, SeatHold.flight_id, SeatHold.seat_class, SeatHold.quantity
+        ).filter(
+            SeatHold.expires_at < datetime.now()
+        ).order_by(SeatHold.hold_id).limit(batch_size).with_for_update(skip_locked=True).all()
+        if not holds:
+            break
+
+        totals = Counter()
+        for _, flight_id, seat_class, quantity in holds:
+            totals[(flight_id, seat_class)] += quantity
+        db.session.execute(update(inventory).where(
+            inventory.c.flight_id == bindparam('b_flight_id'),
+            inventory.c.seat_class == bindparam('b_seat_class')
+        ).values(held=inventory.c.held - bindparam('b_quantity')), [
+            {'b_flight_id': flight_id, 'b_seat_class': seat_class, 'b_quantity': quantity}
+            for (flight_id, seat_class), quantity in totals.items()
+        ])
+        db.session.execute(delete(SeatHold).where(SeatHold.hold_id.in_([h[0] for h in holds])))
+        db.session.commit()
+        farecalendar.flights_changed(flight_id for flight_id, _ in totals)
+
+        released += len(holds)
+        if len(holds) < batch_size:
+            break
+    return released
+
+
+_reaper = None
+_reaper_lock = threading.Lock()
+
+
+def _reap_forever(interval):
+    while True:
+        time.sleep(interval)
+        with app.app_context():
+            try:
+                release_expired()
+            except Exception:
+                app.logger.exception("Releasing expired seat holds failed")
+                db.session.rollback()
+
+
+@app.before_request
+def start_reaper():
+    # Mỗi worker chạy một luồng dọn giữ chỗ; nhiều worker dọn song song không giẫm lên nhau nhờ SKIP LOCKED
+    global _reaper
+    interval = app.config.get('SEAT_HOLD_REAPER_SECONDS')
+    if _reaper is None and interval:
+        with _reaper_lock:
+            if _reaper is None:
+                _reaper = threading.Thread(target=_reap_forever, args=(interval,), daemon=True,
+                                           name='seat-hold-reaper')
+                _reaper.start()
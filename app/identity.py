@@ -0,0 +1,77 @@
+import threading
+import time
+from collections import OrderedDict
+from flask_login import UserMixin
+from app import dao, refdata
+
+# Bộ nhớ đệm LRU + TTL cho current_user: request của người dùng đã đăng nhập không cần
+# truy vấn bảng User; sửa User trong admin tăng phiên bản 'user' để mọi worker xoá cache
+CACHE_NAME = 'user'
+MAX_USERS = 1024
+TTL_SECONDS = 300
+VERSION_CHECK_SECONDS = 5
+
+
+class CachedUser(UserMixin):
+    # Chỉ giữ các trường mà template và phần kiểm tra quyền sử dụng
+    def __init__(self, user):
+        self.id = user.id
+        self.name = user.name
+        self.username = user.username
+        self.email = user.email
+        self.avatar = user.avatar
+        self.user_role = user.user_role
+
+    def __str__(self):
+        return self.name
+
+
+_users = OrderedDict()  # user_id -> (CachedUser, thời điểm nạp)
+_lock = threading.Lock()
+_version = None
+_checked_at = 0
+
+
+def _check_version():
+    global _version, _checked_at
+    if time.time() - _checked_at < VERSION_CHECK_SECONDS:
+        return
+    version = refdata.read_version(CACHE_NAME)
+    with _lock:
+        if version != _version:
+            _users.clear()
+            _version = version
+        _checked_at = time.time()
+
+
+def load_user(user_id):
+    user_id = int(user_id)
+    _check_version()
+
+    with _lock:
+        entry = _users.get(user_id)
+        if entry and time.time() - entry[1] < TTL_SECONDS:
+            _users.move_to_end(user_id)
+            return entry[0]
+
+    u = dao.get_user_by_id(user_id)
+    if u is None:
+        return None
+
+    cached = CachedUser(u)
+    with _lock:
+        _users[user_id] = (cached, time.time())
+        _users.move_to_end(user_id)
+        while len(_users) > MAX_USERS:
+            _users.popitem(last=False)
+    return cached
+
+
+def invalidate(user_id=None):
+    # Gọi sau khi sửa thông tin / quyền của người dùng
+    with _lock:
+        if user_id is None:
+            _users.clear()
+        else:
+            _users.pop(user_id, None)
+    refdata.bump_version(CACHE_NAME)
@@ -0,0 +1,89 @@
+import json
+import os
+import re
+import subprocess
+import sys
+from collections import namedtuple
+
+# Đo thời gian khởi động lạnh: chạy `python -X importtime` trong tiến trình mới (module chưa được import / cache)
+# rồi cộng thời gian import của từng package gốc (flask, sqlalchemy, numpy, app, ...)
+Module = namedtuple('Module', ['name', 'self_us', 'cumulative_us'])
+Result = namedtuple('Result', ['total_ms', 'packages'])
+
+TARGET = 'from app import create_app; create_app()'
+RUNS = 3
+# Ngân sách tổng thời gian import (ms) của TARGET; CI báo lỗi khi vượt
+BUDGET_MS = 1500
+# Package chậm đi so với baseline quá mức này (và quá MIN_DELTA_MS) thì coi là hồi quy
+TOLERANCE = 0.3
+MIN_DELTA_MS = 20
+
+_LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)')
+
+
+def _import_times(target):
+    # stderr của -X importtime: 'import time: self [us] | cumulative | imported package', thụt lề theo độ sâu
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE='1')
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', target], capture_output=True, text=True,
+                               env=env, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    if completed.returncode != 0:
+        raise RuntimeError(f"Importing failed:\n{completed.stderr[-2000:]}")
+    modules = []
+    for line in completed.stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            modules.append(Module(match.group(4), int(match.group(1)), int(match.group(2))))
+    return modules
+
+
+def measure(target=TARGET, runs=RUNS):
+    # Lấy lần nhanh nhất của mỗi package qua nhiều lần chạy để bớt nhiễu của máy CI
+    best = None
+    for _ in range(runs):
+        packages = {}
+        for module in _import_times(target):
+            package = module.name.split('.')[0]
+            if package == 'app':
+                package = module.name  # module của ứng dụng được liệt kê riêng
+            packages[package] = packages.get(package, 0) + module.self_us
+        if best is None:
+            best = packages
+        else:
+            best = {name: min(us, best.get(name, us)) for name, us in packages.items()}
+    return Result(round(sum(best.values()) / 1000, 1),
+                  {name: round(us / 1000, 1) for name, us in sorted(best.items(), key=lambda p: -p[1])})
+
+
+def save_baseline(path, result):
+    with open(path, 'w') as f:
+        json.dump(result._asdict(), f, indent=2)
+
+
+def load_baseline(path):
+    with open(path) as f:
+        return Result(**json.load(f))
+
+
+def check(result, baseline=None, budget=BUDGET_MS, tolerance=TOLERANCE):
+    problems = []
+    if budget is not None and result.total_ms > budget:
+        problems.append(f"total import time {result.total_ms}ms > budget {budget}ms")
+    if baseline:
+        if result.total_ms > baseline.total_ms * (1 + tolerance) + MIN_DELTA_MS:
+            problems.append(f"total import time {result.total_ms}ms > baseline {baseline.total_ms}ms (+{tolerance:.0%})")
+        for name, ms in result.packages.items():
+            base = baseline.packages.get(name, 0)
+            if ms - base > MIN_DELTA_MS and ms > base * (1 + tolerance):
+                problems.append(f"{name}: {ms}ms > baseline {base}ms" if base else f"{name}: new import ({ms}ms)")
+    return problems
+
+
+def format_result(result, baseline=None, top=20):
+    lines = [f"{'package':<32}{'ms':>10}{'vs base':>10}"]
+    for name, ms in list(result.packages.items())[:top]:
+        base = baseline.packages.get(name) if baseline else None
+        delta = f"{ms - base:+.1f}" if base is not None else ('new' if baseline else '')
+        lines.append(f"{name:<32}{ms:>10.1f}{delta:>10}")
+    base_total = f"{result.total_ms - baseline.total_ms:+.1f}" if baseline else ''
+    lines.append(f"{'total':<32}{result.total_ms:>10.1f}{base_total:>10}")
+    return '\n'.join(lines)
@@ -1,13 +1,14 @@
-import math
-
+import hashlib
+import threading
 import unicodedata
 
-from flask import render_template, request, redirect, session, jsonify
-import dao, utils
-from app import app, login
-from flask_login import login_user, logout_user
+from flask import render_template, request, redirect, session, jsonify, make_response
+from app import dao
+from app import app, login, commands, itinerary, autocomplete, refdata, identity, sqlstats, holds, carts, \
+    farecalendar, pricing, db
+from flask_login import login_user, logout_user, current_user
 
-from app.models import UserRole, Seat, Flight
+from app.models import UserRole, Seat, Flight, SeatClass, FlightType
 from datetime import datetime
 
 
@@ -27,27 +28,86 @@ def index():
 
         cities = ["Hồ Chí Minh", "Hà Nội", "Đà Nẵng", "Singapore", "Bangkok", "Taipei", "Seoul", "Tokyo"]
 
-        airports = dao.load_airports()
-
-
-        page = request.args.get('page', 1)
-        page = int(page)
 
-        flights = dao.get_flights(page)
+        try:
+            page = dao.get_flights(after=request.args.get('after'), before=request.args.get('before'))
+        except ValueError:
+            page = dao.get_flights()
         flights_counter = dao.count_flights()
-        total_pages = math.ceil(flights_counter / app.config['PAGE_SIZE'])
 
         return render_template(
             'index.html',
-            airports=airports,
             routes=routes,
             cities=cities,
-            flights=flights,
+            flights=page.flights,
             departure_name=departure_name,
-            pages=total_pages,
+            next_cursor=page.next_cursor,
+            prev_cursor=page.prev_cursor,
+            flights_counter=flights_counter,
         )
 
 
+# Phần HTML danh sách tuyến bay phổ biến theo thành phố đi: (thành phố, phiên bản refdata) -> (html, etag)
+ROUTES_FRAGMENT_CACHE_SIZE = 256
+ROUTES_FRAGMENT_MAX_AGE = 300
+_routes_fragment_cache = {}
+_routes_fragment_lock = threading.Lock()  # worker nhiều luồng: bỏ phần tử cũ nhất rồi thêm mới như một bước
+
+
+@app.route('/api/routes/popular', methods=['GET'])
+def popular_routes_fragment():
+    departure_name = remove_accents(request.args.get('departure', 'Ho Chi Minh'))
+    key = (departure_name.lower(), refdata.get_snapshot().version)
+
+    cached = _routes_fragment_cache.get(key)
+    if cached is None:
+        html = render_template('layout/routes.html', routes=dao.get_popular_routes(departure_name),
+                               departure_name=departure_name)
+        cached = (html, hashlib.md5(html.encode('utf-8')).hexdigest())
+        with _routes_fragment_lock:
+            if len(_routes_fragment_cache) >= ROUTES_FRAGMENT_CACHE_SIZE:
+                _routes_fragment_cache.pop(next(iter(_routes_fragment_cache)), None)
+            _routes_fragment_cache[key] = cached
+
+    response = make_response(cached[0])
+    response.set_etag(cached[1])
+    response.cache_control.public = True
+    response.cache_control.max_age = ROUTES_FRAGMENT_MAX_AGE
+    return response.make_conditional(request)
+
+
+@app.route('/api/flights', methods=['GET'])
+def list_flights():
+    order = request.args.get('order', 'id')
+    if order not in dao.FLIGHT_ORDERS:
+        return jsonify({'error': 'order must be one of: ' + ', '.join(dao.FLIGHT_ORDERS)}), 400
+    try:
+        page_size = min(max(1, int(request.args.get('limit', app.config['PAGE_SIZE']))), 100)
+        page = dao.get_flights(after=request.args.get('after'), before=request.args.get('before'), order=order,
+                               page_size=page_size)
+    except ValueError as ex:
+        return jsonify({'error': str(ex)}), 400
+
+    ref = refdata.get_snapshot()
+    return jsonify({
+        'flights': [{
+            'flight_id': f.flight_id,
+            'company': ref.planes[f.plane_id].company.com_name,
+            'departure': ref.routes[f.flight_route_id].departure_airport.airport_name,
+            'arrival': ref.routes[f.flight_route_id].arrival_airport.airport_name,
+            'f_dept_time': f.f_dept_time.isoformat(),
+            'flight_arr_time': f.flight_arr_time.isoformat(),
+            'flight_price': f.flight_price,
+            'flight_type': f.flight_type.name,
+            'available_economy_seats': f.available_economy_seats(),
+            'available_business_seats': f.available_business_seats()
+        } for f in page.flights],
+        'next_cursor': page.next_cursor,
+        'prev_cursor': page.prev_cursor,
+        'total': dao.count_flights()
+    })
+
+
 @app.route('/register', methods=['get', 'post'])
 def register_process():
     err_msg = ''
@@ -112,7 +172,7 @@ def login_admin_process():
 
 @login.user_loader
 def get_user_by_id(user_id):
-    return dao.get_user_by_id(user_id)
+    return identity.load_user(user_id)
 
 
 
@@ -132,9 +192,136 @@ def search_flights_route():
     flights_result, error = dao.search_flights(departure, arrival, departure_date,total_passengers )
 
     if error:
-        return render_template('booking.html', airports=dao.load_airports(), error=error)
+        return render_template('booking.html', error=error)
+
+    # Hành trình nối chuyến (1-2 điểm dừng) qua các sân bay trung chuyển
+    itineraries = itinerary.search_itineraries(departure, arrival, departure_date, total_passengers)
+
+    # Giá theo tồn kho ghế hiện tại của từng chuyến (seat_inventories đã được nạp cùng kết quả tìm kiếm)
+    fares = {flight.flight_id: pricing.quote(flight) for flight in flights_result}
+
+    return render_template('booking.html', flights=flights_result, total_passengers=total_passengers,
+                           itineraries=itineraries, fares=fares)
+
+
+@app.route('/api/itineraries', methods=['GET'])
+def search_itineraries():
+    departure = request.args.get('departure')
+    arrival = request.args.get('arrival')
+    departure_date = request.args.get('departure_date')
+    try:
+        if departure_date:
+            datetime.strptime(departure_date, '%Y-%m-%d')
+        total_passengers = max(1, int(request.args.get('passengers', 1)))
+        k = min(max(1, int(request.args.get('k', 5))), 20)
+    except ValueError as ex:
+        return jsonify({'error': str(ex)}), 400
+    sort_by = request.args.get('sort', 'duration')
+    if sort_by not in ('duration', 'price'):
+        return jsonify({'error': 'sort must be duration or price'}), 400
+
+    itineraries = itinerary.search_itineraries(departure, arrival, departure_date, total_passengers, k=k,
+                                               sort_by=sort_by)
+    for it in itineraries:
+        for leg in it['legs']:
+            leg['dept_time'] = leg['dept_time'].isoformat()
+            leg['arr_time'] = leg['arr_time'].isoformat()
+
+    return jsonify(itineraries)
+
+
+# Các trường có thể chọn qua ?fields=...; hãng, máy bay, sân bay đọc từ snapshot. fare là giá hiện tại hạng phổ thông
+# (pricing.quote như trang tìm kiếm và bước thanh toán), price là fare theo hạng ghế đã lọc; flight_price là giá niêm
+# yết lần reprice gần nhất, dùng để lọc / sắp xếp theo giá trong SQL
+SEARCH_FIELDS = {
+    'flight_id': lambda r, ref, fare, factor: r.flight_id,
+    'company': lambda r, ref, fare, factor: ref.planes[r.plane_id].company.com_name,
+    'plane': lambda r, ref, fare, factor: ref.planes[r.plane_id].plane_name,
+    'departure': lambda r, ref, fare, factor: ref.routes[r.flight_route_id].departure_airport.airport_name,
+    'arrival': lambda r, ref, fare, factor: ref.routes[r.flight_route_id].arrival_airport.airport_name,
+    'f_dept_time': lambda r, ref, fare, factor: r.f_dept_time.isoformat(),
+    'flight_arr_time': lambda r, ref, fare, factor: r.flight_arr_time.isoformat(),
+    'flight_duration': lambda r, ref, fare, factor: r.flight_duration,
+    'flight_type': lambda r, ref, fare, factor: r.flight_type.name,
+    'flight_price': lambda r, ref, fare, factor: r.flight_price,
+    'fare': lambda r, ref, fare, factor: fare,
+    'price': lambda r, ref, fare, factor: None if fare is None else fare * factor,
+    'available_economy_seats': lambda r, ref, fare, factor: r.economy_seats,
+    'available_business_seats': lambda r, ref, fare, factor: r.business_seats,
+}
+
+
+def _list_arg(name):
+    # Nhận cả ?x=a&x=b và ?x=a,b
+    return [v.strip() for value in request.args.getlist(name) for v in value.split(',') if v.strip()]
+
+
+def _time_arg(name):
+    value = request.args.get(name)
+    return datetime.strptime(value, '%H:%M').time() if value else None
+
+
+def _float_arg(name):
+    value = request.args.get(name)
+    return float(value) if value else None
+
+
+@app.route('/api/search', methods=['GET'])
+def search_flights_api():
+    # Tìm chuyến bay bay thẳng theo ngày với bộ lọc / sắp xếp phía server và phân trang bằng cursor (?after=)
+    sort = request.args.get('sort', 'departure')
+    if sort not in dao.SEARCH_SORTS:
+        return jsonify({'error': 'sort must be one of: ' + ', '.join(dao.SEARCH_SORTS)}), 400
+    fields = _list_arg('fields') or list(SEARCH_FIELDS)
+    unknown = [f for f in fields if f not in SEARCH_FIELDS]
+    if unknown:
+        return jsonify({'error': 'unknown fields: ' + ', '.join(unknown)}), 400
+
+    try:
+        seat_class = request.args.get('seat_class')
+        seat_class = SeatClass[seat_class.upper()] if seat_class else None
+        flight_types = [FlightType[t.upper()] for t in _list_arg('flight_type')]
+        page, error = dao.search_flight_page(
+            request.args.get('departure'), request.args.get('arrival'), request.args.get('departure_date'),
+            max(1, int(request.args.get('passengers', 1))), sort=sort, seat_class=seat_class,
+            min_price=_float_arg('min_price'), max_price=_float_arg('max_price'),
+            depart_from=_time_arg('depart_from'), depart_to=_time_arg('depart_to'), flight_types=flight_types,
+            airline_ids={int(a) for a in _list_arg('airline')}, after=request.args.get('after'),
+            page_size=min(max(1, int(request.args.get('limit', app.config['PAGE_SIZE']))), 100))
+    except KeyError as ex:
+        return jsonify({'error': f"unknown value {ex}"}), 400
+    except ValueError as ex:
+        return jsonify({'error': str(ex)}), 400
+    if error:
+        return jsonify({'error': error}), 404
 
-    return render_template('booking.html', flights=flights_result, airports=dao.load_airports(),total_passengers=total_passengers)
+    ref = refdata.get_snapshot()
+    factor = holds.PRICE_FACTOR[seat_class or SeatClass.ECONOMY]
+    fares = {row.flight_id: pricing.quote_values(row.base_price, row.flight_price, row.f_dept_time,
+                                                 row.flight_route_id, row.sold, row.capacity) for row in page.rows}
+    return jsonify({
+        'flights': [{name: SEARCH_FIELDS[name](row, ref, fares[row.flight_id], factor) for name in fields}
+                    for row in page.rows],
+        'next_cursor': page.next_cursor
+    })
+
+
+@app.route('/api/fare-calendar', methods=['GET'])
+def fare_calendar():
+    # Giá thấp nhất mỗi ngày (economy / business) của một cặp sân bay trong DEFAULT_DAYS..MAX_DAYS ngày
+    try:
+        start = request.args.get('start')
+        start = datetime.strptime(start, '%Y-%m-%d').date() if start else None
+        days = int(request.args.get('days', farecalendar.DEFAULT_DAYS))
+        passengers = max(1, int(request.args.get('passengers', 1)))
+    except ValueError as ex:
+        return jsonify({'error': str(ex)}), 400
+
+    calendar = farecalendar.get_calendar(request.args.get('departure'), request.args.get('arrival'), start, days,
+                                         passengers)
+    if calendar is None:
+        return jsonify({'error': 'Airport not found'}), 404
+    return jsonify(calendar)
 
 
 
@@ -144,15 +331,17 @@ def payment_info(flight_id,quantity,type_ticket):
     flight = Flight.query.get(flight_id)
 
     if flight:
-        # Lấy các thông tin từ chuyến bay và các bảng liên quan
-        company_name = flight.plane.company.com_name
+        # Lấy các thông tin từ chuyến bay, hãng và sân bay đọc từ snapshot dữ liệu gốc
+        ref = refdata.get_snapshot()
+        route = ref.routes[flight.flight_route_id]
+        company_name = ref.planes[flight.plane_id].company.com_name
         departure_time = flight.f_dept_time.strftime('%H:%M')
         arrival_time = flight.flight_arr_time.strftime('%H:%M')
-        arrival_local =  flight.flight_route.arrival_airport.airport_name
-        departure_local = flight.flight_route.departure_airport.airport_name
+        arrival_local =  route.arrival_airport.airport_name
+        departure_local = route.departure_airport.airport_name
         flight_duration = flight.flight_duration
         flight_type=flight.flight_type.name
-        flight_price = flight.flight_price
+        flight_price = pricing.quote(flight)
         departure_date = flight.f_dept_time.date()
         formatted_date = departure_date.strftime('%Y-%m-%d')
 
@@ -180,21 +369,24 @@ def payment_qr(flight_id,quantity,type_ticket):
     flight = Flight.query.get(flight_id)
 
     if flight:
-        # Lấy các thông tin từ chuyến bay và các bảng liên quan
-        company_name = flight.plane.company.com_name
+        # Lấy các thông tin từ chuyến bay, hãng và sân bay đọc từ snapshot dữ liệu gốc
+        ref = refdata.get_snapshot()
+        route = ref.routes[flight.flight_route_id]
+        company_name = ref.planes[flight.plane_id].company.com_name
         departure_time = flight.f_dept_time.strftime('%H:%M')
         arrival_time = flight.flight_arr_time.strftime('%H:%M')
-        arrival_local =  flight.flight_route.arrival_airport.airport_name
-        departure_local = flight.flight_route.departure_airport.airport_name
+        arrival_local =  route.arrival_airport.airport_name
+        departure_local = route.departure_airport.airport_name
         flight_duration = flight.flight_duration
         flight_type=flight.flight_type.name
-        flight_price = flight.flight_price
+        flight_price = pricing.quote(flight)
         departure_date = flight.f_dept_time.date()
         formatted_date = departure_date.strftime('%Y-%m-%d')
 
         # Truyền dữ liệu vào template
         return render_template(
             'payment_qr.html',
+            flight_id=flight_id,
             company_name=company_name,
             departure_time=departure_time,
             arrival_time=arrival_time,
@@ -212,85 +404,86 @@ def payment_qr(flight_id,quantity,type_ticket):
 
 @app.route('/booking', methods=['GET'])
 def flights():
-    airports = dao.load_airports()
+    return render_template('booking.html')
 
-    return render_template('booking.html', airports=airports)
+
+@app.route('/api/airports', methods=['GET'])
+def airport_autocomplete():
+    # Gợi ý sân bay / thành phố không phân biệt dấu: "Ha Noi" khớp "Hà Nội"
+    q = request.args.get('q', '')
+    try:
+        limit = min(max(1, int(request.args.get('limit', 8))), 20)
+    except ValueError as ex:
+        return jsonify({'error': str(ex)}), 400
+    return jsonify(autocomplete.search(q, limit))
 
 
 @app.route("/api/carts", methods=['post'])
 def add_to_cart():
-    cart = session.get('cart', {})
-
     # Dữ liệu từ request JSON
     data = request.json
     flight_id = str(data.get('flight_id'))
-    plane_name = data.get('plane_name')
-    departure = data.get('departure')
-    arrival = data.get('arrival')
-    day = data.get('day')
     type_ticket = data.get('type_ticket')
-    price = data.get('price')
 
     # Tạo khóa unique cho flight_id và type_ticket
-    cart_key = f"{flight_id}_{type_ticket}"
+    cart_key = carts.line_key(flight_id, type_ticket)
+    item = carts.get_line(cart_key) or {
+        "flight_id": flight_id,
+        "plane_name": data.get('plane_name'),
+        "departure": data.get('departure'),
+        "arrival": data.get('arrival'),
+        "day": data.get('day'),
+        "type_ticket": type_ticket,
+        "quantity": 0
+    }
+
+    # Giữ chỗ trước khi thêm vào giỏ: hết ghế thì báo lỗi ngay thay vì tới lúc thanh toán
+    try:
+        hold = _hold_cart_item(flight_id, type_ticket, item['quantity'] + 1, item.get('hold_id'))
+    except (holds.SeatHoldError, KeyError, ValueError) as ex:
+        return jsonify({'error': str(ex)}), 409
+
+    item['quantity'] += 1
+    _set_cart_hold(item, hold)
+
+    return jsonify(carts.put_line(cart_key, item))
+
+
+def _hold_cart_item(flight_id, type_ticket, quantity, hold_id=None):
+    user_id = current_user.id if current_user.is_authenticated else None
+    return holds.hold_seats(int(flight_id), SeatClass[type_ticket], quantity, hold_id=hold_id, user_id=user_id)
 
-    if cart_key in cart:
-        # Nếu khóa đã tồn tại, tăng số lượng vé
-        cart[cart_key]['quantity'] += 1
-    else:
-        # Nếu chưa tồn tại, tạo mục mới
-        cart[cart_key] = {
-            "flight_id": flight_id,
-            "plane_name": plane_name,
-            "departure": departure,
-            "arrival": arrival,
-            "day": day,
-            "type_ticket": type_ticket,
-            "price": float(price),
-            "quantity": 1
-        }
-
-    session['cart'] = cart
-    print(cart)
-
-    return jsonify(utils.cart_stats(cart))
+
+def _set_cart_hold(item, hold):
+    item['hold_id'] = hold.hold_id
+    item['hold_expires_at'] = hold.expires_at.isoformat()
+    # Giá do server tính như lúc thanh toán (holds.convert), không dùng giá client gửi lên
+    item['price'] = holds.unit_price(db.session.get(Flight, hold.flight_id), hold.seat_class)
 
 @app.route("/cart")
 def cart_view():
-    return render_template('cart.html')
+    return render_template('cart.html', cart=carts.lines())
 
 @app.context_processor
 def common_response_data():
     return {
         # 'categories': dao.load_categories(),
-        'cart_stats': utils.cart_stats(session.get('cart'))
+        'cart_stats': carts.stats(),
+        'ref': refdata.get_snapshot()
     }
 
 
 @app.route('/cart/delete', methods=['POST'])
 def delete_cart_item():
-    flight_id = request.json.get('flight_id')
-    type_ticket = request.json.get('type_ticket')
-
-    if 'cart' in session:
-        # Tìm và xóa phần tử giỏ hàng dựa trên flight_id và type_ticket
-        cart = session['cart']
-        key_to_delete = None
-        for key, item in cart.items():
-            if item['flight_id'] == flight_id and item['type_ticket'] == type_ticket:
-                key_to_delete = key
-                break
+    cart_key = carts.line_key(request.json.get('flight_id'), request.json.get('type_ticket'))
 
-        if key_to_delete:
-            del cart[key_to_delete]
-            session['cart'] = cart  # Cập nhật lại giỏ hàng trong session
-            session.modified = True
+    # Xoá đúng một dòng theo khoá và trả lại ghế đang giữ
+    item = carts.remove_line(cart_key)
+    if item is None:
+        return jsonify({'success': False, 'message': 'Cart not found!'})
 
-        # Tính lại tổng số lượng và giá
-        stats = utils.cart_stats(cart)
-        return jsonify({'success': True, 'stats': stats})
-
-    return jsonify({'success': False, 'message': 'Cart not found!'})
+    holds.release(item.get('hold_id'))
+    return jsonify({'success': True, 'stats': carts.stats()})
 
 
 @app.route('/cart/update', methods=['POST'])
@@ -299,27 +492,46 @@ def update_cart():
     type_ticket = request.json.get('type_ticket')
     quantity = int(request.json.get('quantity'))
 
-    if 'cart' in session and quantity > 0:
-        cart = session['cart']
+    cart_key = carts.line_key(flight_id, type_ticket)
+    item = carts.get_line(cart_key)
+    if item is None or quantity <= 0:
+        return jsonify({'success': False, 'message': 'Invalid cart or quantity'})
+
+    # Cập nhật số lượng (giữ thêm / trả bớt ghế)
+    try:
+        hold = _hold_cart_item(flight_id, type_ticket, quantity, item.get('hold_id'))
+    except holds.SeatHoldError as ex:
+        return jsonify({'success': False, 'message': str(ex)})
+    item['quantity'] = quantity
+    _set_cart_hold(item, hold)
+
+    return jsonify({'success': True, 'stats': carts.put_line(cart_key, item)})
+
 
-        # Cập nhật số lượng cho mục phù hợp
-        for item in cart.values():
-            if item['flight_id'] == flight_id and item['type_ticket'] == type_ticket:
-                item['quantity'] = quantity
-                break
+@app.route('/api/payments', methods=['POST'])
+def pay_cart_item():
+    # Thanh toán một mục trong giỏ: chuyển giữ chỗ của mục đó thành vé
+    if not current_user.is_authenticated:
+        return jsonify({'success': False, 'message': 'Vui lòng đăng nhập để thanh toán'}), 401
 
-        # Lưu lại giỏ hàng vào session
-        session['cart'] = cart
-        session.modified = True
+    cart_key = carts.line_key(request.json.get('flight_id'), request.json.get('type_ticket'))
+    item = carts.get_line(cart_key)
+    if not item:
+        return jsonify({'success': False, 'message': 'Cart not found!'}), 404
 
-        # Tính toán lại tổng tiền và số lượng
-        stats = utils.cart_stats(cart)
-        return jsonify({'success': True, 'stats': stats})
+    try:
+        tickets = holds.convert(item.get('hold_id'), current_user.id, request.json.get('card_no', ''),
+                                payment_type=bool(request.json.get('payment_type', True)))
+    except holds.SeatHoldError as ex:
+        return jsonify({'success': False, 'message': str(ex)}), 409
 
-    return jsonify({'success': False, 'message': 'Invalid cart or quantity'})
+    carts.remove_line(cart_key)
+    return jsonify({'success': True, 'tickets': [t.ticket_id for t in tickets], 'stats': carts.stats()})
 
 
 if __name__ == '__main__':
-    with app.app_context():
-        from app import admin
-        app.run(debug=True)
+    # Chạy trực tiếp file này (server dev): module đã là __main__ nên không để create_app() import lại app.index
+    from app import configure, init_admin
+    configure()
+    init_admin()
+    app.run()
@@ -0,0 +1,226 @@
+import bisect
+import heapq
+import threading
+import time
+from collections import defaultdict, namedtuple
+from datetime import datetime, timedelta
+from app import db, refdata, routing
+from app.models import Flight, SeatInventory, SeatClass
+
+# Thời gian nối chuyến tối thiểu / tối đa tại sân bay trung chuyển
+MIN_CONNECTION = timedelta(minutes=45)
+MAX_CONNECTION = timedelta(hours=24)
+# Chỉ nạp các chuyến bay khởi hành trong khoảng thời gian này vào bộ nhớ
+HORIZON = timedelta(days=120)
+# Sân bay / tuyến bay lấy từ refdata (dựng lại khi snapshot đổi phiên bản); chuyến bay do worker khác
+# thêm qua admin chỉ được nạp khi dựng lại sau khoảng thời gian này
+REFRESH_SECONDS = 300
+MAX_STOPS = 2
+
+Leg = namedtuple('Leg', ['flight_id', 'route_id', 'departure_airport_id', 'arrival_airport_id',
+                         'dept_time', 'arr_time', 'price'])
+
+
+class ItineraryIndex:
+    def __init__(self):
+        self.routes = {}  # fr_id -> (sân bay đi, sân bay đến)
+        self.next_airports = defaultdict(set)  # danh sách kề của đồ thị tuyến bay
+        self.prev_airports = defaultdict(set)
+        self.airport_ids = {}
+        self.airport_names = {}
+        self.legs = {}  # flight_id -> Leg
+        self.departures = defaultdict(list)  # sân bay -> [(giờ đi, flight_id)] đã sắp xếp
+        self.built_at = 0
+        self.version = None
+        self.lock = threading.Lock()
+
+    @routing.replica
+    def build(self):
+        snapshot = refdata.get_snapshot()
+        self.version = snapshot.version
+        for airport in snapshot.airports.values():
+            self.airport_ids[airport.airport_name] = airport.airport_id
+            self.airport_names[airport.airport_id] = airport.airport_name
+
+        for route in snapshot.routes.values():
+            self.add_route(route.fr_id, route.departure_airport.airport_id, route.arrival_airport.airport_id)
+
+        now = datetime.now()
+        rows = db.session.query(
+            Flight.flight_id, Flight.flight_route_id, Flight.f_dept_time, Flight.flight_arr_time, Flight.flight_price
+        ).filter(
+            Flight.f_dept_time >= now,
+            Flight.f_dept_time < now + HORIZON
+        )
+        for flight_id, route_id, dept_time, arr_time, price in rows:
+            dep_id, arr_id = self.routes[route_id]
+            leg = Leg(flight_id, route_id, dep_id, arr_id, dept_time, arr_time, price or 0)
+            self.legs[flight_id] = leg
+            self.departures[dep_id].append((dept_time, flight_id))
+
+        for departures in self.departures.values():
+            departures.sort()
+
+        self.built_at = time.time()
+        return self
+
+    def add_route(self, fr_id, dep_id, arr_id):
+        self.routes[fr_id] = (dep_id, arr_id)
+        self.next_airports[dep_id].add(arr_id)
+        self.prev_airports[arr_id].add(dep_id)
+
+    def add_flight(self, flight_id, route_id, dept_time, arr_time, price):
+        with self.lock:
+            self.remove_flight(flight_id)
+            if route_id not in self.routes:
+                return
+            dep_id, arr_id = self.routes[route_id]
+            leg = Leg(flight_id, route_id, dep_id, arr_id, dept_time, arr_time, price or 0)
+            self.legs[flight_id] = leg
+            bisect.insort(self.departures[dep_id], (dept_time, flight_id))
+
+    def remove_flight(self, flight_id):
+        leg = self.legs.pop(flight_id, None)
+        if leg:
+            departures = self.departures[leg.departure_airport_id]
+            i = bisect.bisect_left(departures, (leg.dept_time, flight_id))
+            if i < len(departures) and departures[i] == (leg.dept_time, flight_id):
+                del departures[i]
+
+    def departures_between(self, airport_id, start, end):
+        departures = self.departures.get(airport_id, [])
+        i = bisect.bisect_left(departures, (start,))
+        j = bisect.bisect_left(departures, (end,))
+        return [self.legs[flight_id] for _, flight_id in departures[i:j] if flight_id in self.legs]
+
+    def reachable(self, arrival_id, max_legs):
+        # reach[n]: các sân bay tới được sân bay đến với tối đa n chặng (BFS ngược trên danh sách kề)
+        reach = [{arrival_id}]
+        for _ in range(max_legs):
+            current = set(reach[-1])
+            for airport_id in reach[-1]:
+                current |= self.prev_airports.get(airport_id, set())
+            reach.append(current)
+        return reach
+
+    def search(self, departure_id, arrival_id, day, k=5, sort_by='duration', max_stops=MAX_STOPS):
+        max_legs = max_stops + 1
+        reach = self.reachable(arrival_id, max_legs)
+        start = datetime.combine(day, datetime.min.time())
+        # Giữ `limit` ứng viên tốt nhất trong heap (đảo dấu) để cắt tỉa các nhánh chắc chắn tệ hơn
+        limit = k * 4
+        best = []
+
+        def cost(legs):
+            if sort_by == 'price':
+                return sum(leg.price for leg in legs)
+            return (legs[-1].arr_time - legs[0].dept_time).total_seconds()
+
+        def visit(legs, visited):
+            last = legs[-1]
+            c = cost(legs)
+            if len(best) == limit and c >= -best[0][0]:
+                return
+            if last.arrival_airport_id == arrival_id:
+                if len(legs) > 1:
+                    entry = (-c, tuple(leg.flight_id for leg in legs), list(legs))
+                    if len(best) < limit:
+                        heapq.heappush(best, entry)
+                    else:
+                        heapq.heapreplace(best, entry)
+                return
+            remaining = max_legs - len(legs)
+            if remaining == 0:
+                return
+            for leg in self.departures_between(last.arrival_airport_id, last.arr_time + MIN_CONNECTION,
+                                               last.arr_time + MAX_CONNECTION):
+                if leg.arrival_airport_id in visited or leg.arrival_airport_id not in reach[remaining - 1]:
+                    continue
+                visit(legs + [leg], visited | {leg.arrival_airport_id})
+
+        for leg in self.departures_between(departure_id, start, start + timedelta(days=1)):
+            if leg.arrival_airport_id != arrival_id and leg.arrival_airport_id in reach[max_legs - 1]:
+                visit([leg], {departure_id, leg.arrival_airport_id})
+
+        return [legs for _, _, legs in sorted(best, reverse=True)]
+
+
+_index = None
+_build_lock = threading.Lock()
+
+
+def _stale(index):
+    return (index is None or time.time() - index.built_at > REFRESH_SECONDS
+            or index.version != refdata.get_snapshot().version)
+
+
+def get_index():
+    global _index
+    if _stale(_index):
+        with _build_lock:
+            if _stale(_index):
+                _index = ItineraryIndex().build()
+    return _index
+
+
+def flight_changed(flight):
+    # Gọi từ FlightAdminView sau khi thêm / sửa chuyến bay: cập nhật tăng dần thay vì dựng lại toàn bộ
+    if _index is not None:
+        _index.add_flight(flight.flight_id, flight.flight_route_id, flight.f_dept_time, flight.flight_arr_time,
+                          flight.flight_price)
+
+
+def invalidate():
+    # Giá / lịch bay của nhiều chuyến vừa đổi (pricing.reprice): dựng lại ở lần tìm kiếm tiếp theo
+    global _index
+    _index = None
+
+
+def flight_deleted(flight_id):
+    if _index is not None:
+        with _index.lock:
+            _index.remove_flight(flight_id)
+
+
+@routing.replica
+def search_itineraries(departure, arrival, departure_date, total_needed_seats, k=5, sort_by='duration'):
+    index = get_index()
+    departure_id = index.airport_ids.get(departure)
+    arrival_id = index.airport_ids.get(arrival)
+    if not departure_id or not arrival_id or not departure_date:
+        return []
+
+    day = datetime.strptime(departure_date, '%Y-%m-%d').date()
+    candidates = index.search(departure_id, arrival_id, day, k=k, sort_by=sort_by)
+    if not candidates:
+        return []
+
+    # Kiểm tra ghế trống của mọi chặng bằng một truy vấn duy nhất; nút đặt chặng của hành trình luôn giữ ghế ECONOMY
+    # nên chỉ tính ghế economy (business còn chỗ không giúp được bước giữ chỗ)
+    flight_ids = {leg.flight_id for legs in candidates for leg in legs}
+    available = defaultdict(int)
+    for flight_id, seats in db.session.query(
+            SeatInventory.flight_id, SeatInventory.capacity - SeatInventory.booked - SeatInventory.held
+    ).filter(SeatInventory.flight_id.in_(flight_ids), SeatInventory.seat_class == SeatClass.ECONOMY):
+        available[flight_id] = seats
+
+    itineraries = []
+    for legs in candidates:
+        if all(available[leg.flight_id] >= total_needed_seats for leg in legs):
+            itineraries.append({
+                'legs': [{
+                    'flight_id': leg.flight_id,
+                    'departure': index.airport_names.get(leg.departure_airport_id),
+                    'arrival': index.airport_names.get(leg.arrival_airport_id),
+                    'dept_time': leg.dept_time,
+                    'arr_time': leg.arr_time,
+                    'price': leg.price
+                } for leg in legs],
+                'stops': len(legs) - 1,
+                'duration': round((legs[-1].arr_time - legs[0].dept_time).total_seconds() / 3600, 2),
+                'price': sum(leg.price for leg in legs)
+            })
+        if len(itineraries) == k:
+            break
+
+    return itineraries
@@ -1,8 +1,9 @@
 import random
-from cloudinary.utils import unique
-from sqlalchemy.orm import relationship
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, Enum as SQLEnum, Boolean, Date, DateTime
-from app import db, app
+from sqlalchemy.orm import relationship, column_property, Session
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, Enum as SQLEnum, Boolean, Date, DateTime, \
+    event, inspect, select, insert, update, delete, func
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from app import db, app, configure
 from enum import Enum as RoleEnum
 import hashlib
 from flask_login import UserMixin
@@ -75,6 +76,7 @@ class Plane(db.Model):
     plane_name = Column(String(255), nullable=False)
     total_seat = Column(Integer, nullable=False)
     company_id = Column(Integer, ForeignKey('company.com_id'), nullable=False)  # Khóa ngoại liên kết đến bảng Company
+    seat_layout = Column(String(50))  # tên sơ đồ ghế trong seatmap.SEAT_LAYOUTS
 
     seats = relationship('Seat', backref='plane', lazy=True, cascade="all, delete")
     company = relationship('Company', backref='planes', lazy=True)  # Mối quan hệ với Company
@@ -92,14 +94,17 @@ class Company(db.Model):
 class Seat(db.Model):
     seat_id = Column(Integer, primary_key=True, autoincrement=True)
     seat_number = Column(Integer, nullable=False)
+    seat_code = Column(String(5))  # vd. 12A
     seat_class = Column(SQLEnum(SeatClass), default=SeatClass.ECONOMY)
     seat_status = Column(Boolean, nullable=False, default=False)  # False = available, True = booked
     plane_id = Column(Integer, ForeignKey(Plane.plane_id), nullable=False)
 
-    __table_args__ = (db.UniqueConstraint('plane_id', 'seat_number', name='uix_plane_seat_number'),)
+    __table_args__ = (db.UniqueConstraint('plane_id', 'seat_number', name='uix_plane_seat_number'),
+                      # chọn ghế trống theo hạng khi thanh toán, đếm ghế theo hạng cho SeatInventory
+                      db.Index('ix_seat_plane_class', 'plane_id', 'seat_class', 'seat_number'))
 
     def __str__(self):
-        return f"Seat {self.seat_number}"
+        return f"Seat {self.seat_code or self.seat_number}"
 
 class FlightRoute(db.Model):
     fr_id = Column(Integer, primary_key=True, autoincrement=True)
@@ -113,6 +118,8 @@ class FlightRoute(db.Model):
     departure_airport = relationship('Airport', foreign_keys=[departure_airport_id])
     arrival_airport = relationship('Airport', foreign_keys=[arrival_airport_id])
 
+    __table_args__ = (db.Index('ix_flight_route_airports', 'departure_airport_id', 'arrival_airport_id'),)
+
     def __str__(self):
         return f"Route {self.fr_id}"
 
@@ -122,25 +129,98 @@ class Flight(db.Model):
     f_dept_time = Column(DateTime, nullable=False) #tg di
     flight_arr_time = Column(DateTime, nullable=False) #tg toi
     flight_duration = Column(Float) # tong tg di
-    flight_price = Column(Float)
+    flight_price = Column(Float)  # giá hiện tại, được pricing.reprice tính lại từ base_price
+    base_price = Column(Float)  # giá gốc do admin đặt; None thì lấy flight_price
     flight_type = Column(SQLEnum(FlightType), default=FlightType.DIRECT)  # Enum cho flight_type
     flight_route_id = Column(Integer, ForeignKey(FlightRoute.fr_id), nullable=False)
     plane_id = Column(Integer, ForeignKey(Plane.plane_id), nullable=False)
 
     plane = relationship('Plane', backref='flights', lazy=True)
+    seat_inventories = relationship('SeatInventory', backref='flight', lazy=True, cascade="all, delete")
+
+    __table_args__ = (
+        # tìm chuyến theo tuyến trong một khoảng giờ khởi hành (search_flights, lịch giá)
+        db.Index('ix_flight_route_dept_time', 'flight_route_id', 'f_dept_time'),
+        # danh sách chuyến bay sắp xếp theo giờ khởi hành, các chuyến chưa bay (pricing, itinerary)
+        db.Index('ix_flight_dept_time', 'f_dept_time'),
+    )
+
+    def available_seats(self, seat_class):
+        # Đọc số ghế trống từ SeatInventory (tối đa 2 dòng) thay vì duyệt toàn bộ Seat của máy bay
+        for inventory in self.seat_inventories:
+            if inventory.seat_class == seat_class:
+                return inventory.available()
+        return 0
 
     def available_business_seats(self):
-        return len(
-            [seat for seat in self.plane.seats if seat.seat_class == SeatClass.BUSINESS and seat.seat_status == False])
+        return self.available_seats(SeatClass.BUSINESS)
 
     def available_economy_seats(self):
-        return len(
-            [seat for seat in self.plane.seats if seat.seat_class == SeatClass.ECONOMY and seat.seat_status == False])
+        return self.available_seats(SeatClass.ECONOMY)
 
     def __str__(self):
         return f"Flight {self.flight_id} - Available seats: Business: {self.available_business_seats()}, Economy: {self.available_economy_seats()}"
 
 
+# Tồn kho ghế theo từng chuyến bay và hạng ghế: capacity lấy từ Seat của máy bay,
+# booked được cập nhật cùng transaction khi vé (Ticket) được tạo / sửa / xoá,
+# held là số ghế đang được giữ chỗ tạm thời (SeatHold) trong giỏ hàng
+class SeatInventory(db.Model):
+    inventory_id = Column(Integer, primary_key=True, autoincrement=True)
+    flight_id = Column(Integer, ForeignKey(Flight.flight_id), nullable=False)
+    seat_class = Column(SQLEnum(SeatClass), nullable=False)
+    capacity = Column(Integer, nullable=False, default=0)
+    booked = Column(Integer, nullable=False, default=0)
+    held = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (db.UniqueConstraint('flight_id', 'seat_class', name='uix_flight_seat_class'),)
+
+    def available(self):
+        return self.capacity - self.booked - self.held
+
+    def __str__(self):
+        return f"Flight {self.flight_id} - {self.seat_class.name}: {self.available()}/{self.capacity}"
+
+
+# Giữ chỗ có thời hạn: quantity ghế của một hạng ghế được trừ khỏi SeatInventory (cột held)
+# cho tới khi thanh toán (chuyển thành Ticket), bị huỷ hoặc hết hạn (holds.release_expired)
+class SeatHold(db.Model):
+    hold_id = Column(Integer, primary_key=True, autoincrement=True)
+    flight_id = Column(Integer, ForeignKey(Flight.flight_id), nullable=False)
+    seat_class = Column(SQLEnum(SeatClass), nullable=False)
+    quantity = Column(Integer, nullable=False)
+    user_id = Column(Integer, ForeignKey(User.id))
+    created_at = Column(DateTime, nullable=False, default=datetime.now)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+    def __str__(self):
+        return f"Hold {self.hold_id} - Flight {self.flight_id} {self.seat_class.name} x{self.quantity}"
+
+
+# Giỏ hàng lưu phía server (carts.SqlCartStore), cookie chỉ giữ token; tổng số lượng / tổng tiền
+# được cộng dồn mỗi khi một dòng thay đổi để không phải cộng lại cả giỏ
+class Cart(db.Model):
+    token = Column(String(43), primary_key=True)
+    total_quantity = Column(Integer, nullable=False, default=0)
+    total_price = Column(Float, nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=False, default=datetime.now, index=True)
+    lines = relationship('CartLine', backref='cart', lazy=True, cascade="all, delete")
+
+
+class CartLine(db.Model):
+    cart_token = Column(String(43), ForeignKey(Cart.token), primary_key=True)
+    line_key = Column(String(50), primary_key=True)  # "<flight_id>_<type_ticket>"
+    flight_id = Column(String(20), nullable=False)
+    plane_name = Column(String(255))
+    departure = Column(String(255))
+    arrival = Column(String(255))
+    day = Column(String(50))
+    type_ticket = Column(String(20), nullable=False)
+    price = Column(Float, nullable=False)
+    quantity = Column(Integer, nullable=False)
+    hold_id = Column(Integer)
+    hold_expires_at = Column(String(32))
+
 
 class FlightSchedule(db.Model):
     schedule_id = Column(Integer, primary_key=True, autoincrement=True)
@@ -180,15 +260,24 @@ class CustomerInfo(db.Model):
 
 class Ticket(db.Model):
     ticket_id = Column(Integer, primary_key=True, autoincrement=True)
-    issue_date = Column(Date, nullable=False)
-    ticket_price = Column(Float, nullable=False)
-    ticket_status = Column(Boolean, nullable=False)
+    # active_history: khi gán giá trị mới cho vé đã hết hạn (sau commit) vẫn nạp giá trị cũ, để event trừ bộ đếm
+    # tồn kho ghế / doanh thu theo đúng chuyến, ghế, ngày, giá, trạng thái cũ
+    issue_date = column_property(Column(Date, nullable=False), active_history=True)
+    ticket_price = column_property(Column(Float, nullable=False), active_history=True)
+    ticket_status = column_property(Column(Boolean, nullable=False), active_history=True)
     ticket_gate = Column(Integer, nullable=False)
     user_id = Column(Integer, ForeignKey(User.id), nullable=False) # customer_id = null thì là người mua ngược lại là người bán
-    flight_id = Column(Integer, ForeignKey(Flight.flight_id), nullable=False)
-    seat_id = Column(Integer, ForeignKey(Seat.seat_id), nullable=False)
+    flight_id = column_property(Column(Integer, ForeignKey(Flight.flight_id), nullable=False), active_history=True)
+    seat_id = column_property(Column(Integer, ForeignKey(Seat.seat_id), nullable=False), active_history=True)
     customer_id = Column(Integer, ForeignKey(CustomerInfo.customer_id)) # nếu mua tại quầy thì lưu thông tin vào bảng CustomerInfo, mặc định là 1 (staff)
 
+    __table_args__ = (
+        # ghế đã bán của một chuyến bay (chọn ghế khi thanh toán, tính lại SeatInventory)
+        db.Index('ix_ticket_flight_status_seat', 'flight_id', 'ticket_status', 'seat_id'),
+        # dựng lại bảng doanh thu theo ngày, lọc vé theo ngày trong trang admin
+        db.Index('ix_ticket_issue_date', 'issue_date'),
+    )
+
 class IntermediateAirport(db.Model):
     intermediate_id = Column(Integer, primary_key=True, autoincrement=True)
     flight_id = Column(Integer, ForeignKey(Flight.flight_id), nullable=False)  # Liên kết với bảng Flight
@@ -200,10 +289,255 @@ class IntermediateAirport(db.Model):
     airport = relationship("Airport", backref="intermediate_airports")
 
 
+# Một lần nhập file lịch bay (timetable.run); next_row là số dòng lịch đã ghi xong, chạy lại cùng file
+# (cùng checksum) thì tiếp tục từ dòng này
+class TimetableImport(db.Model):
+    import_id = Column(Integer, primary_key=True, autoincrement=True)
+    filename = Column(String(255))
+    checksum = Column(String(64), nullable=False, unique=True)
+    total_rows = Column(Integer, nullable=False, default=0)
+    next_row = Column(Integer, nullable=False, default=0)
+    flights_created = Column(Integer, nullable=False, default=0)
+    status = Column(String(20), nullable=False, default='running')
+    seconds = Column(Float, nullable=False, default=0)
+    started_at = Column(DateTime, default=datetime.now)
+    finished_at = Column(DateTime)
+
+    def rows_per_second(self):
+        return round(self.next_row / self.seconds) if self.seconds else None
+
+
+# Số phiên bản của các bộ nhớ đệm trong tiến trình (vd. 'refdata'), tăng lên mỗi khi dữ liệu gốc thay đổi
+class CacheVersion(db.Model):
+    name = Column(String(50), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
+# Nhật ký vé bị sửa / huỷ / xoá (kể cả vé có chuyến bay hoặc ghế vừa đổi): khối phân tích vé của mỗi worker
+# đọc các dòng mới rồi nạp lại đúng các vé đó thay vì nạp lại toàn bộ
+class TicketChange(db.Model):
+    change_id = Column(Integer, primary_key=True, autoincrement=True)
+    ticket_id = Column(Integer, nullable=False)
+    changed_at = Column(DateTime, nullable=False, default=datetime.now, index=True)
+
+
+# Các bảng tổng hợp doanh thu / số vé (chỉ tính vé có ticket_status = True), được cộng dồn
+# trong cùng transaction khi vé được tạo / sửa / huỷ, trang thống kê chỉ cần đọc vài dòng
+class DailyRevenue(db.Model):
+    day = Column(Date, primary_key=True)
+    ticket_count = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0)
+
+
+class MonthlyRevenue(db.Model):
+    month = Column(String(7), primary_key=True)  # YYYY-MM
+    ticket_count = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0)
+
+
+class RouteRevenue(db.Model):
+    fr_id = Column(Integer, ForeignKey(FlightRoute.fr_id), primary_key=True)
+    ticket_count = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0)
+
+
+# Nhu cầu của tuyến (tỉ lệ lấp đầy các chuyến trong cửa sổ nhu cầu) do `flask reprice` tính và ghi lại;
+# pricing.quote() trong request chỉ đọc bảng nhỏ này (một dòng / tuyến)
+class RouteDemand(db.Model):
+    fr_id = Column(Integer, ForeignKey(FlightRoute.fr_id), primary_key=True)
+    load_factor = Column(Float, nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=False, default=datetime.now)
+
+
+def sync_seat_inventory(connection, flight_id):
+    # Tính lại toàn bộ tồn kho ghế của một chuyến bay (dùng khi tạo chuyến bay hoặc đổi máy bay)
+    inventory = SeatInventory.__table__
+    plane_id = connection.execute(select(Flight.plane_id).where(Flight.flight_id == flight_id)).scalar()
+    capacity = dict(connection.execute(
+        select(Seat.seat_class, func.count(Seat.seat_id))
+        .where(Seat.plane_id == plane_id)
+        .group_by(Seat.seat_class)
+    ).all())
+    booked = dict(connection.execute(
+        select(Seat.seat_class, func.count(Ticket.ticket_id))
+        .join(Seat, Seat.seat_id == Ticket.seat_id)
+        .where(Ticket.flight_id == flight_id, Ticket.ticket_status == True)
+        .group_by(Seat.seat_class)
+    ).all())
+
+    held = dict(connection.execute(
+        select(SeatHold.seat_class, func.sum(SeatHold.quantity))
+        .where(SeatHold.flight_id == flight_id)
+        .group_by(SeatHold.seat_class)
+    ).all())
+
+    connection.execute(delete(inventory).where(inventory.c.flight_id == flight_id))
+    connection.execute(insert(inventory), [
+        {'flight_id': flight_id, 'seat_class': seat_class, 'capacity': capacity.get(seat_class, 0),
+         'booked': booked.get(seat_class, 0), 'held': held.get(seat_class, 0)}
+        for seat_class in SeatClass
+    ])
+
+
+def _change_booked_seats(connection, flight_id, seat_id, delta):
+    inventory = SeatInventory.__table__
+    seat_class = select(Seat.seat_class).where(Seat.seat_id == seat_id).scalar_subquery()
+    connection.execute(
+        update(inventory)
+        .where(inventory.c.flight_id == flight_id, inventory.c.seat_class == seat_class)
+        .values(booked=inventory.c.booked + delta)
+    )
+
+
+def _add_to_rollup(connection, model, key, ticket_count, revenue):
+    table = model.__table__
+    key_column = table.primary_key.columns.values()[0]
+    if connection.dialect.name == 'mysql':
+        statement = mysql_insert(table).values({key_column.name: key, 'ticket_count': ticket_count,
+                                                'revenue': revenue})
+        connection.execute(statement.on_duplicate_key_update(
+            ticket_count=table.c.ticket_count + ticket_count, revenue=table.c.revenue + revenue))
+        return
+
+    result = connection.execute(update(table).where(key_column == key).values(
+        ticket_count=table.c.ticket_count + ticket_count, revenue=table.c.revenue + revenue))
+    if result.rowcount == 0:
+        connection.execute(insert(table).values({key_column.name: key, 'ticket_count': ticket_count,
+                                                 'revenue': revenue}))
+
+
+def _change_revenue(connection, flight_id, issue_date, ticket_price, sign):
+    fr_id = connection.execute(select(Flight.flight_route_id).where(Flight.flight_id == flight_id)).scalar()
+    revenue = sign * (ticket_price or 0)
+    _add_to_rollup(connection, DailyRevenue, issue_date, sign, revenue)
+    _add_to_rollup(connection, MonthlyRevenue, issue_date.strftime('%Y-%m'), sign, revenue)
+    _add_to_rollup(connection, RouteRevenue, fr_id, sign, revenue)
+
+
+def _previous_value(target, attr):
+    history = inspect(target).attrs[attr].history
+    if history.deleted:
+        return history.deleted[0]
+    return getattr(target, attr)
+
+
+@event.listens_for(Flight, 'after_insert')
+def flight_inserted(mapper, connection, target):
+    sync_seat_inventory(connection, target.flight_id)
+
+
+@event.listens_for(Flight, 'after_update')
+def flight_updated(mapper, connection, target):
+    if inspect(target).attrs.plane_id.history.has_changes():
+        sync_seat_inventory(connection, target.flight_id)
+
+
+def _sync_planes_inventory(connection, plane_ids):
+    # Ghế của các máy bay thay đổi: tính lại tồn kho của mọi chuyến bay dùng các máy bay đó bằng 3 truy vấn gom nhóm
+    inventory = SeatInventory.__table__
+    flights = Flight.plane_id.in_(plane_ids)
+    flight_ids = connection.execute(select(Flight.flight_id).where(flights)).scalars().all()
+    if not flight_ids:
+        return
+    capacity = {(flight_id, seat_class): total for flight_id, seat_class, total in connection.execute(
+        select(Flight.flight_id, Seat.seat_class, func.count(Seat.seat_id))
+        .join(Seat, Seat.plane_id == Flight.plane_id)
+        .where(flights)
+        .group_by(Flight.flight_id, Seat.seat_class))}
+    booked = {(flight_id, seat_class): total for flight_id, seat_class, total in connection.execute(
+        select(Ticket.flight_id, Seat.seat_class, func.count(Ticket.ticket_id))
+        .join(Seat, Seat.seat_id == Ticket.seat_id)
+        .join(Flight, Flight.flight_id == Ticket.flight_id)
+        .where(flights, Ticket.ticket_status == True)
+        .group_by(Ticket.flight_id, Seat.seat_class))}
+    held = {(flight_id, seat_class): total for flight_id, seat_class, total in connection.execute(
+        select(SeatHold.flight_id, SeatHold.seat_class, func.sum(SeatHold.quantity))
+        .join(Flight, Flight.flight_id == SeatHold.flight_id)
+        .where(flights)
+        .group_by(SeatHold.flight_id, SeatHold.seat_class))}
+
+    connection.execute(delete(inventory).where(inventory.c.flight_id.in_(select(Flight.flight_id).where(flights))))
+    connection.execute(insert(inventory), [
+        {'flight_id': flight_id, 'seat_class': seat_class, 'capacity': capacity.get((flight_id, seat_class), 0),
+         'booked': booked.get((flight_id, seat_class), 0), 'held': held.get((flight_id, seat_class), 0)}
+        for flight_id in flight_ids
+        for seat_class in SeatClass
+    ])
+
+
+def _plane_changed(target, plane_id):
+    # Chỉ ghi lại máy bay bị ảnh hưởng; tồn kho được tính lại một lần cho mỗi máy bay ở cuối flush (after_flush),
+    # không phải một lần cho mỗi ghế (thêm cả sơ đồ ghế = số ghế x số chuyến bay)
+    inspect(target).session.info.setdefault('inventory_planes', set()).add(plane_id)
+
+
+@event.listens_for(Seat, 'after_insert')
+@event.listens_for(Seat, 'after_delete')
+def seat_added_or_removed(mapper, connection, target):
+    _plane_changed(target, target.plane_id)
+
+
+@event.listens_for(Seat, 'before_update')
+def seat_updated(mapper, connection, target):
+    # Đổi hạng ghế chuyển cả sức chứa lẫn vé đã bán sang hạng mới; chuyển ghế sang máy bay khác thì tính lại cả hai máy bay.
+    # Máy bay cũ đọc từ dòng chưa bị UPDATE (ghế đã hết hạn sau commit thì history không giữ giá trị cũ)
+    state = inspect(target)
+    if state.attrs.plane_id.history.has_changes():
+        _plane_changed(target, connection.execute(select(Seat.plane_id).where(Seat.seat_id == target.seat_id)).scalar())
+        _plane_changed(target, target.plane_id)
+    elif state.attrs.seat_class.history.has_changes():
+        _plane_changed(target, target.plane_id)
+
+
+@event.listens_for(Session, 'after_flush')
+def sync_changed_planes(session, flush_context):
+    plane_ids = session.info.pop('inventory_planes', None)
+    if plane_ids:
+        _sync_planes_inventory(session.connection(), plane_ids)
+
+
+@event.listens_for(Ticket, 'after_insert')
+def ticket_inserted(mapper, connection, target):
+    if target.ticket_status:
+        _change_booked_seats(connection, target.flight_id, target.seat_id, 1)
+        _change_revenue(connection, target.flight_id, target.issue_date, target.ticket_price, 1)
+
+
+@event.listens_for(Ticket, 'after_update')
+def ticket_updated(mapper, connection, target):
+    # Trừ theo trạng thái cũ rồi cộng theo trạng thái mới (đổi chuyến, đổi ghế, đổi giá, huỷ vé)
+    state = inspect(target)
+    changed = {attr for attr in ('ticket_status', 'flight_id', 'seat_id', 'issue_date', 'ticket_price')
+               if state.attrs[attr].history.has_changes()}
+    was_active = _previous_value(target, 'ticket_status')
+    old_flight_id = _previous_value(target, 'flight_id')
+
+    if changed & {'ticket_status', 'flight_id', 'seat_id'}:
+        if was_active:
+            _change_booked_seats(connection, old_flight_id, _previous_value(target, 'seat_id'), -1)
+        if target.ticket_status:
+            _change_booked_seats(connection, target.flight_id, target.seat_id, 1)
+
+    if changed & {'ticket_status', 'flight_id', 'issue_date', 'ticket_price'}:
+        if was_active:
+            _change_revenue(connection, old_flight_id, _previous_value(target, 'issue_date'),
+                            _previous_value(target, 'ticket_price'), -1)
+        if target.ticket_status:
+            _change_revenue(connection, target.flight_id, target.issue_date, target.ticket_price, 1)
+
+
+@event.listens_for(Ticket, 'after_delete')
+def ticket_deleted(mapper, connection, target):
+    if target.ticket_status:
+        _change_booked_seats(connection, target.flight_id, target.seat_id, -1)
+        _change_revenue(connection, target.flight_id, target.issue_date, target.ticket_price, -1)
+
+
 
 
 
 if __name__ == '__main__':
+    configure()
     with app.app_context():
         db.create_all()  # Tạo lại các bảng
 
@@ -0,0 +1,166 @@
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import select, update, insert, delete, bindparam, func
+from app import db, routing, farecalendar, itinerary
+from app.models import Flight, SeatInventory, RouteDemand
+
+# Hệ số giá nội suy tuyến tính giữa các điểm mốc: (mốc, hệ số)
+# - tỉ lệ lấp đầy của chuyến bay (ghế đã bán + đang giữ / tổng số ghế)
+LOAD_CURVE = ([0.0, 0.5, 0.8, 1.0], [0.85, 1.0, 1.3, 1.8])
+# - số ngày còn lại trước giờ khởi hành
+DAYS_CURVE = ([0, 3, 7, 14, 30, 60], [1.5, 1.3, 1.15, 1.0, 0.95, 0.9])
+# - nhu cầu của tuyến: tỉ lệ lấp đầy trung bình các chuyến của tuyến trong DEMAND_WINDOW_DAYS ngày tới
+DEMAND_CURVE = ([0.0, 0.3, 0.6, 1.0], [0.9, 1.0, 1.1, 1.25])
+DEMAND_WINDOW_DAYS = 30
+# Mỗi worker đọc lại bảng RouteDemand (reprice ghi) sau mỗi khoảng này
+DEMAND_CACHE_SECONDS = 300
+
+# Giá luôn nằm trong [MIN_FACTOR, MAX_FACTOR] lần giá gốc và được làm tròn tới ROUND_TO đồng
+MIN_FACTOR = 0.7
+MAX_FACTOR = 2.5
+ROUND_TO = 1000
+BATCH_SIZE = 5000
+
+# NumPy chỉ được nạp khi tính giá lần đầu, không phải lúc khởi động app (create_app / lệnh CLI)
+np = None
+
+
+def _load_numpy():
+    global np
+    if np is None:
+        import numpy
+        np = numpy
+
+
+def compute_prices(base, load, days, demand):
+    # Nhận số hoặc mảng NumPy cùng độ dài (mỗi phần tử một chuyến bay), không lặp từng chuyến trong Python
+    _load_numpy()
+    factor = np.interp(load, *LOAD_CURVE) * np.interp(days, *DAYS_CURVE) * np.interp(demand, *DEMAND_CURVE)
+    prices = base * np.clip(factor, MIN_FACTOR, MAX_FACTOR)
+    return np.where(base >= ROUND_TO, np.round(prices / ROUND_TO) * ROUND_TO, np.round(prices, 2))
+
+
+def _load_factors(sold, capacity):
+    return np.divide(sold, capacity, out=np.zeros_like(sold), where=capacity > 0)
+
+
+def _future_flights(now):
+    # Một dòng / chuyến bay chưa khởi hành kèm tổng số ghế đã bán + đang giữ và tổng số ghế.
+    # Tồn kho được gom theo flight_id trong subquery (chỉ các chuyến trong khoảng giờ) nên câu ngoài không GROUP BY
+    # và lọc flight theo khoảng f_dept_time trên ix_flight_dept_time thay vì duyệt theo khoá chính
+    upcoming = Flight.f_dept_time > now
+    inventory = select(
+        SeatInventory.flight_id,
+        func.sum(SeatInventory.booked + SeatInventory.held).label('sold'),
+        func.sum(SeatInventory.capacity).label('capacity')
+    ).where(
+        SeatInventory.flight_id.in_(select(Flight.flight_id).where(upcoming))
+    ).group_by(SeatInventory.flight_id).subquery()
+    return db.session.query(
+        Flight.flight_id, Flight.flight_route_id, Flight.f_dept_time, Flight.base_price, Flight.flight_price,
+        func.coalesce(inventory.c.sold, 0), func.coalesce(inventory.c.capacity, 0)
+    ).outerjoin(
+        inventory, inventory.c.flight_id == Flight.flight_id
+    ).filter(upcoming).all()
+
+
+def _route_loads(route_ids, sold, capacity):
+    # Nhu cầu của tuyến: gom ghế theo tuyến bằng bincount trên chỉ số tuyến của từng chuyến
+    routes, route_index = np.unique(np.array(route_ids), return_inverse=True)
+    return routes, route_index, _load_factors(np.bincount(route_index, weights=sold, minlength=len(routes)),
+                                              np.bincount(route_index, weights=capacity, minlength=len(routes)))
+
+
+def reprice(now=None, batch_size=BATCH_SIZE):
+    # Tính lại giá của mọi chuyến bay chưa khởi hành: đọc 1 lần, tính trên mảng NumPy, ghi lại bằng UPDATE executemany
+    # chỉ cho các chuyến đổi giá
+    started = time.perf_counter()
+    _load_numpy()
+    now = now or datetime.now()
+    flights = Flight.__table__
+
+    # Lần chạy đầu: giá đang có trở thành giá gốc
+    db.session.execute(update(flights).where(flights.c.base_price.is_(None)).values(base_price=flights.c.flight_price))
+
+    rows = _future_flights(now)
+    if not rows:
+        db.session.commit()
+        return {'flights': 0, 'changed': 0, 'seconds': round(time.perf_counter() - started, 2)}
+
+    ids, route_ids, dept_times, base, current, sold, capacity = zip(*rows)
+    ids = np.array(ids)
+    base = np.array(base, dtype=float)  # None -> nan: chuyến chưa có giá được bỏ qua
+    current = np.array(current, dtype=float)
+    sold = np.array(sold, dtype=float)
+    capacity = np.array(capacity, dtype=float)
+    days = (np.array(dept_times, dtype='datetime64[us]') - np.datetime64(now, 'us')) / np.timedelta64(1, 'D')
+
+    in_window = days <= DEMAND_WINDOW_DAYS
+    routes, route_index, route_load = _route_loads(route_ids, sold * in_window, capacity * in_window)
+
+    prices = compute_prices(base, _load_factors(sold, capacity), days, route_load[route_index])
+    changed = ~np.isnan(prices) & ~np.isclose(prices, current)
+
+    updates = [{'b_flight_id': int(flight_id), 'b_price': float(price)}
+               for flight_id, price in zip(ids[changed], prices[changed])]
+    statement = update(flights).where(flights.c.flight_id == bindparam('b_flight_id')).values(
+        flight_price=bindparam('b_price'))
+    for i in range(0, len(updates), batch_size):
+        db.session.execute(statement, updates[i:i + batch_size])
+    # Nhu cầu tuyến được ghi lại cùng transaction để quote() của mọi worker đọc thay vì tự tính lại
+    demand = dict(zip(routes.tolist(), route_load.tolist()))
+    db.session.execute(delete(RouteDemand))
+    db.session.execute(insert(RouteDemand), [{'fr_id': fr_id, 'load_factor': load, 'updated_at': now}
+                                             for fr_id, load in demand.items()])
+    db.session.commit()
+
+    _set_route_demand(demand)
+    farecalendar.invalidate()
+    itinerary.invalidate()
+    return {'flights': len(ids), 'changed': len(updates), 'seconds': round(time.perf_counter() - started, 2)}
+
+
+_route_demand = {}
+_demand_loaded_at = 0
+_lock = threading.Lock()
+
+
+def _set_route_demand(demand):
+    global _route_demand, _demand_loaded_at
+    _route_demand = demand
+    _demand_loaded_at = time.time()
+
+
+@routing.replica
+def _load_route_demand():
+    return dict(db.session.query(RouteDemand.fr_id, RouteDemand.load_factor).all())
+
+
+def route_demand(fr_id):
+    # Chỉ đọc nhu cầu đã được reprice ghi lại; tuyến chưa có (chưa chạy reprice) tính như không có nhu cầu
+    if time.time() - _demand_loaded_at > DEMAND_CACHE_SECONDS:
+        with _lock:
+            if time.time() - _demand_loaded_at > DEMAND_CACHE_SECONDS:
+                _set_route_demand(_load_route_demand())
+    return _route_demand.get(fr_id, 0.0)
+
+
+def quote(flight, now=None):
+    # Giá hiện tại (hạng phổ thông) của một chuyến bay, cùng công thức với reprice nhưng dùng tồn kho ghế mới nhất;
+    # trang tìm kiếm nạp sẵn seat_inventories nên không phát sinh thêm câu SQL
+    capacity = sum(inventory.capacity for inventory in flight.seat_inventories)
+    sold = sum(inventory.booked + inventory.held for inventory in flight.seat_inventories)
+    return quote_values(flight.base_price, flight.flight_price, flight.f_dept_time, flight.flight_route_id, sold,
+                        capacity, now)
+
+
+def quote_values(base_price, flight_price, dept_time, fr_id, sold, capacity, now=None):
+    # Như quote() nhưng nhận sẵn các giá trị (dòng gọn của /api/search không phải đối tượng Flight)
+    now = now or datetime.now()
+    base = base_price if base_price is not None else flight_price
+    if base is None or dept_time <= now:
+        return flight_price
+
+    days = (dept_time - now).total_seconds() / 86400
+    return float(compute_prices(base, sold / capacity if capacity else 0.0, days, route_demand(fr_id)))
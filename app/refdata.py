@@ -0,0 +1,89 @@
+import threading
+import time
+from collections import namedtuple
+from types import MappingProxyType
+from app import db
+from app.models import Airport, Company, Plane, FlightRoute, CacheVersion
+
+# Các worker đọc lại số phiên bản trong bảng CacheVersion tối đa một lần sau mỗi khoảng này
+VERSION_CHECK_SECONDS = 5
+CACHE_NAME = 'refdata'
+
+# Bản ghi gọn (không phải đối tượng ORM), tên thuộc tính giữ giống model để template dùng như cũ
+AirportRecord = namedtuple('AirportRecord', ['airport_id', 'airport_name', 'airport_address', 'airport_image'])
+CompanyRecord = namedtuple('CompanyRecord', ['com_id', 'com_name', 'com_country'])
+PlaneRecord = namedtuple('PlaneRecord', ['plane_id', 'plane_name', 'total_seat', 'company'])
+RouteRecord = namedtuple('RouteRecord', ['fr_id', 'departure_airport', 'arrival_airport', 'distance', 'description'])
+
+
+class Snapshot:
+    def __init__(self, version):
+        self.version = version
+
+        airports = {row[0]: AirportRecord(*row) for row in db.session.query(
+            Airport.airport_id, Airport.airport_name, Airport.airport_address, Airport.airport_image)}
+        companies = {row[0]: CompanyRecord(*row) for row in db.session.query(
+            Company.com_id, Company.com_name, Company.com_country)}
+        planes = {plane_id: PlaneRecord(plane_id, plane_name, total_seat, companies.get(company_id))
+                  for plane_id, plane_name, total_seat, company_id in db.session.query(
+                      Plane.plane_id, Plane.plane_name, Plane.total_seat, Plane.company_id)}
+        routes = {fr_id: RouteRecord(fr_id, airports[dep_id], airports[arr_id], distance, description)
+                  for fr_id, dep_id, arr_id, distance, description in db.session.query(
+                      FlightRoute.fr_id, FlightRoute.departure_airport_id, FlightRoute.arrival_airport_id,
+                      FlightRoute.distance, FlightRoute.description)}
+
+        routes_between = {}
+        for route in routes.values():
+            key = (route.departure_airport.airport_id, route.arrival_airport.airport_id)
+            routes_between[key] = routes_between.get(key, ()) + (route.fr_id,)
+
+        self.airports = MappingProxyType(airports)
+        self.companies = MappingProxyType(companies)
+        self.planes = MappingProxyType(planes)
+        self.routes = MappingProxyType(routes)
+        self.routes_between = MappingProxyType(routes_between)
+        self.airport_by_name = MappingProxyType({a.airport_name: a for a in airports.values()})
+
+
+def read_version(name):
+    return db.session.query(CacheVersion.version).filter(CacheVersion.name == name).scalar() or 0
+
+
+def bump_version(name):
+    # Tăng số phiên bản trong DB để mọi worker biết bộ nhớ đệm `name` đã cũ
+    updated = CacheVersion.query.filter(CacheVersion.name == name).update(
+        {CacheVersion.version: CacheVersion.version + 1})
+    if not updated:
+        db.session.add(CacheVersion(name=name, version=1))
+    db.session.commit()
+
+
+_snapshot = None
+_checked_at = 0
+_lock = threading.Lock()
+
+
+def get_snapshot():
+    # Đọc biến toàn cục vào biến cục bộ rồi trả về biến đó: invalidate() ở luồng khác có thể đặt _snapshot = None
+    global _snapshot, _checked_at
+    snapshot = _snapshot
+    if snapshot is not None and time.time() - _checked_at < VERSION_CHECK_SECONDS:
+        return snapshot
+
+    with _lock:
+        snapshot = _snapshot
+        if snapshot is None or time.time() - _checked_at >= VERSION_CHECK_SECONDS:
+            version = read_version(CACHE_NAME)
+            if snapshot is None or snapshot.version != version:
+                snapshot = Snapshot(version)
+                _snapshot = snapshot
+            _checked_at = time.time()
+    return snapshot
+
+
+def invalidate():
+    # Gọi từ các ModelView của Airport, Company, Plane, FlightRoute sau khi dữ liệu thay đổi
+    global _snapshot
+    bump_version(CACHE_NAME)
+    with _lock:
+        _snapshot = None
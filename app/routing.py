@@ -0,0 +1,102 @@
+import itertools
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from flask import current_app, g, session, has_request_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.sql import Select
+
+# Module này được import trong app/__init__.py trước khi tạo db nên không import gì từ app ở đầu file
+
+_use_replica = ContextVar('use_replica', default=False)
+_round_robin = itertools.count()
+_lock = threading.Lock()
+_routed = Counter()  # bind -> số câu SELECT đã chuyển tới bind đó
+
+
+def replica_binds():
+    return current_app.config.get('REPLICA_BINDS') or []
+
+
+@contextmanager
+def use_replica():
+    token = _use_replica.set(True)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+def replica(f):
+    # Đánh dấu hàm chỉ đọc: các câu SELECT bên trong được gửi tới replica (nếu có cấu hình)
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        with use_replica():
+            return f(*args, **kwargs)
+    return wrapper
+
+
+def primary_required():
+    # Read-your-writes: request đã ghi, hoặc người dùng vừa ghi trong READ_YOUR_WRITES_SECONDS, thì đọc từ primary
+    if not has_request_context():
+        return False
+    if g.get('db_wrote'):
+        return True
+    return session.get('primary_until', 0) > time.time()
+
+
+def _pick_replica(engines):
+    binds = replica_binds()
+    if not binds:
+        return None, None
+    key = binds[next(_round_robin) % len(binds)]
+    return key, engines.get(key)
+
+
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and _use_replica.get() and not self._flushing and isinstance(clause, Select) \
+                and not primary_required():
+            key, engine = _pick_replica(self._db.engines)
+            if engine is not None:
+                _count(key)
+                return engine
+        _count(None)
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _count(key):
+    with _lock:
+        _routed[key] += 1
+
+
+def routed():
+    with _lock:
+        return dict(_routed)
+
+
+def reset():
+    with _lock:
+        _routed.clear()
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def after_flush(db_session, flush_context):
+    # Đã ghi (kể cả chưa commit, ví dụ autoflush): các câu đọc sau đó của request phải thấy thay đổi này
+    if has_request_context():
+        g.db_wrote = True
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def after_commit(db_session):
+    # Mọi thay đổi đều đi qua commit: ghim request hiện tại và người dùng này vào primary một thời gian
+    # để không đọc phải replica chưa kịp đồng bộ
+    if has_request_context():
+        g.db_wrote = True
+        seconds = current_app.config.get('READ_YOUR_WRITES_SECONDS')
+        if seconds and replica_binds():
+            session['primary_until'] = time.time() + seconds
@@ -0,0 +1,86 @@
+from sqlalchemy import inspect, literal, UniqueConstraint
+from sqlalchemy.schema import CreateColumn
+from app import db
+
+# Không có công cụ migration: so sánh các model với database đang chạy và chỉ thêm những gì còn thiếu
+# (bảng, cột, index, unique constraint); không xoá hay sửa cột / index đã có
+
+
+def _existing_indexes(inspector, table_name):
+    names = {ix['name'] for ix in inspector.get_indexes(table_name)}
+    return names | {uc['name'] for uc in inspector.get_unique_constraints(table_name)}
+
+
+def pending_changes(engine=None):
+    inspector = inspect(engine or db.engine)
+    tables = set(inspector.get_table_names())
+    changes = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in tables:
+            changes.append(('table', table, None))
+            continue
+        columns = {c['name'] for c in inspector.get_columns(table.name)}
+        changes += [('column', table, column) for column in table.columns if column.name not in columns]
+        indexes = _existing_indexes(inspector, table.name)
+        changes += [('index', table, index) for index in table.indexes if index.name not in indexes]
+        changes += [('unique', table, constraint) for constraint in table.constraints
+                    if isinstance(constraint, UniqueConstraint) and constraint.name and constraint.name not in indexes]
+    return changes
+
+
+def describe(change):
+    kind, table, item = change
+    if kind == 'table':
+        return f"create table {table.name}"
+    if kind == 'column':
+        return f"add column {table.name}.{item.name}"
+    return f"create {'unique ' if kind == 'unique' else ''}index {item.name} on {table.name} " \
+           f"({', '.join(c.name for c in item.columns)})"
+
+
+def _add_column_ddl(conn, table, column):
+    preparer = conn.dialect.identifier_preparer
+    ddl = f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {CreateColumn(column).compile(dialect=conn.dialect)}"
+    # Cột NOT NULL thêm vào bảng đã có dữ liệu cần DEFAULT cho các dòng cũ (lấy từ default của model)
+    if not column.nullable and column.server_default is None and column.default is not None \
+            and column.default.is_scalar:
+        value = literal(column.default.arg, column.type).compile(dialect=conn.dialect,
+                                                                 compile_kwargs={'literal_binds': True})
+        ddl += f" DEFAULT {value}"
+    return ddl
+
+
+def _unique_index_ddl(conn, table, constraint):
+    preparer = conn.dialect.identifier_preparer
+    return f"CREATE UNIQUE INDEX {preparer.quote(constraint.name)} ON {preparer.format_table(table)} " \
+           f"({', '.join(preparer.quote(c.name) for c in constraint.columns)})"
+
+
+def _analyze(conn, tables):
+    # Cập nhật thống kê để bộ tối ưu truy vấn biết tới các index mới
+    if conn.dialect.name == 'mysql':
+        preparer = conn.dialect.identifier_preparer
+        conn.exec_driver_sql(f"ANALYZE TABLE {', '.join(preparer.format_table(t) for t in tables)}")
+    elif conn.dialect.name in ('sqlite', 'postgresql'):
+        conn.exec_driver_sql('ANALYZE')
+
+
+def upgrade(engine=None, progress=None):
+    engine = engine or db.engine
+    changes = pending_changes(engine)
+    with engine.begin() as conn:
+        for change in changes:
+            kind, table, item = change
+            if progress:
+                progress(describe(change))
+            if kind == 'table':
+                table.create(conn)
+            elif kind == 'column':
+                conn.exec_driver_sql(_add_column_ddl(conn, table, item))
+            elif kind == 'index':
+                item.create(conn)
+            else:
+                conn.exec_driver_sql(_unique_index_ddl(conn, table, item))
+        if changes:
+            _analyze(conn, {table for _, table, _ in changes})
+    return changes
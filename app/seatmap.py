@@ -0,0 +1,123 @@
+from collections import defaultdict
+from sqlalchemy import insert, update, delete, exists, func
+from app import db, dao, refdata, farecalendar, analytics
+from app.models import Plane, Seat, SeatClass, Ticket, Booking
+
+# Sơ đồ ghế mẫu: danh sách khoang (hạng ghế, hàng đầu, hàng cuối, các chữ cái ghế trong một hàng)
+SEAT_LAYOUTS = {
+    'A321': [(SeatClass.BUSINESS, 1, 4, 'ACDF'), (SeatClass.ECONOMY, 5, 36, 'ABCDEF')],
+    'A350': [(SeatClass.BUSINESS, 1, 8, 'ADGK'), (SeatClass.ECONOMY, 10, 40, 'ABCDEFGHK')],
+    'B737': [(SeatClass.BUSINESS, 1, 3, 'ACDF'), (SeatClass.ECONOMY, 4, 31, 'ABCDEF')],
+    'B787': [(SeatClass.BUSINESS, 1, 7, 'ADGK'), (SeatClass.ECONOMY, 8, 30, 'ABCDEFGHK')],
+    'E190': [(SeatClass.BUSINESS, 1, 3, 'ACD'), (SeatClass.ECONOMY, 4, 27, 'ACDF')],
+}
+PLANE_BATCH_SIZE = 200
+BATCH_SIZE = 2000
+
+
+def layout_seats(layout):
+    # [(seat_number, seat_code, seat_class)], seat_number đánh số liên tục từ 1
+    seats = []
+    for seat_class, first_row, last_row, letters in SEAT_LAYOUTS[layout]:
+        for row in range(first_row, last_row + 1):
+            for letter in letters:
+                seats.append((len(seats) + 1, f"{row}{letter}", seat_class))
+    return seats
+
+
+def guess_layout(plane_name):
+    # "Airbus A321" -> A321, "Boeing 787" -> B787
+    name = (plane_name or '').upper()
+    for layout in SEAT_LAYOUTS:
+        if layout in name or layout[1:] in name.split():
+            return layout
+    return None
+
+
+def _execute_in_batches(statement, rows):
+    for i in range(0, len(rows), BATCH_SIZE):
+        db.session.execute(statement, rows[i:i + BATCH_SIZE])
+
+
+def _generate_batch(planes, layout, stats):
+    plane_ids = [plane_id for plane_id, _, _ in planes]
+    existing = defaultdict(dict)
+    for seat_id, plane_id, seat_number, seat_code, seat_class in db.session.query(
+            Seat.seat_id, Seat.plane_id, Seat.seat_number, Seat.seat_code, Seat.seat_class
+    ).filter(Seat.plane_id.in_(plane_ids)):
+        existing[plane_id][seat_number] = (seat_id, seat_code, seat_class)
+
+    new_rows, changed_rows, surplus_ids, plane_rows = [], [], [], []
+    for plane_id, plane_name, plane_layout in planes:
+        name = layout or plane_layout or guess_layout(plane_name)
+        if name not in SEAT_LAYOUTS:
+            stats['skipped'] += 1
+            continue
+
+        seats = layout_seats(name)
+        current = existing[plane_id]
+        for seat_number, seat_code, seat_class in seats:
+            if seat_number not in current:
+                new_rows.append({'plane_id': plane_id, 'seat_number': seat_number, 'seat_code': seat_code,
+                                 'seat_class': seat_class, 'seat_status': False})
+            elif current[seat_number][1:] != (seat_code, seat_class):
+                changed_rows.append({'seat_id': current[seat_number][0], 'seat_code': seat_code,
+                                     'seat_class': seat_class})
+        surplus_ids.extend(seat_id for seat_number, (seat_id, _, _) in current.items() if seat_number > len(seats))
+
+        plane_rows.append({'plane_id': plane_id, 'seat_layout': name})
+
+    # Ghế thừa chỉ bị xoá khi chưa có vé / đặt chỗ nào tham chiếu tới
+    for i in range(0, len(surplus_ids), BATCH_SIZE):
+        result = db.session.execute(delete(Seat).where(
+            Seat.seat_id.in_(surplus_ids[i:i + BATCH_SIZE]),
+            ~exists().where(Ticket.seat_id == Seat.seat_id),
+            ~exists().where(Booking.seat_id == Seat.seat_id)
+        ).execution_options(synchronize_session=False))
+        stats['deleted'] += result.rowcount
+
+    _execute_in_batches(insert(Seat), new_rows)
+    _execute_in_batches(update(Seat), changed_rows)
+    # Ghế thừa còn vé thì vẫn ở lại: total_seat đếm theo ghế thực có sau khi sinh, không theo sơ đồ
+    updated_plane_ids = [row['plane_id'] for row in plane_rows]
+    totals = dict(db.session.query(Seat.plane_id, func.count(Seat.seat_id)).filter(
+        Seat.plane_id.in_(updated_plane_ids)).group_by(Seat.plane_id).all())
+    for row in plane_rows:
+        row['total_seat'] = totals.get(row['plane_id'], 0)
+    _execute_in_batches(update(Plane), plane_rows)
+
+    # Sức chứa và số vé đã bán theo hạng ghế (ghế có vé có thể vừa đổi hạng) của mọi chuyến bay dùng các máy bay này
+    if updated_plane_ids:
+        dao.rebuild_seat_inventory(plane_ids=updated_plane_ids)
+
+    stats['planes'] += len(plane_rows)
+    stats['inserted'] += len(new_rows)
+    stats['updated'] += len(changed_rows)
+
+
+def generate_seats(plane_ids=None, company_id=None, layout=None):
+    # Tạo / cập nhật toàn bộ ghế cho các máy bay (hoặc cả đội bay của một hãng) bằng bulk insert / update
+    if layout and layout not in SEAT_LAYOUTS:
+        raise ValueError(f"Không có sơ đồ ghế {layout}")
+
+    query = db.session.query(Plane.plane_id, Plane.plane_name, Plane.seat_layout)
+    if plane_ids:
+        query = query.filter(Plane.plane_id.in_(plane_ids))
+    if company_id:
+        query = query.filter(Plane.company_id == company_id)
+    planes = query.order_by(Plane.plane_id).all()
+
+    stats = defaultdict(int)
+    for i in range(0, len(planes), PLANE_BATCH_SIZE):
+        _generate_batch(planes[i:i + PLANE_BATCH_SIZE], layout, stats)
+        db.session.commit()
+
+    # total_seat của máy bay và số ghế của các chuyến bay đã đổi
+    if stats['planes']:
+        refdata.invalidate()
+        farecalendar.invalidate()
+    # Bulk update bỏ qua mapper event của Seat: hạng ghế đổi thì khối phân tích vé phải nạp lại
+    if stats['updated']:
+        analytics.invalidate()
+
+    return dict(stats)
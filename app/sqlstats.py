@@ -0,0 +1,161 @@
+import re
+import threading
+import time
+from collections import Counter, deque, namedtuple
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from app import app, db, routing
+
+# Số request gần nhất được giữ lại cho trang admin "SQL"
+ROLLING_REQUESTS = 2000
+
+RequestRecord = namedtuple('RequestRecord', ['endpoint', 'path', 'at', 'duration', 'db_time', 'statements',
+                                             'top_statement', 'top_count', 'lazy_loads'])
+EndpointStat = namedtuple('EndpointStat', ['endpoint', 'requests', 'p50', 'p95', 'max', 'db_time', 'statements',
+                                           'max_statements', 'top_statement', 'top_count'])
+
+
+class NPlusOneError(Exception):
+    pass
+
+
+class RequestStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.statements = 0
+        self.db_time = 0
+        self.fingerprints = Counter()
+        self.lazy_loads = Counter()
+
+
+def fingerprint(statement):
+    # Bỏ giá trị cụ thể để các câu SQL chỉ khác tham số được gom chung: IN (?, ?, ?) -> IN (?)
+    s = re.sub(r"'(?:[^']|'')*'", '?', statement)
+    s = re.sub(r'%\(\w+\)s|\b\d+(?:\.\d+)?\b', '?', s)
+    s = re.sub(r'\(\s*\?(?:\s*,\s*\?)*\s*\)', '(?)', s)
+    return ' '.join(s.split())
+
+
+def _current():
+    if has_request_context():
+        return g.get('sql_stats')
+    return None
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current() is not None:
+        conn.info.setdefault('sql_stats_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current()
+    started = conn.info.get('sql_stats_start')
+    if stats is None or not started:
+        return
+    stats.db_time += time.perf_counter() - started.pop()
+    stats.statements += 1
+    stats.fingerprints[fingerprint(statement)] += 1
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def do_orm_execute(state):
+    # Lazy load của cùng một quan hệ lặp lại nhiều lần trong một request là dấu hiệu N+1
+    stats = _current()
+    mode = app.config.get('NPLUSONE_MODE')
+    if stats is None or not mode or not state.is_relationship_load:
+        return
+
+    key = str(state.loader_strategy_path[-1])
+    stats.lazy_loads[key] += 1
+    if stats.lazy_loads[key] == app.config['NPLUSONE_THRESHOLD'] + 1:
+        message = f"N+1: {key} lazy-loaded more than {app.config['NPLUSONE_THRESHOLD']} times in {request.path}"
+        if mode == 'raise':
+            raise NPlusOneError(message)
+        app.logger.warning(message)
+
+
+_records = deque(maxlen=ROLLING_REQUESTS)
+_lock = threading.Lock()
+
+
+@app.before_request
+def start_request():
+    if app.config.get('SQL_STATS'):
+        g.sql_stats = RequestStats()
+
+
+@app.after_request
+def finish_request(response):
+    stats = _current()
+    if stats is None:
+        return response
+
+    duration = (time.perf_counter() - stats.started) * 1000
+    db_time = stats.db_time * 1000
+    response.headers.add('Server-Timing', f'db;dur={db_time:.1f};desc="{stats.statements} queries"')
+    response.headers.add('Server-Timing', f'app;dur={duration:.1f}')
+
+    if request.endpoint != 'static':
+        top_statement, top_count = stats.fingerprints.most_common(1)[0] if stats.fingerprints else (None, 0)
+        with _lock:
+            _records.append(RequestRecord(request.endpoint, request.full_path.rstrip('?'), time.time(), duration,
+                                          db_time, stats.statements, top_statement, top_count,
+                                          dict(stats.lazy_loads)))
+    return response
+
+
+def _percentile(values, p):
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def endpoint_stats():
+    # Gom các request gần nhất theo endpoint, endpoint chậm nhất (p95) đứng đầu
+    with _lock:
+        records = list(_records)
+
+    by_endpoint = {}
+    for r in records:
+        by_endpoint.setdefault(r.endpoint, []).append(r)
+
+    stats = []
+    for endpoint, rs in by_endpoint.items():
+        durations = sorted(r.duration for r in rs)
+        worst = max(rs, key=lambda r: r.top_count)
+        stats.append(EndpointStat(endpoint, len(rs), _percentile(durations, 50), _percentile(durations, 95),
+                                  durations[-1], sum(r.db_time for r in rs) / len(rs),
+                                  sum(r.statements for r in rs) / len(rs), max(r.statements for r in rs),
+                                  worst.top_statement, worst.top_count))
+    return sorted(stats, key=lambda s: s.p95, reverse=True)
+
+
+def slowest_requests(limit=20):
+    with _lock:
+        return sorted(_records, key=lambda r: r.duration, reverse=True)[:limit]
+
+
+def reset():
+    with _lock:
+        _records.clear()
+
+
+def pool_metrics():
+    # Trạng thái pool kết nối của từng bind (primary + replica) và số câu SELECT đã được định tuyến tới bind đó
+    routed = routing.routed()
+    metrics = []
+    for key, engine in sorted(db.engines.items(), key=lambda item: item[0] or ''):
+        pool = engine.pool
+        metrics.append({
+            'bind': key or 'primary',
+            'url': engine.url.render_as_string(hide_password=True),
+            'pool': type(pool).__name__,
+            'size': pool.size() if hasattr(pool, 'size') else None,
+            'checked_in': pool.checkedin() if hasattr(pool, 'checkedin') else None,
+            'checked_out': pool.checkedout() if hasattr(pool, 'checkedout') else None,
+            'overflow': pool.overflow() if hasattr(pool, 'overflow') else None,
+            'routed': routed.get(key, 0),
+        })
+    return metrics
@@ -15,6 +15,28 @@ window.onload = function() {
 };
 
 
+function payCartItem(flight_id, type_ticket) {
+    fetch('/api/payments', {
+        method: 'POST',
+        body: JSON.stringify({
+            "flight_id": flight_id,
+            "type_ticket": type_ticket
+        }),
+        headers: {
+            'Content-Type': 'application/json'
+        }
+    }).then(res => res.json())
+      .then(data => {
+          if (data.success) {
+              alert(`Thanh toán thành công! Mã vé: ${data.tickets.join(', ')}`);
+              location.href = '/cart';
+          } else {
+              alert(data.message);
+          }
+      })
+      .catch(err => console.error("Error:", err));
+}
+
 function addToCart(flight_id, plane_name, departure, arrival, day, type_ticket, price) {
     fetch('/api/carts', {
         method: "POST",
@@ -32,6 +54,12 @@ function addToCart(flight_id, plane_name, departure, arrival, day, type_ticket,
         }
     }).then(res => res.json())
       .then(data => {
+          // Hết ghế để giữ chỗ
+          if (data.error) {
+              alert(data.error);
+              return;
+          }
+
           // Cập nhật số lượng hiển thị trên giao diện (biểu tượng giỏ hàng)
           let counters = document.getElementsByClassName("cart-counter");
           for (let c of counters)
@@ -82,7 +110,7 @@ document.addEventListener('DOMContentLoaded', function () {
                         document.querySelector('.alert-info h3:nth-child(2)').innerText =
                             `Tổng số lượng: ${stats.total_quantity}`;
                     } else {
-                        alert('Có lỗi xảy ra khi cập nhật số lượng!');
+                        alert(data.message || 'Có lỗi xảy ra khi cập nhật số lượng!');
                     }
                 });
             });
@@ -157,19 +185,190 @@ function changeCity(cityName) {
   }
 
 
-  fetch(newUrl)
+  // chỉ lấy phần HTML danh sách tuyến bay (có ETag / Cache-Control) thay vì tải lại cả trang chủ
+  fetch('/api/routes/popular?departure=' + encodeURIComponent(cityName))
       .then(response => response.text())
-      .then(data => {
-
-          const parser = new DOMParser();
-          const doc = parser.parseFromString(data, 'text/html');
-          const newRoutes = doc.querySelector('#routes-section');
-
-          document.getElementById('routes-section').innerHTML = newRoutes.innerHTML;
+      .then(html => {
+          document.getElementById('routes-section').innerHTML = html;
 
           window.scrollTo(0, currentScrollPosition);
       })
       .catch(error => {
           console.error('Error fetching new data:', error);
       });
-}
\ No newline at end of file
+}
+
+// gợi ý sân bay cho ô Từ / Đến
+function setupAirportAutocomplete(inputId, listId) {
+    const input = document.getElementById(inputId);
+    const list = document.getElementById(listId);
+    if (!input || !list)
+        return;
+
+    let timer = null;
+    input.addEventListener('input', function () {
+        clearTimeout(timer);
+        const q = input.value.trim();
+        if (q.length === 0)
+            return;
+
+        timer = setTimeout(() => {
+            fetch('/api/airports?q=' + encodeURIComponent(q))
+                .then(res => res.json())
+                .then(data => {
+                    list.innerHTML = '';
+                    data.forEach(airport => {
+                        const option = document.createElement('option');
+                        option.value = airport.name;
+                        option.label = airport.address;
+                        list.appendChild(option);
+                    });
+                })
+                .catch(err => console.error("Error:", err));
+        }, 150);
+    });
+}
+
+// lịch giá rẻ nhất theo ngày cho cặp sân bay đang chọn (trang đặt vé)
+function loadFareCalendar() {
+    const section = document.getElementById('fare-calendar-section');
+    const departure = document.getElementById('departure');
+    const arrival = document.getElementById('arrival');
+    const dateInput = document.getElementById('departure_date');
+    if (!section || !departure.value || !arrival.value)
+        return;
+
+    const passengers = ['adult-count', 'child-count', 'infant-count']
+        .reduce((sum, id) => sum + (parseInt(document.getElementById(id).value) || 0), 0);
+    const params = new URLSearchParams({departure: departure.value, arrival: arrival.value, days: 30,
+                                        passengers: Math.max(passengers, 1)});
+    fetch('/api/fare-calendar?' + params)
+        .then(res => res.ok ? res.json() : null)
+        .then(data => {
+            const container = document.getElementById('fare-calendar');
+            container.innerHTML = '';
+            if (!data) {
+                section.style.display = 'none';
+                return;
+            }
+            data.calendar.forEach(day => {
+                const button = document.createElement('button');
+                button.type = 'button';
+                button.className = 'btn btn-sm ' + (day.date === data.cheapest ? 'btn-success'
+                    : day.date === dateInput.value ? 'btn-primary' : 'btn-outline-secondary');
+                button.disabled = day.economy === null;
+                button.innerHTML = day.date.slice(8) + '/' + day.date.slice(5, 7) + '<br>'
+                    + (day.economy === null ? '-' : Math.round(day.economy / 1000).toLocaleString() + 'K');
+                button.onclick = () => {
+                    dateInput.value = day.date;
+                    dateInput.form.submit();
+                };
+                container.appendChild(button);
+            });
+            section.style.display = '';
+        })
+        .catch(err => console.error("Error:", err));
+}
+
+document.addEventListener('DOMContentLoaded', function () {
+    setupAirportAutocomplete('departure', 'departures');
+    setupAirportAutocomplete('arrival', 'arrivals');
+
+    ['departure', 'arrival'].forEach(id => {
+        const input = document.getElementById(id);
+        if (input)
+            input.addEventListener('change', loadFareCalendar);
+    });
+    loadFareCalendar();
+});
+
+// Lọc / sắp xếp kết quả tìm kiếm trên trang booking qua /api/search; "Xem thêm" đọc trang tiếp theo bằng cursor
+let searchCursor = null;
+
+function escapeHtml(value) {
+    const div = document.createElement('div');
+    div.textContent = value === null || value === undefined ? '' : value;
+    return div.innerHTML;
+}
+
+function renderFlightCard(f) {
+    const time = iso => iso.slice(11, 16);
+    const button = (seatClass, seats) => seats > 0 ? `
+        <button class="btn btn-sm btn-success ms-1"
+                onclick='addToCart(${f.flight_id}, ${JSON.stringify(f.plane)}, ${JSON.stringify(f.departure)},
+                                   ${JSON.stringify(f.arrival)}, "${f.f_dept_time.slice(0, 10)}", "${seatClass}",
+                                   ${f.fare})'>
+            ${seatClass} (${seats})
+        </button>` : '';
+    const card = document.createElement('div');
+    card.className = 'card mb-3';
+    card.innerHTML = `
+        <div class="card-header bg-primary text-white">${escapeHtml(f.plane)} - ${escapeHtml(f.company)}</div>
+        <div class="card-body d-flex justify-content-between align-items-center">
+            <div class="time text-center">
+                <h6 class="mb-0 text-success">${time(f.f_dept_time)}</h6>
+                <span class="text-muted d-block">${escapeHtml(f.departure)}</span>
+            </div>
+            <div class="text-center">
+                <h6 class="mb-0 text-info">${f.flight_type}</h6>
+                <div><i class="bi bi-arrow-right"></i></div>
+                <span class="text-muted">${f.flight_duration} giờ</span>
+            </div>
+            <div class="time text-center">
+                <h6 class="mb-0 text-success">${time(f.flight_arr_time)}</h6>
+                <span class="text-muted d-block">${escapeHtml(f.arrival)}</span>
+            </div>
+            <div class="price text-danger">${Math.round(f.price).toLocaleString()} VNĐ</div>
+            <div>${button('ECONOMY', f.available_economy_seats)}${button('BUSINESS', f.available_business_seats)}</div>
+        </div>`;
+    return card;
+}
+
+function searchFlights(append) {
+    const form = document.getElementById('search-filters');
+    const params = new URLSearchParams({departure: form.dataset.departure, arrival: form.dataset.arrival,
+                                        departure_date: form.dataset.date, passengers: form.dataset.passengers,
+                                        sort: form.sort.value});
+    ['seat_class', 'max_price', 'flight_type', 'airline'].forEach(name => {
+        if (form[name].value)
+            params.set(name, form[name].value);
+    });
+    if (form.window.value) {
+        const [from, to] = form.window.value.split('-');
+        params.set('depart_from', from);
+        params.set('depart_to', to);
+    }
+    if (append && searchCursor)
+        params.set('after', searchCursor);
+
+    fetch('/api/search?' + params)
+        .then(res => res.json())
+        .then(data => {
+            const results = document.getElementById('flight-results');
+            const more = document.getElementById('load-more-flights');
+            if (data.error) {
+                results.innerHTML = `<div class="alert alert-danger">${escapeHtml(data.error)}</div>`;
+                more.style.display = 'none';
+                return;
+            }
+            if (!append)
+                results.innerHTML = data.flights.length ? '' : `<div class="alert alert-warning" role="alert">
+                    Không có chuyến bay nào phù hợp với tiêu chí tìm kiếm của bạn.</div>`;
+            data.flights.forEach(f => results.appendChild(renderFlightCard(f)));
+            searchCursor = data.next_cursor;
+            more.style.display = searchCursor ? '' : 'none';
+        })
+        .catch(err => console.error("Error:", err));
+}
+
+document.addEventListener('DOMContentLoaded', function () {
+    const form = document.getElementById('search-filters');
+    if (!form)
+        return;
+    form.addEventListener('change', () => searchFlights(false));
+    form.addEventListener('submit', e => {
+        e.preventDefault();
+        searchFlights(false);
+    });
+    document.getElementById('load-more-flights').addEventListener('click', () => searchFlights(true));
+});
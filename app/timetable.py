@@ -0,0 +1,253 @@
+import csv
+import hashlib
+import io
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+from sqlalchemy import insert, update, func
+from sqlalchemy.exc import IntegrityError
+from app import app, db, dao, refdata, itinerary, farecalendar
+from app.models import Flight, FlightType, IntermediateAirport, SeatInventory, SeatClass, Seat, TimetableImport
+
+# File lịch bay là CSV có dòng tiêu đề, mỗi dòng là một chuyến bay lặp lại hằng tuần trong một khoảng ngày:
+#   departure, arrival   tên sân bay đi / đến (phải có tuyến bay giữa hai sân bay)
+#   plane_id
+#   valid_from, valid_to khoảng ngày áp dụng YYYY-MM-DD (tính cả hai đầu)
+#   days                 ngày bay trong tuần kiểu SSIM, 1 = thứ 2: '1234567' hằng ngày, '1.3.5..' thứ 2, 4, 6
+#   dep_time, arr_time   giờ đi / giờ đến HH:MM; giờ đến không lớn hơn giờ đi thì là ngày hôm sau
+#   price
+#   stops                (không bắt buộc) điểm dừng 'tên sân bay:số phút' cách nhau bởi '|', theo thứ tự
+REQUIRED_COLUMNS = ['departure', 'arrival', 'plane_id', 'valid_from', 'valid_to', 'days', 'dep_time', 'arr_time',
+                    'price']
+# Số dòng lịch được mở rộng và ghi trong một transaction; chạy lại sau lỗi sẽ tiếp tục từ lô chưa ghi
+BATCH_ROWS = 200
+INSERT_CHUNK = 5000
+MAX_ERRORS = 50
+
+Schedule = namedtuple('Schedule', ['line', 'route_id', 'plane_id', 'valid_from', 'valid_to', 'weekdays',
+                                   'dep_time', 'arr_time', 'price', 'stops'])
+
+
+class TimetableError(Exception):
+    def __init__(self, errors):
+        super().__init__(f"{len(errors)} invalid timetable rows")
+        self.errors = errors
+
+
+class TimetableBusyError(Exception):
+    pass
+
+
+def _weekdays(days):
+    if not days or any(c not in '1234567.- ' for c in days):
+        raise ValueError(f"days must look like '1234567' or '1.3.5..', got {days!r}")
+    return {int(c) for c in days if c.isdigit()}
+
+
+def _stops(value, airport_by_name):
+    stops = []
+    for part in filter(None, (p.strip() for p in (value or '').split('|'))):
+        name, _, minutes = part.rpartition(':')
+        airport = airport_by_name.get(name.strip())
+        if airport is None:
+            raise ValueError(f"unknown stop airport {name.strip()!r}")
+        stops.append((airport.airport_id, int(minutes)))
+    return stops
+
+
+def parse(text):
+    # Kiểm tra toàn bộ file với snapshot sân bay / tuyến / máy bay trong bộ nhớ trước khi ghi bất kỳ dòng nào
+    ref = refdata.get_snapshot()
+    reader = csv.DictReader(io.StringIO(text))
+    missing = [c for c in REQUIRED_COLUMNS if c not in (reader.fieldnames or [])]
+    if missing:
+        raise TimetableError([f"missing columns: {', '.join(missing)}"])
+
+    schedules, errors = [], []
+    for line, row in enumerate(reader, start=2):
+        try:
+            departure = ref.airport_by_name.get(row['departure'].strip())
+            arrival = ref.airport_by_name.get(row['arrival'].strip())
+            if departure is None or arrival is None:
+                raise ValueError("unknown departure or arrival airport")
+            route_ids = ref.routes_between.get((departure.airport_id, arrival.airport_id))
+            if not route_ids:
+                raise ValueError(f"no route from {departure.airport_name} to {arrival.airport_name}")
+            plane_id = int(row['plane_id'])
+            if plane_id not in ref.planes:
+                raise ValueError(f"unknown plane_id {plane_id}")
+            valid_from = datetime.strptime(row['valid_from'].strip(), '%Y-%m-%d').date()
+            valid_to = datetime.strptime(row['valid_to'].strip(), '%Y-%m-%d').date()
+            if valid_to < valid_from:
+                raise ValueError("valid_to is before valid_from")
+            schedules.append(Schedule(
+                line, route_ids[0], plane_id, valid_from, valid_to, _weekdays(row['days'].strip()),
+                datetime.strptime(row['dep_time'].strip(), '%H:%M').time(),
+                datetime.strptime(row['arr_time'].strip(), '%H:%M').time(),
+                float(row['price']), _stops(row.get('stops'), ref.airport_by_name)))
+        except (ValueError, TypeError, AttributeError) as ex:
+            errors.append(f"line {line}: {ex}")
+            if len(errors) >= MAX_ERRORS:
+                break
+    if errors:
+        raise TimetableError(errors)
+    return schedules
+
+
+def expand(schedule):
+    # Các cặp (giờ đi, giờ đến) cụ thể của một dòng lịch
+    day = schedule.valid_from
+    while day <= schedule.valid_to:
+        if day.isoweekday() in schedule.weekdays:
+            dept = datetime.combine(day, schedule.dep_time)
+            arr = datetime.combine(day, schedule.arr_time)
+            if arr <= dept:
+                arr += timedelta(days=1)
+            yield dept, arr
+        day += timedelta(days=1)
+
+
+FLIGHT_TYPES = {0: FlightType.DIRECT, 1: FlightType.ONE_STOP}
+
+
+def _insert(model, rows):
+    for i in range(0, len(rows), INSERT_CHUNK):
+        db.session.execute(insert(model), rows[i:i + INSERT_CHUNK])
+
+
+def _insert_flights(rows):
+    # flight_id do CSDL cấp (auto increment) và được lấy ngay từ câu INSERT theo đúng thứ tự các dòng,
+    # không đọc lại theo khoảng id (lần ghi song song chen id vào giữa). MySQL không có INSERT ... RETURNING
+    # nên ghi từng dòng và lấy id của chính câu lệnh đó (LAST_INSERT_ID theo kết nối)
+    if db.engine.dialect.insert_returning:
+        flight_ids = []
+        for i in range(0, len(rows), INSERT_CHUNK):
+            flight_ids += db.session.execute(
+                insert(Flight).returning(Flight.flight_id, sort_by_parameter_order=True),
+                rows[i:i + INSERT_CHUNK]).scalars().all()
+        return flight_ids
+    table = Flight.__table__
+    return [db.session.execute(insert(table).values(row)).inserted_primary_key[0] for row in rows]
+
+
+def _write_batch(schedules, capacity):
+    flights, planned = [], []
+    for schedule in schedules:
+        flight_type = FLIGHT_TYPES.get(len(schedule.stops), FlightType.MULTIPLE_STOP)
+        for dept, arr in expand(schedule):
+            flights.append({'f_dept_time': dept, 'flight_arr_time': arr,
+                            'flight_duration': round((arr - dept).total_seconds() / 3600, 2),
+                            'flight_price': schedule.price, 'base_price': schedule.price, 'flight_type': flight_type,
+                            'flight_route_id': schedule.route_id, 'plane_id': schedule.plane_id})
+            planned.append(schedule)
+    flight_ids = _insert_flights(flights)
+
+    stops, inventory = [], []
+    for schedule, flight_id in zip(planned, flight_ids):
+        for order, (airport_id, minutes) in enumerate(schedule.stops, start=1):
+            stops.append({'flight_id': flight_id, 'airport_id': airport_id, 'stopover_duration': minutes,
+                          'stop_order': order})
+        # bulk insert bỏ qua event của Flight nên tồn kho ghế được tạo luôn ở đây
+        for seat_class in SeatClass:
+            inventory.append({'flight_id': flight_id, 'seat_class': seat_class, 'booked': 0, 'held': 0,
+                              'capacity': capacity.get((schedule.plane_id, seat_class), 0)})
+    _insert(IntermediateAirport, stops)
+    _insert(SeatInventory, inventory)
+    return len(flights)
+
+
+def _claim(schedules, checksum, filename, force):
+    # Giành quyền nhập file bằng một câu UPDATE có điều kiện (compare-and-set trên dòng TimetableImport) và commit
+    # trước khi ghi chuyến bay: hai tiến trình / hai worker cùng nhập một file thì chỉ một bên được chạy.
+    # force: tiếp tục cả lần nhập đang 'running' khi biết chắc tiến trình trước đã chết
+    job = TimetableImport.query.filter(TimetableImport.checksum == checksum).first()
+    if job is None:
+        job = TimetableImport(filename=filename, checksum=checksum, total_rows=len(schedules), next_row=0,
+                              flights_created=0, seconds=0, status='running')
+        db.session.add(job)
+        try:
+            db.session.commit()
+            return job
+        except IntegrityError:
+            # checksum là unique: bên kia vừa tạo lần nhập này trước
+            db.session.rollback()
+            job = TimetableImport.query.filter(TimetableImport.checksum == checksum).one()
+    if job.status == 'done':
+        return job
+    claimable = TimetableImport.status != 'done' if force else TimetableImport.status.notin_(['running', 'done'])
+    claimed = db.session.execute(update(TimetableImport).where(
+        TimetableImport.checksum == checksum, claimable
+    ).values(status='running')).rowcount
+    db.session.commit()
+    if not claimed:
+        raise TimetableBusyError(f"{job.filename or checksum[:12]} is already being imported")
+    return job
+
+
+def _import(job, schedules, batch_rows=BATCH_ROWS, progress=None):
+    if job.status == 'done':
+        return job
+
+    # Số ghế theo máy bay và hạng ghế cho SeatInventory của các chuyến mới
+    plane_ids = {s.plane_id for s in schedules}
+    capacity = {(plane_id, seat_class): total for plane_id, seat_class, total in db.session.query(
+        Seat.plane_id, Seat.seat_class, func.count(Seat.seat_id)
+    ).filter(Seat.plane_id.in_(plane_ids)).group_by(Seat.plane_id, Seat.seat_class)}
+
+    try:
+        for i in range(job.next_row, len(schedules), batch_rows):
+            started = time.perf_counter()
+            batch = schedules[i:i + batch_rows]
+            # Các chuyến bay của lô và vị trí tiếp tục được ghi trong cùng một transaction
+            job.flights_created += _write_batch(batch, capacity)
+            job.next_row = i + len(batch)
+            job.seconds += time.perf_counter() - started
+            db.session.commit()
+            if progress:
+                progress(job)
+    except Exception:
+        # Các lô đã commit được giữ lại; 'failed' để lần chạy sau giành lại và tiếp tục từ next_row
+        db.session.rollback()
+        db.session.execute(update(TimetableImport).where(TimetableImport.import_id == job.import_id)
+                           .values(status='failed'))
+        db.session.commit()
+        raise
+    finally:
+        dao.invalidate_flight_count()
+        itinerary.invalidate()
+        farecalendar.invalidate()
+
+    job.status = 'done'
+    job.finished_at = datetime.now()
+    db.session.commit()
+    return job
+
+
+def run(text, filename=None, batch_rows=BATCH_ROWS, progress=None, force=False):
+    schedules = parse(text)
+    checksum = hashlib.sha256(text.encode('utf-8')).hexdigest()
+    job = _claim(schedules, checksum, filename, force)
+    return _import(job, schedules, batch_rows=batch_rows, progress=progress)
+
+
+def _run_in_background(import_id, schedules):
+    with app.app_context():
+        job = db.session.get(TimetableImport, import_id)
+        try:
+            _import(job, schedules)
+        except Exception:
+            app.logger.exception("Timetable import %s failed", job.filename)
+
+
+def start(text, filename=None):
+    # Trang admin: kiểm tra file và giành quyền nhập ngay trong request (TimetableError cho người dùng sửa,
+    # TimetableBusyError khi file đang được nhập), còn việc ghi cả mùa lịch bay chạy ở luồng nền. Lần nhập lỗi
+    # thì tải lại file để tiếp tục từ lô chưa ghi; tiến trình chết giữa chừng thì flask import-timetable --force
+    schedules = parse(text)
+    checksum = hashlib.sha256(text.encode('utf-8')).hexdigest()
+    job = _claim(schedules, checksum, filename, force=False)
+    if job.status != 'done':
+        threading.Thread(target=_run_in_background, args=(job.import_id, schedules), daemon=True,
+                         name='timetable-import').start()
+    return job
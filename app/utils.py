@@ -1,7 +1,20 @@
-def cart_stats(cart):
-    total_quantity, total_amount = 0, 0
-    if cart:
-        for c in cart.values():
-            total_quantity += c['quantity']
-            total_amount += c['quantity'] * c['price']
-    return {'total_quantity': total_quantity, 'total_price': total_amount}
\ No newline at end of file
+from contextlib import contextmanager
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+@contextmanager
+def count_queries():
+    # Ghi lại các câu SQL phát ra trong khối with, ví dụ:
+    #   with count_queries() as statements: dao.search_flights(...)
+    #   assert len(statements) <= dao.SEARCH_FLIGHTS_QUERY_BUDGET
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(Engine, 'before_cursor_execute', before_cursor_execute)
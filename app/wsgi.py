@@ -0,0 +1,105 @@
+import gc
+import os
+import signal
+import socket
+import threading
+import time
+import click
+from werkzeug.serving import make_server
+from app import create_app, db
+
+# Điểm vào production: `app.wsgi:app` cho WSGI server bên ngoài, hoặc `python -m app.wsgi` để chạy server prefork có sẵn
+# (tiến trình cha nạp app một lần rồi fork các worker, mỗi worker phục vụ bằng một pool luồng trên cùng socket)
+app = create_app(os.environ.get('APP_ENV', 'production'))
+
+# Worker chết sớm hơn chừng này giây sau khi fork thì chờ trước khi fork lại (tránh vòng fork liên tục khi lỗi cấu hình)
+RESPAWN_DELAY = 1
+
+
+def preload():
+    # Những gì mọi worker đều cần được nạp ở tiến trình cha: các worker dùng chung các trang bộ nhớ này (copy-on-write)
+    if app.config['ADMIN_ENABLED']:
+        from app import admin
+        admin.scaffold_all()
+    # Đưa các object đã có ra khỏi GC để lần thu gom trong worker không ghi vào (và sao chép) các trang dùng chung
+    gc.collect()
+    gc.freeze()
+
+
+def _after_fork():
+    # Kết nối trong pool của tiến trình cha không được dùng chung giữa các tiến trình: bỏ (không đóng) rồi mở mới
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+
+def _work(sock, host, port, threads):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl-C gửi cho cả nhóm tiến trình: tiến trình cha dừng các worker
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    _after_fork()
+    server = make_server(host, port, app, threaded=threads, fd=sock.fileno())
+    # Dừng nhận request mới, request đang chạy dở vẫn được trả lời
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown).start())
+    server.serve_forever()
+    server.server_close()
+
+
+def serve(host='0.0.0.0', port=8000, workers=2, threads=True):
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.create_server((host, port), family=family, backlog=1024)
+    preload()
+    children = {}
+    stopping = []
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                _work(sock, host, port, threads)
+            except BaseException:
+                app.logger.exception("Worker %s crashed", os.getpid())
+                code = 1
+            finally:
+                os._exit(code)
+        children[pid] = time.monotonic()
+
+    def stop(signum, frame):
+        stopping.append(signum)
+        for pid in list(children):
+            os.kill(pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    for _ in range(workers):
+        spawn()
+    app.logger.warning("Serving on %s:%s with %s workers (pid %s)", host, port, workers, os.getpid())
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        started = children.pop(pid, None)
+        if started is None or stopping:
+            continue
+        app.logger.error("Worker %s exited with status %s, restarting", pid, os.waitstatus_to_exitcode(status))
+        if time.monotonic() - started < RESPAWN_DELAY:
+            time.sleep(RESPAWN_DELAY)
+        spawn()
+    sock.close()
+
+
+@click.command()
+@click.option('--host', default=lambda: os.environ.get('HOST', '0.0.0.0'), show_default='0.0.0.0')
+@click.option('--port', type=int, default=lambda: int(os.environ.get('PORT', 8000)), show_default='8000')
+@click.option('--workers', type=click.IntRange(1), default=lambda: int(os.environ.get('WEB_WORKERS', os.cpu_count())),
+              show_default='số CPU', help='Số tiến trình worker.')
+@click.option('--threads/--no-threads', default=True, show_default=True, help='Mỗi worker phục vụ bằng nhiều luồng.')
+def main(host, port, workers, threads):
+    """Chạy server prefork: nạp app một lần rồi fork các worker dùng chung socket."""
+    serve(host, port, workers, threads)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+import os
+import sqlite3
+import tempfile
+from datetime import datetime, timedelta
+
+# Primary và một replica là hai file sqlite; replicate() chép primary sang replica như khi replica đã đồng bộ xong
+DATABASE_DIR = tempfile.mkdtemp(prefix='flight-tests-')
+PRIMARY = os.path.join(DATABASE_DIR, 'primary.db')
+REPLICA = os.path.join(DATABASE_DIR, 'replica.db')
+os.environ['APP_ENV'] = 'testing'
+os.environ['TEST_DATABASE_URL'] = f"sqlite:///{PRIMARY}"
+os.environ['TEST_DATABASE_REPLICA_URLS'] = f"sqlite:///{REPLICA}"
+# Gắn trang admin để kiểm tra quyền truy cập (profile testing mặc định tắt)
+os.environ['FLASK_ADMIN_ENABLED'] = 'true'
+
+import pytest
+from app import create_app, db, refdata, analytics, pricing, identity
+from app.models import Airport, Company, Plane, Seat, SeatClass, FlightRoute, Flight, FlightType, User, UserRole
+
+
+def replicate():
+    db.engines['replica_0'].dispose()
+    source, target = sqlite3.connect(PRIMARY), sqlite3.connect(REPLICA)
+    try:
+        source.backup(target)
+    finally:
+        source.close()
+        target.close()
+
+
+@pytest.fixture
+def app():
+    application = create_app('testing')
+    with application.app_context():
+        db.create_all()
+        replicate()
+        # Snapshot dữ liệu gốc, khối phân tích vé, nhu cầu tuyến là biến của module: không dùng lại của database ở test trước
+        refdata._snapshot = None
+        analytics._cube = None
+        identity._users.clear()
+        pricing._set_route_demand({})
+        pricing._demand_loaded_at = 0
+        yield application
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def flights(app):
+    # 2 sân bay, 1 máy bay 10 ghế (2 business), 3 chuyến bay trong ngày 2030-01-10
+    db.session.add_all([Airport(airport_name='Noi Bai', airport_address='Hanoi', airport_image='x'),
+                        Airport(airport_name='Tan Son Nhat', airport_address='Ho Chi Minh', airport_image='y'),
+                        Company(com_name='VNA', com_country='VN')])
+    db.session.flush()
+    plane = Plane(plane_name='A321', total_seat=10, company_id=1)
+    route = FlightRoute(departure_airport_id=1, arrival_airport_id=2, distance=1, description='HAN-SGN')
+    db.session.add_all([plane, route])
+    db.session.flush()
+    db.session.add_all([Seat(seat_number=i, seat_class=SeatClass.BUSINESS if i <= 2 else SeatClass.ECONOMY,
+                             plane_id=plane.plane_id) for i in range(1, 11)])
+    db.session.commit()
+    result = []
+    for hour in (6, 12, 18):
+        departure = datetime(2030, 1, 10, hour)
+        result.append(Flight(f_dept_time=departure, flight_arr_time=departure + timedelta(hours=2),
+                             flight_duration=2.0, flight_price=100.0, flight_type=FlightType.DIRECT,
+                             flight_route_id=route.fr_id, plane_id=plane.plane_id))
+    db.session.add_all(result)
+    db.session.commit()
+    replicate()
+    return result
+
+
+@pytest.fixture
+def users(app):
+    admin = User(name='Admin', username='admin', password='x', email='admin@example.com', user_role=UserRole.ADMIN)
+    customer = User(name='Customer', username='customer', password='x', email='customer@example.com',
+                    user_role=UserRole.CUSTOMER)
+    db.session.add_all([admin, customer])
+    db.session.commit()
+    replicate()
+    return {'admin': admin, 'customer': customer}
+
+
+def login(client, user):
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user.id)
+        session['_fresh'] = True
+
+
+def call(app, client, method, path, **kwargs):
+    # Mỗi request một app context mới: app context của fixture dùng chung g (người dùng đã nạp, db_wrote) giữa các request.
+    # buffered: đọc hết response stream (file xuất) ngay, không để request context của stream_with_context còn mở
+    with app.app_context():
+        return client.open(path, method=method, buffered=True, **kwargs)
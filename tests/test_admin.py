@@ -0,0 +1,15 @@
+import pytest
+from conftest import login, call
+
+
+@pytest.mark.parametrize('path', ['/admin/statsview/', '/admin/statsview/api/cube?group_by=airline,channel',
+                                  '/admin/flight/export/csv/', '/admin/ticket/export/parquet/'])
+def test_stats_and_exports_are_admin_only(app, users, path):
+    client = app.test_client()
+    assert call(app, client, 'GET', path).status_code == 403
+
+    login(client, users['customer'])
+    assert call(app, client, 'GET', path).status_code == 403
+
+    login(client, users['admin'])
+    assert call(app, client, 'GET', path).status_code == 200
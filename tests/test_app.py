@@ -0,0 +1,12 @@
+import pytest
+from app import create_app
+
+
+def test_create_app_returns_the_configured_app(app):
+    assert create_app() is app
+    assert create_app('testing') is app
+
+
+def test_create_app_rejects_another_profile(app):
+    with pytest.raises(RuntimeError, match="already configured with the 'testing' profile"):
+        create_app('production')
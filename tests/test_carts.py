@@ -0,0 +1,42 @@
+from app import db, holds, pricing
+from app.models import SeatClass, SeatInventory
+from conftest import call
+
+
+def _add(app, client, flight, seat_class, **extra):
+    return call(app, client, 'POST', '/api/carts', json=dict(flight_id=flight.flight_id, type_ticket=seat_class,
+                                                              **extra))
+
+
+def test_cart_price_is_quoted_by_the_server(app, flights):
+    client = app.test_client()
+    flight = flights[0]
+
+    response = _add(app, client, flight, 'ECONOMY', price=1)
+    assert response.status_code == 200
+    db.session.expire_all()
+    economy = holds.unit_price(db.session.get(type(flight), flight.flight_id), SeatClass.ECONOMY)
+    assert economy == pricing.quote(flight) > 1
+    assert response.get_json() == {'total_quantity': 1, 'total_price': economy}
+
+    # Không gửi giá vẫn được; hạng thương gia tính theo holds.PRICE_FACTOR
+    response = _add(app, client, flight, 'BUSINESS')
+    assert response.status_code == 200
+    db.session.expire_all()
+    business = holds.unit_price(db.session.get(type(flight), flight.flight_id), SeatClass.BUSINESS)
+    assert business == 2 * pricing.quote(flight)
+    assert response.get_json()['total_price'] == economy + business
+
+
+def test_cart_holds_seats(app, flights):
+    client = app.test_client()
+    flight = flights[0]
+    for _ in range(2):
+        assert _add(app, client, flight, 'BUSINESS').status_code == 200
+
+    # Máy bay chỉ có 2 ghế business: lần thứ 3 hết chỗ để giữ
+    response = _add(app, client, flight, 'BUSINESS')
+    assert response.status_code == 409
+    inventory = SeatInventory.query.filter_by(flight_id=flight.flight_id, seat_class=SeatClass.BUSINESS).one()
+    db.session.refresh(inventory)
+    assert (inventory.capacity, inventory.booked, inventory.held) == (2, 0, 2)
@@ -0,0 +1,23 @@
+from app import dao, utils, refdata
+
+
+def test_search_flights_within_query_budget(flights):
+    dao.search_flights('Noi Bai', 'Tan Son Nhat', '2030-01-10', 1)  # nạp snapshot refdata
+
+    with utils.count_queries() as statements:
+        result, error = dao.search_flights('Noi Bai', 'Tan Son Nhat', '2030-01-10', 1)
+        # Như booking.html: ghế trống từ tồn kho đã nạp cùng kết quả, máy bay và sân bay từ snapshot
+        ref = refdata.get_snapshot()
+        for flight in result:
+            flight.available_economy_seats(), flight.available_business_seats()
+            ref.planes[flight.plane_id].plane_name, ref.routes[flight.flight_route_id].departure_airport.airport_name
+
+    assert error is None
+    assert [f.flight_id for f in result] == [f.flight_id for f in flights]
+    assert len(statements) <= dao.SEARCH_FLIGHTS_QUERY_BUDGET
+
+
+def test_search_flights_excludes_full_flights(flights):
+    result, _ = dao.search_flights('Noi Bai', 'Tan Son Nhat', '2030-01-10', 9)
+
+    assert result == []
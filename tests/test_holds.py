@@ -0,0 +1,60 @@
+from datetime import datetime, timedelta
+import pytest
+from app import db, holds
+from app.models import SeatClass, SeatHold, SeatInventory
+
+
+def _held(flight, seat_class=SeatClass.BUSINESS):
+    db.session.expire_all()
+    return SeatInventory.query.filter_by(flight_id=flight.flight_id, seat_class=seat_class).one().held
+
+
+def test_hold_is_compare_and_set_on_inventory(app, flights):
+    flight = flights[0]
+    hold = holds.hold_seats(flight.flight_id, SeatClass.BUSINESS, 2)
+    assert _held(flight) == 2
+
+    # Chỉ có 2 ghế business: giữ thêm thất bại và không đổi bộ đếm
+    with pytest.raises(holds.SeatHoldError):
+        holds.hold_seats(flight.flight_id, SeatClass.BUSINESS, 1)
+    assert _held(flight) == 2
+
+    # Giảm số lượng của giữ chỗ cũ trả lại ghế, rồi giữ chỗ khác lấy được ghế đó
+    hold = holds.hold_seats(flight.flight_id, SeatClass.BUSINESS, 1, hold_id=hold.hold_id)
+    other = holds.hold_seats(flight.flight_id, SeatClass.BUSINESS, 1)
+    assert _held(flight) == 2
+
+    holds.release(hold.hold_id)
+    holds.release(other.hold_id)
+    assert _held(flight) == 0
+    assert SeatHold.query.count() == 0
+
+
+def test_expired_holds_are_released(app, flights, users):
+    flight = flights[0]
+    expired = holds.hold_seats(flight.flight_id, SeatClass.ECONOMY, 3)
+    active = holds.hold_seats(flight.flight_id, SeatClass.ECONOMY, 1)
+    expired.expires_at = datetime.now() - timedelta(seconds=1)
+    db.session.commit()
+    expired_id = expired.hold_id
+
+    with pytest.raises(holds.SeatHoldError):
+        holds.convert(expired_id, users['customer'].id, '4111')
+
+    assert holds.release_expired() == 1
+    assert _held(flight, SeatClass.ECONOMY) == 1
+    assert [h.hold_id for h in SeatHold.query] == [active.hold_id]
+
+
+def test_convert_books_held_seats_at_quoted_price(app, flights, users):
+    flight = flights[0]
+    hold = holds.hold_seats(flight.flight_id, SeatClass.BUSINESS, 2)
+    price = holds.unit_price(flight, SeatClass.BUSINESS)
+
+    tickets = holds.convert(hold.hold_id, users['customer'].id, '4111')
+    assert sorted(t.seat_id for t in tickets) == [1, 2]
+    assert all(t.ticket_price == price for t in tickets)
+    db.session.expire_all()
+    inventory = SeatInventory.query.filter_by(flight_id=flight.flight_id, seat_class=SeatClass.BUSINESS).one()
+    assert (inventory.booked, inventory.held) == (2, 0)
+    assert SeatHold.query.count() == 0
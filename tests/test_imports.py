@@ -0,0 +1,26 @@
+import os
+import subprocess
+import sys
+import pytest
+
+# Các thư viện nặng chỉ được nạp khi cần (tính giá, khối phân tích, ảnh đại diện, xuất file), không phải lúc khởi động.
+# Flask-Admin tự import Pillow (flask_admin.form.upload) nên khi bật admin chỉ kiểm tra các thư viện còn lại
+LAZY_MODULES = ['numpy', 'PIL', 'pyarrow', 'cloudinary']
+ADMIN_MODULES = ['PIL']
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _loaded_after_create_app(admin_enabled):
+    # Tiến trình mới: trong tiến trình pytest các test khác đã nạp sẵn những module này
+    code = ("import sys; from app import create_app; create_app(); "
+            f"print(','.join(m for m in {LAZY_MODULES!r} if m in sys.modules))")
+    env = dict(os.environ, APP_ENV='testing', FLASK_ADMIN_ENABLED='true' if admin_enabled else 'false')
+    completed = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, env=env, cwd=ROOT)
+    assert completed.returncode == 0, completed.stderr
+    return [m for m in completed.stdout.strip().split(',') if m]
+
+
+@pytest.mark.parametrize('admin_enabled', [False, True])
+def test_create_app_does_not_import_heavy_modules(admin_enabled):
+    allowed = ADMIN_MODULES if admin_enabled else []
+    assert [m for m in _loaded_after_create_app(admin_enabled) if m not in allowed] == []
@@ -0,0 +1,66 @@
+from datetime import date
+from app import db, dao
+from app.models import Seat, SeatClass, SeatInventory, Ticket, Plane
+
+
+def _inventory(flight):
+    # {hạng ghế: (capacity, booked, held)} đọc lại từ database (bộ đếm được cập nhật bằng câu UPDATE của event)
+    db.session.expire_all()
+    return {i.seat_class: (i.capacity, i.booked, i.held)
+            for i in SeatInventory.query.filter_by(flight_id=flight.flight_id)}
+
+
+def _snapshot():
+    db.session.expire_all()
+    return sorted((i.flight_id, i.seat_class.name, i.capacity, i.booked, i.held) for i in SeatInventory.query)
+
+
+def test_ticket_changes_update_booked_seats(app, flights, users):
+    first, second = flights[0], flights[1]
+    ticket = Ticket(issue_date=date(2030, 1, 1), ticket_price=100, ticket_status=True, ticket_gate=1,
+                    user_id=users['customer'].id, flight_id=first.flight_id, seat_id=1)
+    db.session.add(ticket)
+    db.session.commit()
+    assert _inventory(first)[SeatClass.BUSINESS] == (2, 1, 0)
+
+    # Đổi sang chuyến khác và sang ghế phổ thông
+    ticket.flight_id, ticket.seat_id = second.flight_id, 5
+    db.session.commit()
+    assert _inventory(first)[SeatClass.BUSINESS] == (2, 0, 0)
+    assert _inventory(second) == {SeatClass.BUSINESS: (2, 0, 0), SeatClass.ECONOMY: (8, 1, 0)}
+
+    ticket.ticket_status = False
+    db.session.commit()
+    assert _inventory(second)[SeatClass.ECONOMY] == (8, 0, 0)
+
+
+def test_seat_changes_update_capacity_of_every_flight(app, flights):
+    plane_id = flights[0].plane_id
+    db.session.add_all([Seat(seat_number=n, seat_class=SeatClass.ECONOMY, plane_id=plane_id) for n in (11, 12, 13)])
+    db.session.commit()
+    assert all(_inventory(f) == {SeatClass.BUSINESS: (2, 0, 0), SeatClass.ECONOMY: (11, 0, 0)} for f in flights)
+
+    seat = Seat.query.filter_by(seat_number=11).one()
+    seat.seat_class = SeatClass.BUSINESS
+    db.session.commit()
+    assert _inventory(flights[2]) == {SeatClass.BUSINESS: (3, 0, 0), SeatClass.ECONOMY: (10, 0, 0)}
+
+    # Chuyển ghế (đã hết hạn sau commit) sang máy bay khác: máy bay cũ cũng được tính lại
+    other = Plane(plane_name='A320', total_seat=1, company_id=1)
+    db.session.add(other)
+    db.session.commit()
+    flights[1].plane_id = other.plane_id
+    db.session.commit()
+    seat.plane_id = other.plane_id
+    db.session.commit()
+    assert _inventory(flights[0])[SeatClass.BUSINESS] == (2, 0, 0)
+    assert _inventory(flights[1]) == {SeatClass.BUSINESS: (1, 0, 0), SeatClass.ECONOMY: (0, 0, 0)}
+
+    db.session.delete(Seat.query.filter_by(seat_number=12).one())
+    db.session.commit()
+    assert _inventory(flights[0])[SeatClass.ECONOMY] == (9, 0, 0)
+
+    # Bộ đếm tăng dần khớp với dựng lại từ đầu
+    counters = _snapshot()
+    dao.rebuild_seat_inventory()
+    assert _snapshot() == counters
@@ -0,0 +1,39 @@
+from datetime import date, datetime
+import pytest
+from app import db, pricing
+from app.models import RouteDemand, Ticket
+from conftest import replicate
+
+NOW = datetime(2030, 1, 5)
+
+
+def test_reprice_persists_route_demand_used_by_quote(app, flights, users):
+    db.session.add(Ticket(issue_date=date(2030, 1, 1), ticket_price=100, ticket_status=True, ticket_gate=1,
+                          user_id=users['customer'].id, flight_id=flights[0].flight_id, seat_id=3))
+    db.session.commit()
+
+    stats = pricing.reprice(NOW)
+    assert (stats['flights'], stats['changed']) == (3, 3)
+    demand = RouteDemand.query.one()
+    assert demand.fr_id == flights[0].flight_route_id
+    assert demand.load_factor == pytest.approx(1 / 30)
+
+    # Worker khác (chưa có nhu cầu tuyến trong bộ nhớ) chỉ đọc RouteDemand và ra cùng giá với reprice
+    replicate()
+    pricing._set_route_demand({})
+    pricing._demand_loaded_at = 0
+    db.session.expire_all()
+    for flight in flights:
+        assert flight.base_price == 100
+        assert pricing.quote(flight, NOW) == pytest.approx(flight.flight_price)
+    assert pricing.route_demand(flights[0].flight_route_id) == pytest.approx(1 / 30)
+    # Chuyến có vé lấp đầy cao hơn nên đắt hơn
+    assert flights[0].flight_price > flights[1].flight_price
+
+    # Chạy lại với cùng dữ liệu: không đổi giá chuyến nào
+    assert pricing.reprice(NOW)['changed'] == 0
+
+
+def test_quote_keeps_price_of_departed_flight(app, flights):
+    flight = flights[0]
+    assert pricing.quote(flight, datetime(2030, 1, 11)) == flight.flight_price
@@ -0,0 +1,69 @@
+import time
+from flask import session
+from app import db, routing
+from app.models import Airport
+from conftest import replicate
+
+
+@routing.replica
+def _airport_names():
+    return [airport.airport_name for airport in Airport.query.order_by(Airport.airport_id)]
+
+
+def _rows(bind_key):
+    with db.engines[bind_key].connect() as conn:
+        return [row[0] for row in conn.exec_driver_sql('SELECT airport_name FROM airport ORDER BY airport_id')]
+
+
+def _add_airport(name):
+    db.session.add(Airport(airport_name=name, airport_address='-', airport_image='-'))
+
+
+def test_replica_reads_go_to_replica(app):
+    _add_airport('Noi Bai')
+    db.session.commit()
+    replicate()
+    _add_airport('Da Nang')  # chưa đồng bộ sang replica
+    db.session.commit()
+    routing.reset()
+
+    assert _airport_names() == ['Noi Bai']
+    assert routing.routed() == {'replica_0': 1}
+    assert [a.airport_name for a in Airport.query.order_by(Airport.airport_id)] == ['Noi Bai', 'Da Nang']
+
+
+def test_writes_go_to_primary(app):
+    with routing.use_replica():
+        _add_airport('Noi Bai')
+        db.session.commit()
+
+    assert _rows(None) == ['Noi Bai']
+    assert _rows('replica_0') == []
+
+
+# Mỗi request thật có app context (và g) riêng: không dùng chung app context của fixture
+def test_reads_after_commit_go_to_primary(app):
+    with app.app_context(), app.test_request_context():
+        _add_airport('Noi Bai')
+        db.session.commit()
+        primary_until = session['primary_until']
+
+        assert _airport_names() == ['Noi Bai']
+        assert primary_until > time.time()
+        db.session.remove()
+
+    # Request sau của cùng người dùng trong READ_YOUR_WRITES_SECONDS vẫn đọc primary; hết hạn thì về replica
+    with app.app_context(), app.test_request_context():
+        session['primary_until'] = primary_until
+        assert _airport_names() == ['Noi Bai']
+        session['primary_until'] = time.time() - 1
+        assert _airport_names() == []
+
+
+def test_reads_after_uncommitted_flush_go_to_primary(app):
+    with app.app_context(), app.test_request_context():
+        _add_airport('Noi Bai')
+        db.session.flush()
+
+        assert _airport_names() == ['Noi Bai']
+        db.session.rollback()
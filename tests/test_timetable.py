@@ -0,0 +1,80 @@
+import pytest
+from app import db, timetable
+from app.models import Airport, Flight, FlightType, IntermediateAirport, SeatInventory, SeatClass, TimetableImport
+from conftest import replicate
+
+HEADER = 'departure,arrival,plane_id,valid_from,valid_to,days,dep_time,arr_time,price,stops\n'
+# 2030-02-04 là thứ 2: 2 tuần x (thứ 2, 4, 6) = 6 chuyến một điểm dừng, 14 ngày = 14 chuyến bay thẳng
+TEXT = HEADER + 'Noi Bai,Tan Son Nhat,1,2030-02-04,2030-02-17,1.3.5..,08:00,10:30,120,Da Nang:45\n' \
+                'Noi Bai,Tan Son Nhat,1,2030-02-04,2030-02-17,1234567,22:00,00:10,90,\n'
+
+
+@pytest.fixture
+def da_nang(flights):
+    db.session.add(Airport(airport_name='Da Nang', airport_address='Da Nang', airport_image='z'))
+    db.session.commit()
+    replicate()
+
+
+def _imported():
+    return Flight.query.filter(Flight.f_dept_time >= '2030-02-01').all()
+
+
+def test_import_creates_stops_and_inventory_once(app, da_nang):
+    job = timetable.run(TEXT, filename='season.csv', batch_rows=1)
+    assert (job.status, job.next_row, job.flights_created) == ('done', 2, 20)
+
+    flights = _imported()
+    one_stop = [f for f in flights if f.flight_type == FlightType.ONE_STOP]
+    assert len(flights) == 20 and len(one_stop) == 6
+    assert {s.flight_id for s in IntermediateAirport.query} == {f.flight_id for f in one_stop}
+    overnight = next(f for f in flights if f.flight_type == FlightType.DIRECT)
+    assert overnight.flight_arr_time.date() > overnight.f_dept_time.date()
+    for flight in flights:
+        assert {i.seat_class: i.capacity for i in SeatInventory.query.filter_by(flight_id=flight.flight_id)} == \
+               {SeatClass.BUSINESS: 2, SeatClass.ECONOMY: 8}
+
+    # Cùng file (cùng checksum): không tạo thêm chuyến bay nào
+    assert timetable.run(TEXT, filename='season.csv').import_id == job.import_id
+    assert len(_imported()) == 20
+    assert IntermediateAirport.query.count() == 6
+
+
+def _stop_after_first_batch(error):
+    def progress(job):
+        raise error
+    return progress
+
+
+def test_failed_import_resumes_from_next_row(app, da_nang):
+    with pytest.raises(RuntimeError):
+        timetable.run(TEXT, filename='season.csv', batch_rows=1, progress=_stop_after_first_batch(RuntimeError()))
+    job = TimetableImport.query.one()
+    assert (job.status, job.next_row, job.flights_created) == ('failed', 1, 6)
+
+    job = timetable.run(TEXT, filename='season.csv', batch_rows=1)
+    assert (job.status, job.flights_created) == ('done', 20)
+    assert len(_imported()) == 20
+
+
+def test_running_import_is_not_claimed_twice(app, da_nang):
+    # Tiến trình bị dừng giữa chừng (không qua except Exception): lần nhập vẫn ở trạng thái 'running'
+    with pytest.raises(KeyboardInterrupt):
+        timetable.run(TEXT, filename='season.csv', batch_rows=1,
+                      progress=_stop_after_first_batch(KeyboardInterrupt()))
+    with pytest.raises(timetable.TimetableBusyError):
+        timetable.run(TEXT, filename='season.csv')
+    assert len(_imported()) == 6
+
+    # --force: tiếp tục từ dòng chưa ghi, không nhập lại lô đã commit
+    job = timetable.run(TEXT, filename='season.csv', force=True)
+    assert (job.status, job.flights_created) == ('done', 20)
+    assert len(_imported()) == 20
+    assert TimetableImport.query.count() == 1
+
+
+def test_invalid_rows_are_reported_before_writing(app, da_nang):
+    with pytest.raises(timetable.TimetableError) as ex:
+        timetable.run(HEADER + 'Noi Bai,Nowhere,1,2030-02-04,2030-02-17,1234567,08:00,10:00,100,\n')
+    assert ex.value.errors == ['line 2: unknown departure or arrival airport']
+    assert TimetableImport.query.count() == 0